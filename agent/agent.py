@@ -1,116 +1,151 @@
 
-from openai import AsyncOpenAI
+from agent.caching import cached_answer, cached_search, store_answer
 from agent.config import settings
+from agent.custom_types import StreamChunk
+from agent.brave import summarize  # registers the brave_summarize tool
+from agent.knowledge import past_research  # registers the past_research tool
+from agent.prompts import build_messages, tool_schemas
+from agent.scheduler import upstream_slot
+from agent.stages import stage_config
+from agent.tools.registry import registry
+from agent.utils.accounting import record_cache_hit, record_llm_usage
+from agent.utils.dedup import NearDuplicateIndex, collapsed_total
+from agent.utils.http import get_openai_client
+from agent.utils.telemetry import record_stage, span
 import json
 import asyncio
 import httpx
-from datetime import datetime
-CURRENT_YEAR=datetime.now().year
-CURRENT_DATE=datetime.now().strftime("%B %d,%Y")
-
-SYSTEM_PROMPT = f"""
-You are KNOWDEX,the most accurate and up-to-date AI research assistant in Africa.
-Today's date ia {CURRENT_DATE} ({CURRENT_YEAR})
-STRICT RULES-OBEY EVERY SINGLE ONE:
-1. Never output HTML tags like <strong>,<b>,<em>,<br>,<p> - Use plain text only.
-   Use **bold**  or **italic** with markdown if needed.
-
-2. TIME AWARENESS (THIS IS CRITICAL):
-     - If user says "current","now","today","latest","this year","{CURRENT_YEAR}","recent news","population nw";
-     ONLY use information from January 1,{CURRENT_YEAR} to today.
-     - If user says "recent" or "in the last few years" - use data from {CURRENT_YEAR -5} to {CURRENT_YEAR}.
-     - For historical questions (e.g,"technologies in Africa since 2000")->go back as far as needed.
-     - Never cite 2023 or 2024 data when user wants current/{CURRENT_YEAR } info.
-     - Specific month mentioned ("November","January 2024","october this year")->Only news/events from that exact month/year,
-       if no year given -> assume {CURRENT_YEAR}.
-
-3.  Always use brave_search tool FIRST for:
-      .News,Population,Prices,Elections,Funding,Startup,Tech,Policy,Sports,Weather,ETC.
-      . Any question that changes over time
-
-4.  Every factual claim must end with [1],[2],[3] etc.
-
-5.  At the end,list all sources with full title and URL.
-
-6.  Be concise,professional,and extremly accurate.
-
-7.  Always call brave_search first for anything that changes over time(news,population,prices,startups,artists,elections,etc)
-
-8.   Always make sure you complete user question,for example when user asks about USA presidential election and you search the web using brave_search make sure you search the start of the election to the finish of the election.
-
-9.    Always make sure you start the beginning of a user prompt and make sure you search the whole web to get a result
-
-11.  There are informations all over the web,do not say you could not see anything...thye least you can say is maybe they are keeping the information private ,but there would always be rumours
-
-
-10.  You are running in {CURRENT_YEAR} -> act like it. Treat today is {CURRENT_DATE}
-
-DO NOT HALLUCINATE.SEARCH FIRST.BE CURRENT.
-
-
-
-"""
+import time
+from typing import List, Optional
 
 
 class CitationManager:
     def __init__(self): 
         self.citations = []
+        self.sources = []
+        self.urls = set()
         self.n = 1
     
     def add(self, title, url): 
+        # The same page found by two searches is one source
+        if url and url in self.urls:
+            return
+        self.urls.add(url)
         self.citations.append(f"[{self.n}] {title}\n{url}")
+        self.sources.append({"title": title, "url": url})
         self.n += 1
     
     def format(self):
         return "\n\nSources:\n" + "\n".join(self.citations) if self.citations else ""
 
-async def run_research(question: str):
-    """Main research function with proper error handling"""
+
+def format_search_results(results, citations, seen=None, limit=3):
+    """
+    Prompt text for the top `limit` distinct stories of one search.
+    With `seen` (a NearDuplicateIndex over the whole run), copies of a story,
+    such as a wire story syndicated by several outlets or a story an earlier
+    search already returned, are folded into one passage, and lower-ranked
+    results fill the freed places. Copies are listed under their passage and
+    cited; results that do not make it into the prompt are not.
+    """
+    passages = {}
+    earlier = []
+    for rank, item in enumerate(results):
+        signature = seen.signature(f"{item.get('title', '')} {item.get('description', '')}") if seen else None
+        group = seen.find(signature) if seen else None
+        if group is None:
+            if len(passages) < limit:
+                passages[seen.add(signature) if seen else rank] = [item]
+        elif group in passages:
+            passages[group].append(item)
+        else:
+            earlier.append(item)
+
+    result_text = ""
+    for idx, items in enumerate(passages.values(), 1):
+        first = items[0]
+        title = first.get("title", "No title")
+        url = first.get("url", "")
+        snippet = first.get("description", "")
+        
+        citations.add(title, url)
+        result_text += f"{idx}. {title}\n{snippet}\n{url}\n"
+        if len(items) > 1:
+            for item in items[1:]:
+                citations.add(item.get("title", "No title"), item.get("url", ""))
+            result_text += "Same story also reported by: " + "; ".join(
+                f"{item.get('title', 'No title')} {item.get('url', '')}" for item in items[1:]
+            ) + "\n"
+        result_text += "\n"
+    if earlier:
+        for item in earlier:
+            citations.add(item.get("title", "No title"), item.get("url", ""))
+        result_text += "Also reporting stories from the earlier searches: " + "; ".join(
+            f"{item.get('title', 'No title')} {item.get('url', '')}" for item in earlier
+        ) + "\n"
+
+    collapsed = sum(len(items) - 1 for items in passages.values()) + len(earlier)
+    if collapsed:
+        collapsed_total.inc(collapsed, kind="search")
+    return result_text
+
+async def run_research(question: str, history: Optional[List[dict]] = None):
+    """
+    Main research function with proper error handling.
+    Yields StreamChunk strings: progress lines, the answer, then the sources block.
+    `history` holds earlier turns of the conversation in OpenAI message format
+    (see ConversationMemory.get_openai_format), placed before the question.
+    """
     citations = CitationManager()
+    # Set once a tool answered from this user's own data (past_research): such an answer is not cached for everyone
+    used_private_data = False
+    # Stories already given to the model in this run, so a later search does not repeat them
+    seen = NearDuplicateIndex() if settings.DEDUP_ENABLED else None
     
-    yield "KNOWDEX is waking up...\n\n"
-    yield f"Question: {question}\n\n"
-    yield "Thinking...\n\n"
+    yield StreamChunk("KNOWDEX is waking up...\n\n")
+    yield StreamChunk(f"Question: {question}\n\n")
+    yield StreamChunk("Thinking...\n\n")
     
-    client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+    # The same first question asked recently (ANSWER_CACHE_TTL) is answered from the cache
+    cached = None if history else cached_answer(question)
+    if cached:
+        record_cache_hit()
+        for source in cached["sources"]:
+            citations.add(source["title"], source["url"])
+        yield StreamChunk("Answering from a recent identical question...\n\n")
+        yield StreamChunk(cached["answer"], kind="answer")
+        yield StreamChunk(citations.format(), kind="sources", sources=citations.sources)
+        yield StreamChunk("\n\n KNOWDEX has finished\n")
+        return
     
-    messages = [
-        {"role": "system", "content": SYSTEM_PROMPT},
-        {"role": "user", "content": question}
-    ]
+    client = get_openai_client()
     
-    tools = [
-        {
-            "type": "function",
-            "function": {
-                "name": "brave_search",
-                "description": "Search the internet for current information",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "query": {"type": "string", "description": "Search query"}
-                    },
-                    "required": ["query"]
-                }
-            }
-        }
-    ]
+    # Static rules and tools first, then the date, history and question: see agent/prompts.py
+    messages = build_messages(question, history)
+    # Registry tools enabled in settings (past_research, ...), run through BaseTool.run_with_sources
+    extra_tools = {name: tool for name, tool in registry.get_tools().items() if name in settings.AGENT_TOOLS}
+    tools = tool_schemas(extra_tools.values())
     
     try:
         
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            tools=tools,
-            tool_choice="auto",
-            temperature=0
-        )
+        # Model and token limit per stage and mode (agent/stages.py)
+        decision = stage_config("decision")
+        # A fair-share slot first (agent/scheduler.py), so the span times the upstream call only
+        async with upstream_slot("openai"):
+            with span("llm.tool_decision", upstream="openai", model=decision.model):
+                response = await client.chat.completions.create(
+                    messages=messages,
+                    tools=tools,
+                    tool_choice="auto",
+                    **decision.request_args()
+                )
+        record_llm_usage(response.model or decision.model, response.usage, stage="decision")
         
         message = response.choices[0].message
         
         
         if message.tool_calls:
-            yield "Searching the web...\n\n"
+            yield StreamChunk("Searching the web...\n\n")
             
             tool_results = []
             
@@ -120,97 +155,84 @@ async def run_research(question: str):
                         args = json.loads(tool_call.function.arguments)
                         query = args.get("query", "")
                         
-                        yield f"Searching for: {query}\n"
+                        yield StreamChunk(f"Searching for: {query}\n")
                         
                         
-                        async with httpx.AsyncClient() as http_client:
-                            try:
-                                r = await http_client.get(
-                                    "https://api.search.brave.com/res/v1/web/search",
-                                    headers={
-                                        "X-Subscription-Token": settings.BRAVE_API_KEY,
-                                        "Accept": "application/json"
-                                    },
-                                    params={"q": query, "count": 5},
-                                    timeout=30.0
-                                )
-                                
-                                
-                                if r.status_code != 200:
-                                    yield f" Search API returned status {r.status_code}\n"
-                                    tool_results.append({
-                                        "tool_call_id": tool_call.id,
-                                        "output": f"Search failed with status {r.status_code}"
-                                    })
-                                    continue
-                                
-                                
-                                if not r.text or r.text.strip() == "":
-                                    yield " Search returned empty response\n"
-                                    tool_results.append({
-                                        "tool_call_id": tool_call.id,
-                                        "output": "No results found"
-                                    })
-                                    continue
-                                
-                                
-                                data = r.json()
-                                
+                        try:
+                            results, from_cache = await cached_search(query, count=5)
+                            if from_cache:
+                                yield StreamChunk("(recent results from cache)\n")
                             
-                                results = data.get("web", {}).get("results", [])
-                                
-                                if not results:
-                                    yield "No results found.\n"
-                                    tool_results.append({
-                                        "tool_call_id": tool_call.id,
-                                        "output": "No results found"
-                                    })
-                                    continue
-                                
-                                
-                                result_text = ""
-                                for idx, item in enumerate(results[:3], 1):
-                                    title = item.get("title", "No title")
-                                    url = item.get("url", "")
-                                    snippet = item.get("description", "")
-                                    
-                                    citations.add(title, url)
-                                    result_text += f"{idx}. {title}\n{snippet}\n{url}\n\n"
-                                
-                                yield result_text
-                                
+                            if not results:
+                                yield StreamChunk("No results found.\n")
                                 tool_results.append({
                                     "tool_call_id": tool_call.id,
-                                    "output": result_text
-                                })
-                                
-                            except httpx.TimeoutException:
-                                yield f" Search timed out\n"
-                                tool_results.append({
-                                    "tool_call_id": tool_call.id,
-                                    "output": "Search timed out"
+                                    "output": "No results found"
                                 })
+                                continue
                             
-                            except json.JSONDecodeError as e:
-                                yield f" Invalid response from search API\n"
-                                tool_results.append({
-                                    "tool_call_id": tool_call.id,
-                                    "output": "Invalid API response"
-                                })
                             
-                            except httpx.HTTPError as e:
-                                yield f" Network error: {str(e)}\n"
-                                tool_results.append({
-                                    "tool_call_id": tool_call.id,
-                                    "output": f"Network error: {str(e)}"
-                                })
+                            result_text = format_search_results(results, citations, seen)
+                            
+                            yield StreamChunk(result_text)
+                            
+                            tool_results.append({
+                                "tool_call_id": tool_call.id,
+                                "output": result_text
+                            })
+                        
+                        except httpx.HTTPStatusError as e:
+                            yield StreamChunk(f" Search API returned status {e.response.status_code}\n")
+                            tool_results.append({
+                                "tool_call_id": tool_call.id,
+                                "output": f"Search failed with status {e.response.status_code}"
+                            })
+                        
+                        except httpx.TimeoutException:
+                            yield StreamChunk(" Search timed out\n")
+                            tool_results.append({
+                                "tool_call_id": tool_call.id,
+                                "output": "Search timed out"
+                            })
+                        
+                        except json.JSONDecodeError as e:
+                            yield StreamChunk(" Invalid response from search API\n")
+                            tool_results.append({
+                                "tool_call_id": tool_call.id,
+                                "output": "Invalid API response"
+                            })
+                        
+                        except httpx.HTTPError as e:
+                            yield StreamChunk(f" Network error: {str(e)}\n")
+                            tool_results.append({
+                                "tool_call_id": tool_call.id,
+                                "output": f"Network error: {str(e)}"
+                            })
                     
                     except Exception as e:
-                        yield f"Error processing search: {str(e)}\n"
+                        yield StreamChunk(f"Error processing search: {str(e)}\n")
                         tool_results.append({
                             "tool_call_id": tool_call.id,
                             "output": f"Error: {str(e)}"
                         })
+                
+                elif tool_call.function.name in extra_tools:
+                    tool = extra_tools[tool_call.function.name]
+                    try:
+                        args = json.loads(tool_call.function.arguments or "{}")
+                        target = args.get("query") or ", ".join(args.get("urls") or [])
+                        yield StreamChunk(f"Using {tool.name}: {target}\n")
+                        used_private_data = used_private_data or tool.user_scoped
+                        output, tool_sources = await tool.run_with_sources(**args)
+                        for source in tool_sources:
+                            citations.add(source["title"], source["url"])
+                    except Exception as e:
+                        output = f"Error: {str(e)}"
+                        yield StreamChunk(f"Error running {tool.name}: {str(e)}\n")
+                    tool_results.append({
+                        "tool_call_id": tool_call.id,
+                        "output": output
+                    })
             
             
             messages.append({
@@ -237,22 +259,61 @@ async def run_research(question: str):
                 })
         
         
-        yield "\n\nGenerating answer...\n\n"
+        yield StreamChunk("\n\nGenerating answer...\n\n")
+        final = stage_config("answer")
         
-        final_response = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            temperature=0
-        )
-        
-        answer = final_response.choices[0].message.content
-        yield answer
-        yield citations.format()
-        yield "\n\n KNOWDEX has finished\n"
+        if settings.STREAMING:
+            # Token by token; the usage block arrives in the last event
+            started = time.perf_counter()
+            first_token = True
+            answer_parts = []
+            # The slot covers the request up to the response headers, not the tokens read at the client's pace
+            async with upstream_slot("openai"):
+                # Same tools as the decision call, so its whole prompt is a cacheable prefix of this one
+                stream = await client.chat.completions.create(
+                    messages=messages,
+                    tools=tools,
+                    tool_choice="none",
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **final.request_args()
+                )
+            try:
+                async for event in stream:
+                    if event.usage:
+                        record_llm_usage(event.model or final.model, event.usage, stage="answer")
+                    if event.choices and event.choices[0].delta.content:
+                        if first_token:
+                            record_stage("llm.first_token", time.perf_counter() - started, upstream="openai", model=final.model)
+                            first_token = False
+                        answer_parts.append(event.choices[0].delta.content)
+                        yield StreamChunk(event.choices[0].delta.content, kind="answer")
+            finally:
+                # Also when the client went away mid-answer: frees the upstream connection
+                await stream.close()
+            record_stage("llm.final_answer", time.perf_counter() - started, upstream="openai", model=final.model)
+            answer = "".join(answer_parts)
+        else:
+            async with upstream_slot("openai"):
+                with span("llm.final_answer", upstream="openai", model=final.model):
+                    final_response = await client.chat.completions.create(
+                        messages=messages,
+                        tools=tools,
+                        tool_choice="none",
+                        **final.request_args()
+                    )
+            record_llm_usage(final_response.model or final.model, final_response.usage, stage="answer")
+            
+            answer = final_response.choices[0].message.content or ""
+            yield StreamChunk(answer, kind="answer")
+        if not history and not used_private_data:
+            store_answer(question, answer, citations.sources)
+        yield StreamChunk(citations.format(), kind="sources", sources=citations.sources)
+        yield StreamChunk("\n\n KNOWDEX has finished\n")
         
     except Exception as e:
-        yield f"\n\n Fatal Error: {str(e)}\n"
-        yield "Please check your API keys and try again.\n"
+        yield StreamChunk(f"\n\n Fatal Error: {str(e)}\n", kind="error")
+        yield StreamChunk("Please check your API keys and try again.\n", kind="error")
 
 
         
\ No newline at end of file
@@ -0,0 +1,145 @@
+"""
+Batch research: many questions through run_research with bounded concurrency.
+
+Questions that normalize to the same text are researched once and reported
+for every position they were asked at. Searches are shared through
+agent/caching.py: identical searches running at the same time make one
+upstream call, and later ones hit the search cache. Results come back in
+completion order, followed by a summary of timings and reuse.
+"""
+import asyncio
+import time
+from typing import AsyncIterator,Dict,List,Optional,Union
+from pydantic import BaseModel
+from agent.agent import run_research
+from agent.caching import normalize_query
+from agent.config import settings
+from agent.utils.accounting import RequestUsage,track_usage
+from agent.utils.telemetry import collect_stages,log_event
+from backend.usage import percentile
+
+
+class BatchResult(BaseModel):
+    index:int
+    question:str
+    answer:str=""
+    sources:List[Dict[str,str]]=[]
+    error:Optional[str]=None
+    duration_ms:float=0.0
+    #Milliseconds per stage ("llm.tool_decision:openai", "search:brave", ...)
+    timings:Dict[str,float]={}
+    #Index of the question this one repeats; it shares that question's research
+    duplicate_of:Optional[int]=None
+    usage:Optional[RequestUsage]=None
+
+
+class BatchSummary(BaseModel):
+    questions:int
+    unique_questions:int
+    succeeded:int
+    failed:int
+    concurrency:int
+    wall_ms:float
+    latency_p50_ms:float
+    latency_p95_ms:float
+    latency_max_ms:float
+    llm_calls:int
+    search_calls:int
+    upstream_searches:int
+    reused_searches:int
+    search_reuse_ratio:float
+    cache_hits:int
+    cost_usd:float
+
+
+async def research_one(index:int,question:str,mode:str="batch")->BatchResult:
+    """One question with its own usage accounting (this runs in its own task, so its own context)"""
+    usage=track_usage(mode)
+    timings=collect_stages()
+    result=BatchResult(index=index,question=question,usage=usage)
+    try:
+        async with asyncio.timeout(settings.BATCH_QUESTION_TIMEOUT):
+            async for chunk in run_research(question):
+                if chunk.kind=="answer":
+                    result.answer+=chunk
+                elif chunk.kind=="sources":
+                    result.sources.extend(chunk.sources)
+                elif chunk.kind=="error" and result.error is None:
+                    result.error=chunk.strip()
+    except TimeoutError:
+        result.error=f"Timed out after {settings.BATCH_QUESTION_TIMEOUT:.0f}s"
+    usage.finish()
+    result.duration_ms=round(usage.duration_ms,1)
+    result.timings=dict(timings)
+    result.answer=result.answer.strip()
+    return result
+
+
+def summarize(results:List[BatchResult],unique:int,concurrency:int,wall_seconds:float)->BatchSummary:
+    researched=[r for r in results if r.duplicate_of is None]
+    usages=[r.usage for r in researched if r.usage]
+    latencies=sorted(r.duration_ms for r in researched)
+    searches=sum(u.search_calls for u in usages)
+    reused=sum(u.cached_searches for u in usages)
+    return BatchSummary(
+        questions=len(results),
+        unique_questions=unique,
+        succeeded=sum(1 for r in results if not r.error),
+        failed=sum(1 for r in results if r.error),
+        concurrency=concurrency,
+        wall_ms=round(wall_seconds*1000,1),
+        latency_p50_ms=percentile(latencies,50),
+        latency_p95_ms=percentile(latencies,95),
+        latency_max_ms=latencies[-1] if latencies else 0.0,
+        llm_calls=sum(u.llm_calls for u in usages),
+        search_calls=searches,
+        upstream_searches=searches-reused,
+        reused_searches=reused,
+        search_reuse_ratio=round(reused/searches,3) if searches else 0.0,
+        cache_hits=sum(u.cache_hits for u in usages),
+        cost_usd=round(sum(u.cost_usd for u in usages),6),
+    )
+
+
+async def run_batch(
+    questions:List[str],
+    concurrency:Optional[int]=None,
+    mode:str="batch"
+)->AsyncIterator[Union[BatchResult,BatchSummary]]:
+    """Yield a BatchResult per question as it finishes, then one BatchSummary"""
+    concurrency=max(1,min(concurrency or settings.BATCH_CONCURRENCY,settings.BATCH_MAX_CONCURRENCY))
+    started=time.perf_counter()
+    positions:Dict[str,List[int]]={}
+    for index,question in enumerate(questions):
+        positions.setdefault(normalize_query(question),[]).append(index)
+
+    semaphore=asyncio.Semaphore(concurrency)
+    finished:asyncio.Queue=asyncio.Queue()
+
+    async def worker(indexes:List[int]):
+        async with semaphore:
+            try:
+                result=await research_one(indexes[0],questions[indexes[0]],mode)
+            except Exception as e:
+                result=BatchResult(index=indexes[0],question=questions[indexes[0]],error=str(e))
+        await finished.put((indexes,result))
+
+    tasks=[asyncio.create_task(worker(indexes)) for indexes in positions.values()]
+    results:List[BatchResult]=[]
+    try:
+        for _ in range(len(tasks)):
+            indexes,result=await finished.get()
+            results.append(result)
+            yield result
+            for index in indexes[1:]:
+                duplicate=result.model_copy(update={"index":index,"question":questions[index],"duplicate_of":indexes[0],"usage":None})
+                results.append(duplicate)
+                yield duplicate
+    finally:
+        #The client went away or the batch failed: stop the research still running
+        for task in tasks:
+            task.cancel()
+
+    summary=summarize(results,len(positions),concurrency,time.perf_counter()-started)
+    log_event("batch_finished",**summary.model_dump())
+    yield summary
@@ -1,7 +1,10 @@
 from  agent.tools.base import BaseTool
 from agent.tools.registry import registry
 from agent.config import settings
-import httpx
+from agent.utils.http import http_session
+from agent.utils.jsoncodec import loads
+from agent.utils.accounting import record_search
+from agent.utils.telemetry import span
 
 @registry.register
 class  BraveSearchTool(BaseTool):
@@ -14,14 +17,15 @@ class  BraveSearchTool(BaseTool):
     }
 
     async def run(self,query:str)->str:
-        url="https://api.search.brave.come/v1/search"
+        url=f"{settings.BRAVE_BASE_URL}/res/v1/web/search"
         headers={"X-Subscription-Token":settings.BRAVE_API_KEY}
         params={"q":query,"count":10}
 
-        async with httpx.AsyncClient() as client:
+        async with http_session() as client,span("search",upstream="brave"):
             response=await client.get(url,headers=headers,params=params,timeout=20)
             response.raise_for_status()
-            data=response.json()
+            data=loads(response.content)
+        record_search()
 
         results=[]
         for item in data.get("web",{}).get("results",[])[:10]:
@@ -1,27 +1,279 @@
-from agent.tools.base  import BaseTool
-from agent.tools.registry import registry
+"""
+Page summaries as a tool: the model passes page URLs (from the question,
+earlier answers or search results) or a search query, and gets a few dense
+sentences per page instead of the raw page.
+
+Brave's Summarizer API summarizes a search (it takes a key from a web
+search), not a URL, so pages are summarized here. Each page is fetched
+(capped at SUMMARY_MAX_PAGE_BYTES), its main text extracted with
+readability and the SUMMARY_SENTENCES sentences that best cover the page's
+frequent terms kept, in page order. Pages of one call are fetched
+concurrently. Summaries are cached per canonical URL for SUMMARY_CACHE_TTL
+(agent/caching.py), and syndicated copies of one story are shown once.
+"""
+import asyncio
+import ipaddress
+import re
+import socket
+from collections import Counter
+from typing import Dict,List,Optional,Tuple,Union
+from urllib.parse import urlsplit
+from agent.caching import cached_search,cached_summary,canonical_url
 from agent.config import settings
-import httpx
+from agent.knowledge.index import tokenize
+from agent.tools.base import BaseTool
+from agent.tools.registry import registry
+from agent.utils.accounting import record_cache_hit
+from agent.utils.dedup import collapsed_total,group_near_duplicates
+from agent.utils.http import http_session
+from agent.utils.telemetry import span
+
+_SENTENCE_RE=re.compile(r"(?<=[.!?])[\"')\]]?\s+(?=[\"'(\[]?[A-Z0-9])")
+_SPACE_RE=re.compile(r"[ \t\r\f\v]+")
+_LEAD_SENTENCES=3           #news puts the essentials first
+_MAX_REDIRECTS=5
+
+
+class PageError(Exception):
+    """A page that cannot be summarized; the message is shown to the model"""
+
+
+def _check_address(address:str)->Union[ipaddress.IPv4Address,ipaddress.IPv6Address]:
+    ip=ipaddress.ip_address(address.split("%",1)[0])
+    if getattr(ip,"ipv4_mapped",None):
+        ip=ip.ipv4_mapped
+    if not ip.is_global:
+        raise PageError("not a public host")
+    return ip
+
+
+def check_url(url:str):
+    """Only http(s) URLs of public hosts: the URLs come from the model, which reads untrusted search results"""
+    parts=urlsplit(url)
+    if parts.scheme not in ("http","https") or not parts.hostname:
+        raise PageError("not an http(s) URL")
+    host=parts.hostname.lower()
+    if host=="localhost" or host.endswith(".localhost") or host.endswith(".internal"):
+        raise PageError("not a public host")
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return
+    _check_address(host)
+
+
+async def resolve_public(url:str)->str:
+    """
+    Address to connect to for `url`: its host is resolved (numeric forms such
+    as 2130706433 or 127.1 included) and every address must be public, so a
+    name pointing at a private or metadata address is refused too.
+    """
+    check_url(url)
+    parts=urlsplit(url)
+    port=parts.port or (443 if parts.scheme=="https" else 80)
+    try:
+        infos=await asyncio.get_running_loop().getaddrinfo(parts.hostname,port,type=socket.SOCK_STREAM)
+    except (socket.gaierror,UnicodeError):
+        raise PageError("host not found")
+    addresses=[_check_address(info[4][0]) for info in infos]
+    if not addresses:
+        raise PageError("host not found")
+    return str(addresses[0])
+
+
+async def fetch_page(url:str)->str:
+    """
+    HTML of a page, at most SUMMARY_MAX_PAGE_BYTES of it. The URL and every
+    redirect are resolved and checked, and the connection goes to the checked
+    address (PinnedAddressTransport), not to a second DNS answer. Replayed
+    runs (HTTP_MODE=replay) are offline and only check the URL.
+    """
+    async with http_session() as client:
+        with span("fetch",upstream="page") as timing:
+            for _ in range(_MAX_REDIRECTS+1):
+                if settings.HTTP_MODE=="replay":
+                    check_url(url)
+                    extensions={}
+                else:
+                    extensions={"pinned_address":await resolve_public(url)}
+                async with client.stream(
+                    "GET",url,
+                    headers={"Accept":"text/html,application/xhtml+xml,text/plain;q=0.8"},
+                    timeout=settings.SUMMARY_FETCH_TIMEOUT,
+                    extensions=extensions
+                ) as response:
+                    timing["status_code"]=response.status_code
+                    if response.is_redirect:
+                        url=str(response.url.join(response.headers["location"]))
+                        continue
+                    if response.status_code>=400:
+                        raise PageError(f"page returned status {response.status_code}")
+                    content_type=response.headers.get("content-type","text/html")
+                    if "html" not in content_type and not content_type.startswith("text/"):
+                        raise PageError(f"not a web page ({content_type.split(';')[0]})")
+                    body=bytearray()
+                    async for chunk in response.aiter_bytes():
+                        body+=chunk
+                        if len(body)>=settings.SUMMARY_MAX_PAGE_BYTES:
+                            break
+                    encoding=response.encoding or "utf-8"
+                return bytes(body[:settings.SUMMARY_MAX_PAGE_BYTES]).decode(encoding,errors="replace")
+    raise PageError("too many redirects")
+
+
+def extract_text(html:str)->Tuple[str,str]:
+    """(title, main text) of a page, one paragraph per line"""
+    from bs4 import BeautifulSoup
+    from readability import Document     #imported on first use, it is slow to import
+
+    title=""
+    try:
+        document=Document(html)
+        title=document.short_title()
+        soup=BeautifulSoup(document.summary(html_partial=True),"lxml")
+    except Exception:
+        soup=BeautifulSoup(html,"lxml")
+        for tag in soup(["script","style","nav","header","footer","aside","form","noscript"]):
+            tag.decompose()
+    if not title and soup.title:
+        title=soup.title.get_text(" ",strip=True)
+    blocks=soup.find_all(["p","li","h2","h3","blockquote","pre"]) or [soup]
+    paragraphs=[_SPACE_RE.sub(" ",block.get_text(" ",strip=True)) for block in blocks]
+    return title.strip(),"\n".join(paragraph for paragraph in paragraphs if paragraph)
+
+
+def split_sentences(text:str)->List[str]:
+    sentences=[]
+    for paragraph in text.split("\n"):
+        sentences.extend(sentence.strip() for sentence in _SENTENCE_RE.split(paragraph) if sentence.strip())
+    return sentences
+
+
+def summarize_text(text:str,title:str="",sentences:Optional[int]=None,max_chars:Optional[int]=None)->str:
+    """
+    Extractive summary: sentences score by how frequent their words are on the
+    page (title words count double), per square root of their length, with a
+    bonus for the lead. The best ones are kept in page order.
+    """
+    sentences=sentences or settings.SUMMARY_SENTENCES
+    max_chars=max_chars or settings.SUMMARY_MAX_CHARS
+    candidates=[sentence for sentence in split_sentences(text) if 40<=len(sentence)<=600]
+    if not candidates:
+        return text[:max_chars].strip()
+
+    frequencies=Counter(tokenize(text))
+    for term in tokenize(title):
+        frequencies[term]*=2
+    top=max(frequencies.values(),default=1)
+    scores=[]
+    for position,sentence in enumerate(candidates):
+        terms=tokenize(sentence)
+        score=sum(frequencies[term] for term in set(terms))/top/max(len(terms),1)**0.5
+        if position<_LEAD_SENTENCES:
+            score*=1.25
+        scores.append(score)
+
+    ranked=sorted(range(len(candidates)),key=lambda position:scores[position],reverse=True)
+    chosen=[]
+    length=0
+    for position in ranked:
+        if len(chosen)==sentences:
+            break
+        if length+len(candidates[position])>max_chars and chosen:
+            continue
+        chosen.append(position)
+        length+=len(candidates[position])+1
+    summary=" ".join(candidates[position] for position in sorted(chosen))
+    return summary if len(summary)<=max_chars else summary[:max_chars].rsplit(" ",1)[0]+" ..."
+
+
+async def summarize_page(url:str)->Dict[str,str]:
+    """{url, title, summary} of one page; raises PageError or httpx errors"""
+    html=await fetch_page(url)
+    with span("summarize",upstream="page"):
+        title,text=await asyncio.to_thread(extract_text,html)
+        if not text.strip():
+            raise PageError("no readable text on the page")
+        summary=await asyncio.to_thread(summarize_text,text,title)
+    return {"url":url,"title":title or url,"summary":summary}
+
 
 @registry.register
 class BraveSummarizeTool(BaseTool):
     name:str="brave_summarize"
-    description:str="Get a clean,accurate summarry of any webpage using Brave Summarizer"
+    description:str=(
+        "Summarize web pages: pass up to 5 URLs, or a search query to summarize its top results, and get "
+        "a short summary of each page, fetched in parallel. Use it when search snippets are not enough."
+    )
     parameters:dict={
         "type":"object",
-        "properties":{"url":{"type":"string","description":"Full URL of the page"}},
-        "required":["url"]
-        
+        "properties":{
+            "urls":{
+                "type":"array",
+                "items":{"type":"string"},
+                "description":"Full URLs of the pages"
+            },
+            "query":{"type":"string","description":"Search query whose top results to summarize, when there are no URLs"}
+        }
     }
 
-    async def run(self,url:str)->str:
-        async with httpx.AsyncClient() as client:
-            response=await client.get(
-                "https://api.search.brave.com/v1/summarizer",
-                headers={"X-Suscription-Token":settings.BRAVE_API_KEY},
-                params={"url":str},
-                timeout=30
-            )
-            response.raise_for_status()
-            data=response.json()
-            return data.get("summary","Could not summarize this page.")
+    async def run(self,urls:Optional[List[str]]=None,query:Optional[str]=None)->str:
+        output,_=await self.run_with_sources(urls=urls,query=query)
+        return output
+
+    async def run_with_sources(
+        self,urls:Optional[List[str]]=None,query:Optional[str]=None,url:Optional[str]=None
+    )->Tuple[str,List[Dict[str,str]]]:
+        urls=[*(urls or []),*([url] if url else [])]
+        if not urls and query:
+            results,_=await cached_search(query,count=5)
+            urls=[result["url"] for result in results if result.get("url")]
+        #One page per canonical URL, in the order given
+        pages:Dict[str,str]={}
+        for page_url in urls:
+            if isinstance(page_url,str) and page_url.strip():
+                pages.setdefault(canonical_url(page_url),page_url.strip())
+        if not pages:
+            return "No URLs to summarize.",[]
+        skipped=list(pages.values())[settings.SUMMARY_MAX_URLS:]
+        pages=dict(list(pages.items())[:settings.SUMMARY_MAX_URLS])
+
+        semaphore=asyncio.Semaphore(settings.SUMMARY_CONCURRENCY)
+
+        async def summarize(page_url:str):
+            async with semaphore:
+                try:
+                    summary,reused=await cached_summary(page_url,summarize_page)
+                except PageError as e:
+                    return {"url":page_url,"error":str(e)}
+                except Exception as e:
+                    return {"url":page_url,"error":f"could not fetch the page ({type(e).__name__})"}
+            if reused:
+                record_cache_hit()
+            return summary
+
+        results=await asyncio.gather(*(summarize(page_url) for page_url in pages.values()))
+        summaries=[result for result in results if "error" not in result]
+        failures=[result for result in results if "error" in result]
+
+        #The same wire story on several sites is summarized once, with every site as a source
+        if settings.DEDUP_ENABLED:
+            groups=group_near_duplicates(summaries,lambda summary:summary["summary"])
+        else:
+            groups=[[summary] for summary in summaries]
+        if len(groups)<len(summaries):
+            collapsed_total.inc(len(summaries)-len(groups),kind="summary")
+
+        blocks=[]
+        cited=[]
+        for group in groups:
+            lines=[group[0]["title"],group[0]["url"],f"Summary: {group[0]['summary']}"]
+            if len(group)>1:
+                lines.append("Same story also at: "+", ".join(duplicate["url"] for duplicate in group[1:]))
+            blocks.append("\n".join(lines))
+            cited.extend({"title":summary["title"],"url":summary["url"]} for summary in group)
+        for failure in failures:
+            blocks.append(f"{failure['url']}\nCould not summarize: {failure['error']}")
+        if skipped:
+            blocks.append(f"Not summarized (at most {settings.SUMMARY_MAX_URLS} pages per call): "+", ".join(skipped))
+        return "\n\n".join(blocks),cited
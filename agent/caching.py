@@ -0,0 +1,191 @@
+"""
+Search, answer and page summary caches shared by every request, keyed by
+normalized text (summaries by canonical URL), plus the popularity counters
+that backend/refresh_ahead.py uses to refresh hot entries shortly before
+they expire.
+
+The caches are tiered: a memory cache per process in front of one SQLite
+file per host (CACHE_DISK_PATH), so workers share entries and a restart
+starts warm. Cached values keep the original query/question so an entry
+can be re-run as it was first asked. Concurrent identical searches (a batch
+asking about ten countries at once, say) share one upstream call. Work done
+by the refresher itself (refreshing() is true) neither counts as demand nor
+reads the answer cache.
+"""
+import asyncio
+import re
+from contextvars import ContextVar
+from typing import Awaitable,Callable,Dict,List,Optional,Tuple
+from urllib.parse import parse_qsl,urlencode,urlsplit,urlunsplit
+from agent.config import settings
+from agent.scheduler import upstream_slot
+from agent.utils.accounting import record_search
+from agent.utils.cache import PopularityCounter,SqliteCache,TieredCache,TTLCache
+from agent.utils.http import http_session
+from agent.utils.jsoncodec import loads
+from agent.utils.telemetry import span
+
+disk_cache=SqliteCache(settings.CACHE_DISK_PATH,max_bytes=settings.CACHE_DISK_MAX_MB*1024*1024)
+
+
+def _cache(namespace:str,maxsize:int,ttl:float):
+    """Memory cache of this process, backed by the host's disk tier unless CACHE_DISK_ENABLED is off"""
+    memory=TTLCache(maxsize=maxsize,ttl=ttl)
+    return TieredCache(memory,disk_cache,namespace) if settings.CACHE_DISK_ENABLED else memory
+
+
+search_cache=_cache("search",settings.SEARCH_CACHE_SIZE,settings.SEARCH_CACHE_TTL)
+answer_cache=_cache("answer",settings.ANSWER_CACHE_SIZE,max(settings.ANSWER_CACHE_TTL,1))
+summary_cache=_cache("summary",settings.SUMMARY_CACHE_SIZE,settings.SUMMARY_CACHE_TTL)
+popularity:Dict[str,PopularityCounter]={
+    "search":PopularityCounter(half_life=settings.POPULARITY_HALF_LIFE),
+    "answer":PopularityCounter(half_life=settings.POPULARITY_HALF_LIFE),
+}
+_refreshing:ContextVar[bool]=ContextVar("knowdex_refreshing",default=False)
+_searches_in_flight:Dict[tuple,asyncio.Task]={}
+_summaries_in_flight:Dict[str,asyncio.Task]={}
+_WORD_RE=re.compile(r"\w+")
+#Query parameters that only say where a click came from
+_TRACKING_PARAMS={"fbclid","gclid","dclid","msclkid","mc_cid","mc_eid","igshid","ref","ref_src","cmpid","ocid"}
+
+
+def normalize_query(text:str)->str:
+    """Case, punctuation and spacing do not make a different question"""
+    return " ".join(_WORD_RE.findall(text.lower()))
+
+
+def refreshing()->bool:
+    return _refreshing.get()
+
+
+def mark_refreshing():
+    """Flag the current context (a refresher task) as background work"""
+    _refreshing.set(True)
+
+
+def cache_stats()->Dict[str,dict]:
+    """Hits, misses and size of each cache, per tier"""
+    return {"search":search_cache.stats(),"answer":answer_cache.stats(),"summary":summary_cache.stats()}
+
+
+# ==================== SEARCH ====================
+
+async def fetch_search_results(query:str,count:int=5)->List[dict]:
+    """Brave web results, straight from the API; raises httpx errors and JSONDecodeError"""
+    async with upstream_slot("brave"),http_session() as client:
+        with span("search",upstream="brave") as timing:
+            response=await client.get(
+                f"{settings.BRAVE_BASE_URL}/res/v1/web/search",
+                headers={
+                    "X-Subscription-Token":settings.BRAVE_API_KEY,
+                    "Accept":"application/json"
+                },
+                params={"q":query,"count":count},
+                timeout=30.0
+            )
+            timing["status_code"]=response.status_code
+    #Counted either way, but only a successful search is billed (and costed)
+    record_search(billed=response.is_success)
+    response.raise_for_status()
+    if not response.text.strip():
+        return []
+    return loads(response.content).get("web",{}).get("results",[])
+
+
+async def _fetch_and_cache(key:tuple,query:str,count:int)->List[dict]:
+    results=await fetch_search_results(query,count)
+    search_cache.set(key,{"query":query,"count":count,"results":results})
+    return results
+
+
+def _task_done(in_flight:Dict,key,task:asyncio.Task):
+    in_flight.pop(key,None)
+    if not task.cancelled():
+        task.exception()    #retrieved even when every caller went away
+
+
+async def cached_search(query:str,count:int=5)->Tuple[List[dict],bool]:
+    """(results, reused): from the cache or joined onto an identical search in flight; failures are not cached"""
+    #Only case, punctuation and spacing are ignored: reordered words can be a different search ("flights paris london")
+    key=(normalize_query(query),count)
+    if not refreshing():
+        popularity["search"].hit(key)
+    cached=search_cache.get(key)
+    if cached is not None:
+        record_search(cached=True)
+        return cached["results"],True
+
+    #The first caller's task does the upstream call (and is billed for it); a cancelled caller does not cancel it
+    task=_searches_in_flight.get(key)
+    shared=task is not None
+    if not shared:
+        task=asyncio.ensure_future(_fetch_and_cache(key,query,count))
+        _searches_in_flight[key]=task
+        task.add_done_callback(lambda done:_task_done(_searches_in_flight,key,done))
+    results=await asyncio.shield(task)
+    if shared:
+        record_search(cached=True)
+    return results,shared
+
+
+# ==================== PAGE SUMMARIES ====================
+
+def canonical_url(url:str)->str:
+    """One key per page: case of scheme and host, default ports, fragments, tracking parameters and a trailing slash do not matter"""
+    parts=urlsplit(url.strip())
+    scheme=parts.scheme.lower()
+    host=(parts.hostname or "").lower()
+    if host.startswith("www."):
+        host=host[4:]
+    if parts.port and (scheme,parts.port) not in (("http",80),("https",443)):
+        host=f"{host}:{parts.port}"
+    query=urlencode(sorted(
+        (name,value) for name,value in parse_qsl(parts.query,keep_blank_values=True)
+        if not name.lower().startswith("utm_") and name.lower() not in _TRACKING_PARAMS
+    ))
+    path=parts.path.rstrip("/") or "/"
+    return urlunsplit((scheme,host,path,query,""))
+
+
+async def cached_summary(url:str,summarize:Callable[[str],Awaitable[dict]])->Tuple[dict,bool]:
+    """(summary, reused) for a page: cached per canonical URL, concurrent requests for one page share the work; failures are not cached"""
+    key=canonical_url(url)
+    cached=summary_cache.get(key)
+    if cached is not None:
+        return cached,True
+
+    task=_summaries_in_flight.get(key)
+    shared=task is not None
+    if not shared:
+        async def summarize_and_cache()->dict:
+            summary=await summarize(url)
+            summary_cache.set(key,summary)
+            return summary
+        task=asyncio.ensure_future(summarize_and_cache())
+        _summaries_in_flight[key]=task
+        task.add_done_callback(lambda done:_task_done(_summaries_in_flight,key,done))
+    return await asyncio.shield(task),shared
+
+
+# ==================== ANSWERS ====================
+
+def answer_cache_enabled()->bool:
+    return settings.ANSWER_CACHE_TTL>0
+
+
+def cached_answer(question:str)->Optional[dict]:
+    """{question,answer,sources} of a recent identical question, None on a miss or while refreshing"""
+    if not answer_cache_enabled() or refreshing():
+        return None
+    key=normalize_query(question)
+    popularity["answer"].hit(key)
+    return answer_cache.get(key)
+
+
+def store_answer(question:str,answer:str,sources:List[dict]):
+    if answer_cache_enabled() and answer.strip():
+        answer_cache.set(
+            normalize_query(question),
+            {"question":question,"answer":answer,"sources":sources},
+            ttl=settings.ANSWER_CACHE_TTL
+        )
@@ -0,0 +1,159 @@
+"""
+Command-line batch runner: research many questions without the web stack.
+
+Questions come from a file or stdin, one per line (blank lines and lines
+starting with # are skipped), or as JSONL objects {"id":...,"question":...}.
+They run concurrently through run_research (see agent/batch.py), and each
+finished question is written as one JSON line with its answer, citations,
+per-stage timings and token usage. A summary goes to stderr at the end.
+
+    python -m agent.cli questions.txt -o answers.jsonl --concurrency 8
+    python -m agent.cli questions.txt -o answers.jsonl --resume            #skip questions already answered
+    python -m agent.cli questions.txt -o replayed.jsonl --replay nightly   #offline, from cassettes/nightly.json
+    python -m agent.cli questions.txt -o answers.jsonl --record nightly    #live, and save a cassette for --replay
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime
+from typing import Dict,List,Optional,Set,TextIO
+from agent.config import settings
+from agent.utils.jsoncodec import dumps,loads
+
+
+def question_id(question:str)->str:
+    return hashlib.sha1(question.strip().encode("utf-8")).hexdigest()[:12]
+
+
+def read_questions(stream:TextIO)->List[Dict[str,str]]:
+    """[{id,question}] from plain lines or JSONL objects"""
+    items=[]
+    for line in stream:
+        line=line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("{"):
+            record=loads(line)
+            question=str(record.get("question") or "").strip()
+            if question:
+                items.append({"id":str(record.get("id") or question_id(question)),"question":question})
+        else:
+            items.append({"id":question_id(line),"question":line})
+    return items
+
+
+def completed_ids(path:str)->Set[str]:
+    """Ids already answered without error in an earlier run's output; a torn last line is ignored"""
+    done=set()
+    if not os.path.exists(path):
+        return done
+    with open(path,"r",encoding="utf-8") as f:
+        for line in f:
+            try:
+                record=loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("id") and not record.get("error"):
+                done.add(record["id"])
+    return done
+
+
+def ends_with_newline(path:str)->bool:
+    with open(path,"rb") as f:
+        f.seek(-1,os.SEEK_END)
+        return f.read(1)==b"\n"
+
+
+def configure_http(args):
+    """Point the shared HTTP client at a cassette; must run before the first upstream call"""
+    if args.replay:
+        settings.HTTP_MODE="replay"
+        settings.CASSETTE_NAME=args.replay
+        settings.REPLAY_LATENCY_MS=args.replay_latency_ms
+        settings.REPLAY_JITTER_MS=args.replay_jitter_ms
+    elif args.record:
+        settings.HTTP_MODE="record"
+        settings.CASSETTE_NAME=args.record
+
+
+async def run(args)->int:
+    from agent.batch import BatchResult,run_batch
+    from agent.utils.http import close_http_clients
+
+    if args.input=="-":
+        items=read_questions(sys.stdin)
+    else:
+        with open(args.input,"r",encoding="utf-8") as f:
+            items=read_questions(f)
+
+    if args.resume and args.output:
+        done=completed_ids(args.output)
+        skipped=sum(1 for item in items if item["id"] in done)
+        items=[item for item in items if item["id"] not in done]
+        print(f"Resuming: {skipped} already answered, {len(items)} to go",file=sys.stderr)
+    if not items:
+        print("Nothing to do",file=sys.stderr)
+        return 0
+
+    out=open(args.output,"a" if args.resume else "w",encoding="utf-8") if args.output else sys.stdout
+    if args.resume and out.tell() and not ends_with_newline(args.output):
+        out.write("\n")    #finish the torn line of an interrupted run so the next record starts clean
+    failed=0
+    try:
+        async for item in run_batch([item["question"] for item in items],args.concurrency,args.mode):
+            if not isinstance(item,BatchResult):
+                print(json.dumps({"summary":item.model_dump()},indent=2),file=sys.stderr)
+                continue
+            usage=item.usage.model_dump(include={
+                "model","prompt_tokens","cached_tokens","completion_tokens","llm_calls","search_calls","cached_searches","cache_hits","cost_usd"
+            }) if item.usage else None
+            record={
+                "id":items[item.index]["id"],
+                "question":item.question,
+                "answer":item.answer,
+                "citations":[{"number":n,**source} for n,source in enumerate(item.sources,1)],
+                "error":item.error,
+                "duration_ms":item.duration_ms,
+                "timings":item.timings,
+                "usage":usage,
+                "duplicate_of":items[item.duplicate_of]["id"] if item.duplicate_of is not None else None,
+                "finished_at":datetime.utcnow().isoformat(timespec="seconds"),
+            }
+            failed+=bool(item.error)
+            #One complete line at a time, so an interrupted run can be resumed
+            out.write(dumps(record)+"\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        await close_http_clients()
+    return 1 if failed else 0
+
+
+def main(argv:Optional[List[str]]=None):
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input",nargs="?",default="-",help="questions file, - for stdin")
+    parser.add_argument("-o","--output",default=None,help="JSONL output file (default stdout)")
+    parser.add_argument("-c","--concurrency",type=int,default=settings.BATCH_CONCURRENCY)
+    parser.add_argument("--mode",default="batch",help="usage accounting mode")
+    parser.add_argument("--resume",action="store_true",help="append to --output, skipping questions it already answered")
+    cassette=parser.add_mutually_exclusive_group()
+    cassette.add_argument("--replay",metavar="CASSETTE",help="serve every upstream call from this cassette (offline)")
+    cassette.add_argument("--record",metavar="CASSETTE",help="record every upstream call into this cassette")
+    parser.add_argument("--replay-latency-ms",type=float,default=settings.REPLAY_LATENCY_MS)
+    parser.add_argument("--replay-jitter-ms",type=float,default=settings.REPLAY_JITTER_MS)
+    args=parser.parse_args(argv)
+    if args.resume and not args.output:
+        parser.error("--resume needs --output")
+
+    configure_http(args)
+    from backend.migrations import run_migrations
+    run_migrations()    #past_research reads the research table
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__=="__main__":
+    main()
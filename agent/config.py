@@ -1,5 +1,9 @@
 from pydantic_settings import BaseSettings
+import logging
 import os
+from typing import Optional
+from agent.utils.jsoncodec import set_codec
+from agent.utils.telemetry import log_event
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -10,22 +14,157 @@ class settings(BaseSettings):
     OPENAI_API_KEY:str=os.getenv("OPENAI_API_KEY")
     BRAVE_API_KEY:str=os.getenv("BRAVE_API_KEY")
 
-    #Model settings
+    #Upstream endpoints, overridable to point at local stubs (benchmarks/stubs.py)
+    OPENAI_BASE_URL:Optional[str]=None    #None -> the official API
+    BRAVE_BASE_URL:str="https://api.search.brave.com"
+
+    #Model settings: the defaults, and per stage (agent/stages.py); "" -> MODEL
     MODEL:str="gpt-4o-mini"
     TEMPERATURE:float=0.0
     MAX_TOKENS:int=1024
+    DECISION_MODEL:str=""               #tool decision, the first call of every answer
+    DECISION_MAX_TOKENS:int=512         #tool calls only; the text of this call is not shown
+    ANSWER_MODEL:str=""
+    ANSWER_MAX_TOKENS:Optional[int]=None    #None -> MAX_TOKENS
+    MODE_MODELS:dict={}                 #per mode and stage, e.g. {"quick":{"decision":{"model":"gpt-4.1-nano"}}}
+
+    #Cost estimates: USD per million tokens (dated model names match their base name) and per search.
+    #cached_input is the price of prompt tokens served from OpenAI's prompt cache
+    MODEL_PRICES:dict={
+        "gpt-4o-mini":{"input":0.15,"cached_input":0.075,"output":0.60},
+        "gpt-4o":{"input":2.50,"cached_input":1.25,"output":10.00},
+        "gpt-4.1-mini":{"input":0.40,"cached_input":0.10,"output":1.60},
+        "gpt-4.1-nano":{"input":0.10,"cached_input":0.025,"output":0.40},
+        "gpt-4.1":{"input":2.00,"cached_input":0.50,"output":8.00},
+    }
+    SEARCH_PRICE_USD:float=0.005
 
     #Agent's behaviour
     MAX_LOOP:int=12
-    STREAMING:bool=True
+    STREAMING:bool=True                 #stream the final answer token by token
+
+    #Tools from agent/tools/registry.py offered to the model next to brave_search
+    AGENT_TOOLS:list=["past_research","brave_summarize"]
+
+    #Near-duplicate search results and passages are shown once, with all their sources (agent/utils/dedup.py)
+    DEDUP_ENABLED:bool=True
+    DEDUP_THRESHOLD:float=0.6           #estimated Jaccard similarity of word shingles
+    DEDUP_SHINGLE_SIZE:int=3            #words per shingle
+    DEDUP_NUM_PERM:int=64               #MinHash signature length
+
+    #Past research retrieval: local TF-IDF index over answered questions (agent/knowledge)
+    KNOWLEDGE_INDEX_DIR:str="knowledge_index"
+    KNOWLEDGE_REFRESH_SECONDS:int=30    #new research becomes searchable at most this late
+    KNOWLEDGE_TOP_K:int=3
+    KNOWLEDGE_MIN_SCORE:float=0.15      #cosine similarity below this is not relevant
+    KNOWLEDGE_ANSWER_CHARS:int=1200     #of each past answer shown to the model
+
+    #Search and answer caches shared by all requests (agent/caching.py)
+    SEARCH_CACHE_TTL:int=900
+    SEARCH_CACHE_SIZE:int=5000
+    ANSWER_CACHE_TTL:int=0              #0 disables; otherwise repeated first questions replay the cached answer
+    ANSWER_CACHE_SIZE:int=1000
+    POPULARITY_HALF_LIFE:int=3600       #hit counts halve after this many seconds without hits
+    CACHE_DISK_ENABLED:bool=True        #back the caches above with a SQLite file shared by the workers of a host
+    CACHE_DISK_PATH:str="cache/knowdex_cache.db"
+    CACHE_DISK_MAX_MB:int=256
+
+    #Page summaries for the brave_summarize tool (agent/brave/summarize.py), cached per canonical URL
+    SUMMARY_CACHE_TTL:int=7*24*60*60    #a published article rarely changes
+    SUMMARY_CACHE_SIZE:int=5000
+    SUMMARY_MAX_URLS:int=5              #pages per tool call
+    SUMMARY_CONCURRENCY:int=5           #pages fetched at once per call
+    SUMMARY_FETCH_TIMEOUT:float=10.0
+    SUMMARY_MAX_PAGE_BYTES:int=2_000_000
+    SUMMARY_SENTENCES:int=5             #sentences kept per page
+    SUMMARY_MAX_CHARS:int=900
+
+    #Refresh-ahead: popular cache entries are re-fetched shortly before they expire (backend/refresh_ahead.py)
+    REFRESH_AHEAD_ENABLED:bool=True
+    REFRESH_AHEAD_INTERVAL:int=15
+    REFRESH_AHEAD_WINDOW:int=60         #entries expiring within this many seconds are due
+    REFRESH_AHEAD_MIN_SCORE:float=3.0   #decayed hits an entry needs to count as popular
+    REFRESH_AHEAD_CONCURRENCY:int=2
+    REFRESH_AHEAD_SEARCHES_PER_HOUR:int=120
+    REFRESH_AHEAD_ANSWERS_PER_HOUR:int=10
+
+    #Batch research (POST /api/research/batch)
+    BATCH_MAX_QUESTIONS:int=500
+    BATCH_CONCURRENCY:int=8             #questions researched at once, unless the request asks for fewer/more
+    BATCH_MAX_CONCURRENCY:int=32
+    BATCH_QUESTION_TIMEOUT:float=300.0
+
+    #Fair-share scheduling of upstream calls between users (agent/scheduler.py)
+    SCHEDULER_ENABLED:bool=True
+    SCHEDULER_CAPACITY:dict={"openai":16,"brave":8}     #concurrent calls per upstream, for all users together
+    SCHEDULER_DEFAULT_CAPACITY:int=8                   #upstreams not listed above
+    SCHEDULER_USER_CONCURRENCY:int=8    #calls one user may have running per upstream (a batch runs BATCH_CONCURRENCY at once)
+    SCHEDULER_WEIGHTS:dict={}           #user identifier -> calls per round-robin turn (default 1)
+    SCHEDULER_INTERACTIVE_MODES:list=["research","quick"]   #other modes (batch, refresh, memory) wait behind these
+    SCHEDULER_BATCH_SHARE:float=0.1     #of the grants still given to waiting batch work; 0 -> strict priority
+
+    #Token coalescing between the agent stream and clients (one frame per window or size, not per token)
+    STREAM_FLUSH_MS:float=40.0          #0 sends every token as its own frame
+    STREAM_FLUSH_CHARS:int=256
+
+    #Conversation memory: the newest messages of a thread verbatim, older ones folded into a rolling summary
+    MEMORY_ENABLED:bool=True
+    MEMORY_TOKEN_BUDGET:int=1500        #summary + recent messages sent with a follow-up, whatever the thread length
+    MEMORY_MAX_TURNS:int=6              #messages kept verbatim at most
+    MEMORY_TURN_TOKENS:int=350          #longer messages are cut to this
+    MEMORY_SUMMARY_TOKENS:int=300
+    MEMORY_MODEL:str="gpt-4o-mini"     #the "summary" stage; "" -> MODEL
+    MEMORY_CACHE_SIZE:int=1000          #thread summaries kept in memory
+    MEMORY_CACHE_TTL:int=3600
+
+    #History retention (0 disables a rule)
+    ARCHIVE_AFTER_DAYS:int=0           #threads idle / research older than this move to the archive table (opt-in: archived research leaves /api/history and search)
+    RETENTION_DAYS:int=0               #threads and research older than this are deleted for good
+    RETENTION_INTERVAL_SECONDS:int=6*60*60
+    RETENTION_BATCH_SIZE:int=500
+    RETENTION_VACUUM:bool=False        #VACUUM after a sweep that removed rows, shrinks the SQLite file
+
+    #Identity cache (email -> user) shared by header auth, the API and the data layer
+    IDENTITY_CACHE_TTL:int=300
+    IDENTITY_CACHE_SIZE:int=10000
+
+    #Upstream HTTP: "live", "record" (live + save to a cassette) or "replay" (offline, from the cassette)
+    HTTP_MODE:str="live"
+    CASSETTE_DIR:str="cassettes"
+    CASSETTE_NAME:str="default"
+    REPLAY_LATENCY_MS:float=0.0         #added before each replayed response
+    REPLAY_JITTER_MS:float=0.0          #+/- uniform jitter on that latency
+    REPLAY_REALTIME:bool=False          #replay streamed chunks at their recorded pace
+    REPLAY_SEED:int=0
+
+    #Profiling (admin only, off by default). /admin endpoints need the X-Admin-Token header
+    PROFILING_ENABLED:bool=False
+    PROFILING_SAMPLE_RATE:float=0.0     #fraction of /api/research requests to profile
+    PROFILING_MODE:str="sampling"       #"sampling" (stack sampler, low overhead) or "cprofile"
+    PROFILING_SAMPLE_INTERVAL_MS:float=5.0
+    PROFILING_TRACEMALLOC:bool=False    #also diff memory allocations around a profiled request
+    PROFILING_KEEP:int=20               #recent profiles kept in memory
+    ADMIN_TOKEN:str=""
+
+    #Event-loop lag monitor
+    LOOP_LAG_INTERVAL_MS:int=500
+    LOOP_LAG_WARN_MS:int=100           #a stall longer than this is logged with the blocking stack
+
+    #JSON backend for storage, streaming and logs: "auto" (orjson if installed), "orjson" or "json"
+    JSON_CODEC:str="auto"
+
+    #Startup warm-up (backend/warmup.py); /ready answers 503 until it is done
+    WARMUP_ENABLED:bool=True
+    WARMUP_PRECONNECT:bool=True         #open the OpenAI and Brave connections ahead of the first question (live mode)
 
     class config:
         env_file=".env"
         env_file_encoding="utf-8"
 
 settings=settings()
+set_codec(settings.JSON_CODEC)
 
 if not settings.OPENAI_API_KEY or not settings.BRAVE_API_KEY:
-    print("Warning:API keys not found set in .env file")
+    log_event("config_warning",level=logging.WARNING,message="API keys not found set in .env file")
 
 
@@ -23,4 +23,20 @@ class ResearchResponse(BaseModel):
     session_id:str
     answer:str
     citations:List[citation]
-    finished:bool=True
\ No newline at end of file
+    finished:bool=True
+
+class StreamChunk(str):
+    """
+    A piece of run_research output. It is a plain str for anyone who just prints
+    or streams it, and carries what it is for anyone who persists it:
+    "status" (progress lines), "answer" (the final answer text), "sources"
+    (the citation block, with the structured list in .sources) or "error".
+    """
+    kind:str
+    sources:List[Dict[str,str]]
+
+    def __new__(cls,text:str,kind:str="status",sources:List[Dict[str,str]]|None=None):
+        chunk=super().__new__(cls,text)
+        chunk.kind=kind
+        chunk.sources=sources or []
+        return chunk
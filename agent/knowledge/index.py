@@ -0,0 +1,174 @@
+"""
+A small TF-IDF index in plain NumPy arrays.
+
+Documents are stored as COO triplets (row = document, col = term, val =
+1 + log(term frequency)) plus per-term document frequencies. IDF weights
+and document norms are derived from those on demand, so documents can be
+appended at any time without reweighting what is already indexed. A query
+is one gather and one bincount over the stored entries.
+
+The arrays are saved as .npy files and loaded memory-mapped, so opening a
+large index costs a few file opens and no parsing.
+"""
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict,List,Optional,Tuple
+import numpy as np
+
+ARRAYS=("rows","cols","vals","df")
+INDEX_VERSION=2
+_TOKEN_RE=re.compile(r"[a-z0-9]+")
+STOP_WORDS=frozenset("""
+a an and are as at be been but by can could did do does for from had has have how i if in into is it its
+me my no not of on or our so than that the their them then there these they this to up was we were what
+when where which who why will with would you your about also just more most some such other over only
+""".split())
+
+
+def tokenize(text:str)->List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if len(t)>1 and t not in STOP_WORDS]
+
+
+class TfidfIndex:
+    def __init__(self,path:Optional[str]=None):
+        self.path=path
+        self.vocabulary:Dict[str,int]={}
+        self.terms:List[str]=[]
+        self.doc_ids:List[str]=[]
+        self.owners:List[str]=[]            #per document, who may find it ("" -> nobody in particular)
+        self.rows=np.zeros(0,np.int32)
+        self.cols=np.zeros(0,np.int32)
+        self.vals=np.zeros(0,np.float32)
+        self.df=np.zeros(0,np.int32)
+        #Caller-defined position of the last indexed source row (see agent/knowledge/past_research.py)
+        self.watermark:Optional[dict]=None
+        self._norms:Optional[np.ndarray]=None
+        self._owner_codes:Optional[Tuple[Dict[str,int],np.ndarray]]=None
+        self._lock=threading.Lock()
+
+    def __len__(self)->int:
+        return len(self.doc_ids)
+
+    def add(self,documents:List[Tuple[str,str]],owners:Optional[List[str]]=None):
+        """Append (doc_id,text) documents, optionally with the owner of each"""
+        rows,cols,vals=[],[],[]
+        with self._lock:
+            doc_ids=list(self.doc_ids)
+            doc_owners=self.owners+(list(owners) if owners is not None else [""]*len(documents))
+            terms=list(self.terms)
+            vocabulary=dict(self.vocabulary)
+            for doc_id,text in documents:
+                row=len(doc_ids)
+                for term,count in Counter(tokenize(text)).items():
+                    col=vocabulary.get(term)
+                    if col is None:
+                        col=vocabulary[term]=len(terms)
+                        terms.append(term)
+                    rows.append(row)
+                    cols.append(col)
+                    vals.append(1.0+math.log(count))
+                doc_ids.append(doc_id)
+            new_cols=np.asarray(cols,np.int32)
+            df=np.concatenate([self.df,np.zeros(len(terms)-len(self.df),np.int32)])
+            df+=np.bincount(new_cols,minlength=len(terms)).astype(np.int32)
+            #Searches take a snapshot under the lock, so they never see half an update
+            self.rows=np.concatenate([self.rows,np.asarray(rows,np.int32)])
+            self.cols=np.concatenate([self.cols,new_cols])
+            self.vals=np.concatenate([self.vals,np.asarray(vals,np.float32)])
+            self.df=df
+            self.doc_ids,self.owners,self.terms,self.vocabulary=doc_ids,doc_owners,terms,vocabulary
+            self._norms=None
+            self._owner_codes=None
+
+    def _snapshot(self):
+        with self._lock:
+            n=len(self.doc_ids)
+            idf=(np.log((1.0+n)/(1.0+self.df))+1.0).astype(np.float32)
+            if self._norms is None or len(self._norms)!=n:
+                weights=self.vals*idf[self.cols]
+                self._norms=np.sqrt(np.bincount(self.rows,weights=weights*weights,minlength=n))
+            if self._owner_codes is None or len(self._owner_codes[1])!=n:
+                codes:Dict[str,int]={}
+                self._owner_codes=(codes,np.fromiter((codes.setdefault(o,len(codes)) for o in self.owners),np.int32,n))
+            return self.rows,self.cols,self.vals,idf,self._norms,self.doc_ids,self._owner_codes,self.vocabulary
+
+    def search(self,text:str,k:int=5,owner:Optional[str]=None)->List[Tuple[str,float]]:
+        """Top k (doc_id,cosine similarity) for a free-text query, best first; only `owner`'s documents when given"""
+        rows,cols,vals,idf,norms,doc_ids,owners,vocabulary=self._snapshot()
+        counts=Counter(t for t in tokenize(text) if t in vocabulary)
+        if not counts or not doc_ids:
+            return []
+        query=np.zeros(len(idf),np.float32)
+        for term,count in counts.items():
+            col=vocabulary[term]
+            query[col]=(1.0+math.log(count))*idf[col]
+
+        hit=np.flatnonzero(query[cols])
+        hit_cols=cols[hit]
+        scores=np.bincount(rows[hit],weights=vals[hit]*idf[hit_cols]*query[hit_cols],minlength=len(doc_ids))
+        scores/=np.where(norms>0,norms,1.0)*float(np.linalg.norm(query))
+        if owner is not None:
+            codes,owner_codes=owners
+            scores[owner_codes!=codes.get(owner,-1)]=0.0
+        k=min(k,len(doc_ids))
+        top=np.argpartition(-scores,k-1)[:k]
+        top=top[np.argsort(-scores[top])]
+        return [(doc_ids[i],float(scores[i])) for i in top if scores[i]>0]
+
+    # ==================== PERSISTENCE ====================
+
+    def save(self):
+        """Write the arrays and metadata, each file replaced atomically"""
+        if not self.path:
+            return
+        os.makedirs(self.path,exist_ok=True)
+        with self._lock:
+            arrays={name:getattr(self,name) for name in ARRAYS}
+            meta={
+                "version":INDEX_VERSION,
+                "nnz":len(self.rows),
+                "doc_ids":self.doc_ids,
+                "owners":self.owners,
+                "terms":self.terms,
+                "watermark":self.watermark,
+            }
+        for name,array in arrays.items():
+            target=os.path.join(self.path,f"{name}.npy")
+            with open(target+".tmp","wb") as f:
+                np.save(f,np.ascontiguousarray(array))
+            os.replace(target+".tmp",target)
+        target=os.path.join(self.path,"index.json")
+        with open(target+".tmp","w",encoding="utf-8") as f:
+            json.dump(meta,f)
+        os.replace(target+".tmp",target)
+
+    def load(self)->bool:
+        """Open a saved index memory-mapped; False (and an empty index) when missing or inconsistent"""
+        if not self.path or not os.path.exists(os.path.join(self.path,"index.json")):
+            return False
+        try:
+            with open(os.path.join(self.path,"index.json"),"r",encoding="utf-8") as f:
+                meta=json.load(f)
+            arrays={name:np.load(os.path.join(self.path,f"{name}.npy"),mmap_mode="r") for name in ARRAYS}
+        except (OSError,ValueError):
+            return False
+        #Older versions (no owners) and a crash between file replacements (sizes disagree): start over
+        if meta.get("version")!=INDEX_VERSION or len(meta.get("owners",()))!=len(meta["doc_ids"]):
+            return False
+        if not (len(arrays["rows"])==len(arrays["cols"])==len(arrays["vals"])==meta["nnz"]) or len(arrays["df"])!=len(meta["terms"]):
+            return False
+        with self._lock:
+            for name,array in arrays.items():
+                setattr(self,name,array)
+            self.doc_ids=meta["doc_ids"]
+            self.owners=meta["owners"]
+            self.terms=meta["terms"]
+            self.vocabulary={term:col for col,term in enumerate(self.terms)}
+            self.watermark=meta.get("watermark")
+            self._norms=None
+            self._owner_codes=None
+        return True
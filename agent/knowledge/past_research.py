@@ -0,0 +1,180 @@
+"""
+Past research as a tool: questions KNOWDEX has already answered, with the
+sources they cited, searched through a local TF-IDF index (index.py).
+
+The index covers each research row's question (weighted double), the start
+of its answer and its source titles. It is kept on disk under
+KNOWLEDGE_INDEX_DIR, opened memory-mapped on first use and topped up
+incrementally with rows newer than its watermark, at most every
+KNOWLEDGE_REFRESH_SECONDS. Rows removed by retention are skipped at query time.
+
+Every indexed row keeps the user it belongs to, and a search only returns
+the research of the user set with set_research_user() for the request:
+nobody's past questions or answers reach another user's answer. Without a
+user (scripts, background refreshes) the tool finds nothing.
+"""
+import asyncio
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict,List,Optional,Tuple
+from sqlalchemy import and_,or_
+from sqlmodel import Session,select
+from agent.config import settings
+from agent.knowledge.index import TfidfIndex
+from agent.tools.base import BaseTool
+from agent.tools.registry import registry
+from agent.utils.accounting import record_cache_hit
+from agent.utils.dedup import collapsed_total,group_near_duplicates
+from agent.utils.telemetry import log_event,span
+from backend.database import engine
+from backend.models import Research
+from backend.storage import load_sources
+
+knowledge_index=TfidfIndex(settings.KNOWLEDGE_INDEX_DIR)
+_refresh_lock=threading.Lock()
+_state={"loaded":False,"refreshed_at":0.0}
+_research_user:ContextVar[Optional[uuid.UUID]]=ContextVar("knowdex_research_user",default=None)
+
+
+def set_research_user(user_id:Optional[uuid.UUID]):
+    """The user whose past research the current request (and the tasks it starts) may search"""
+    _research_user.set(user_id)
+
+
+def _document_text(question:str,answer:str,sources:List[dict])->str:
+    titles=" ".join(source.get("title") or "" for source in sources)
+    return f"{question}\n{question}\n{answer[:4000]}\n{titles}"
+
+
+def refresh_index(batch_size:int=500)->int:
+    """Open the saved index once, then add research rows newer than its watermark; returns how many"""
+    with _refresh_lock:
+        if not _state["loaded"]:
+            knowledge_index.load()
+            _state["loaded"]=True
+        added=0
+        while True:
+            query=select(Research.id,Research.user_id,Research.question,Research.answer,Research.created_at)
+            watermark=knowledge_index.watermark
+            if watermark:
+                after=datetime.fromisoformat(watermark["created_at"])
+                query=query.where(or_(
+                    Research.created_at>after,
+                    and_(Research.created_at==after,Research.id>uuid.UUID(watermark["id"])),
+                ))
+            with Session(engine) as session:
+                rows=session.exec(query.order_by(Research.created_at,Research.id).limit(batch_size)).all()
+                sources=load_sources(session,[row.id for row in rows])
+            if not rows:
+                break
+            knowledge_index.add(
+                [(str(row.id),_document_text(row.question,row.answer or "",sources[row.id])) for row in rows],
+                owners=[str(row.user_id) for row in rows],
+            )
+            knowledge_index.watermark={"created_at":rows[-1].created_at.isoformat(),"id":str(rows[-1].id)}
+            added+=len(rows)
+            if len(rows)<batch_size:
+                break
+        if added:
+            knowledge_index.save()
+            log_event("knowledge_index_updated",added=added,documents=len(knowledge_index))
+        _state["refreshed_at"]=time.monotonic()
+        return added
+
+
+async def ensure_fresh():
+    if not _state["loaded"] or time.monotonic()-_state["refreshed_at"]>=settings.KNOWLEDGE_REFRESH_SECONDS:
+        await asyncio.to_thread(refresh_index)
+
+
+def load_findings(matches:List[Tuple[str,float]],user_id:uuid.UUID)->List[Dict]:
+    """`user_id`'s research rows (with sources) of index matches, in match order; rows deleted since are dropped"""
+    ids=[uuid.UUID(doc_id) for doc_id,_ in matches]
+    with Session(engine) as session:
+        query=select(Research).where(Research.id.in_(ids),Research.user_id==user_id)
+        rows={row.id:row for row in session.exec(query).all()}
+        sources=load_sources(session,list(rows))
+    return [
+        {
+            "question":rows[research_id].question,
+            "answer":rows[research_id].answer or "",
+            "created_at":rows[research_id].created_at,
+            "score":score,
+            "sources":sources[research_id],
+        }
+        for research_id,(_,score) in zip(ids,matches)
+        if research_id in rows
+    ]
+
+
+async def find_past_research(query:str,k:int=None,user_id:Optional[uuid.UUID]=None)->List[Dict]:
+    """Best matches among the past research of `user_id`, by default the request's user (set_research_user)"""
+    user_id=user_id or _research_user.get()
+    if user_id is None:
+        return []
+    await ensure_fresh()
+    with span("search",upstream="knowledge") as timing:
+        matches=[
+            match for match in knowledge_index.search(query,k or settings.KNOWLEDGE_TOP_K,owner=str(user_id))
+            if match[1]>=settings.KNOWLEDGE_MIN_SCORE
+        ]
+        findings=load_findings(matches,user_id) if matches else []
+        timing["results"]=len(findings)
+    return findings
+
+
+@registry.register
+class PastResearchTool(BaseTool):
+    name:str="past_research"
+    description:str=(
+        "Search answers KNOWDEX has already researched for this user, with their original sources. Instant and free, "
+        "but only as current as the date shown: use it for evergreen questions and follow-ups, and "
+        "brave_search for anything that changes over time."
+    )
+    parameters:dict={
+        "type":"object",
+        "properties":{"query":{"type":"string","description":"What to look up in past research"}},
+        "required":["query"]
+    }
+    user_scoped:bool=True
+
+    async def run(self,query:str)->str:
+        output,_=await self.run_with_sources(query=query)
+        return output
+
+    async def run_with_sources(self,query:str)->Tuple[str,List[Dict[str,str]]]:
+        findings=await find_past_research(query)
+        if not findings:
+            return "No relevant past research found.",[]
+        record_cache_hit()
+
+        #Near-identical past answers (the same question asked twice) become one passage with both sets of sources
+        if settings.DEDUP_ENABLED:
+            groups=group_near_duplicates(findings,lambda finding:f"{finding['question']} {finding['answer']}")
+        else:
+            groups=[[finding] for finding in findings]
+        if len(groups)<len(findings):
+            collapsed_total.inc(len(findings)-len(groups),kind="past_research")
+
+        blocks=[]
+        cited=[]
+        for n,group in enumerate(groups,1):
+            sources={source["url"]:source for duplicate in group for source in duplicate["sources"]}
+            finding={**group[0],"sources":list(sources.values())}
+            answer=finding["answer"]
+            if len(answer)>settings.KNOWLEDGE_ANSWER_CHARS:
+                answer=answer[:settings.KNOWLEDGE_ANSWER_CHARS].rstrip()+" ..."
+            lines=[
+                f"{n}. Researched on {finding['created_at']:%Y-%m-%d} (relevance {finding['score']:.2f})",
+                f"Question: {finding['question']}",
+                f"Answer: {answer}",
+            ]
+            for source in finding["sources"]:
+                lines.append(f"Source: {source.get('title') or source['url']}\n{source['url']}")
+                if source["url"] not in [c["url"] for c in cited]:
+                    cited.append({"title":source.get("title") or source["url"],"url":source["url"]})
+            blocks.append("\n".join(lines))
+        return "\n\n".join(blocks),cited
@@ -1,9 +1,41 @@
-from typing import List
+"""
+Conversation memory for follow-up questions.
+
+A thread's history reaches the model as a rolling summary of its older
+messages plus the newest messages verbatim, trimmed to MEMORY_TOKEN_BUDGET,
+so a follow-up costs the same however long the thread is. Loading messages
+and storing summaries is done by backend/conversation.py.
+"""
+from typing import List,Optional,Tuple
+from agent.config import settings
 from agent.custom_types import Message
+from agent.scheduler import upstream_slot
+from agent.stages import stage_config
+from agent.utils.accounting import record_llm_usage
+from agent.utils.http import get_openai_client
+from agent.utils.telemetry import span
+
+SUMMARY_PROMPT="""You maintain the running summary of a research conversation.
+Merge the new messages into the current summary. Keep the topics, entities, places,
+dates, numbers and conclusions a follow-up question could refer to, and what the user
+is ultimately after. Drop greetings, progress notes and source lists.
+Write plain sentences, third person, at most 150 words."""
+
+
+def estimate_tokens(text:str)->int:
+    """About four characters per token, close enough for budgeting"""
+    return len(text)//4+1 if text else 0
+
+
+def truncate_tokens(text:str,tokens:int)->str:
+    limit=tokens*4
+    return text if len(text)<=limit else text[:limit].rstrip()+" ..."
+
 
 class ConversationMemory:
-    def __init__(self):
+    def __init__(self,summary:str=""):
         self.messages:List[Message]=[]
+        self.summary=summary
 
     def add(self,role:str,content:str,tool_calls=None,citations=None):
         self.messages.append(Message(
@@ -13,10 +45,65 @@ class ConversationMemory:
             citations=citations or []
         ))
 
+    def tokens(self)->int:
+        return estimate_tokens(self.summary)+sum(estimate_tokens(m.content) for m in self.messages)
+
     def get_openai_format(self):
-        return [
+        history=[{"role":"system","content":f"Summary of the earlier conversation:\n{self.summary}"}] if self.summary else []
+        return history+[
             {"role":m.role,"content":m.content}
             for m in self.messages
         ]
 
-        
\ No newline at end of file
+
+def split_turns(turns:List[Message],budget:int,max_turns:int)->Tuple[List[Message],List[Message]]:
+    """(older,recent): the newest messages that fit the budget verbatim, and everything before them"""
+    used=0
+    keep=0
+    for message in reversed(turns):
+        cost=estimate_tokens(message.content)
+        if keep>=max_turns or used+cost>budget:
+            break
+        used+=cost
+        keep+=1
+    split=len(turns)-keep
+    #Never open the window on an answer whose question was cut off
+    if split<len(turns) and turns[split].role=="assistant":
+        split+=1
+    return turns[:split],turns[split:]
+
+
+def build_memory(
+    summary:str,
+    turns:List[Message],
+    budget:Optional[int]=None,
+    max_turns:Optional[int]=None
+)->Tuple[ConversationMemory,List[Message]]:
+    """Memory for the next prompt, and the older messages that no longer fit and belong in the summary"""
+    budget=settings.MEMORY_TOKEN_BUDGET if budget is None else budget
+    max_turns=settings.MEMORY_MAX_TURNS if max_turns is None else max_turns
+    summary=truncate_tokens(summary,settings.MEMORY_SUMMARY_TOKENS)
+    turns=[Message(role=m.role,content=truncate_tokens(m.content,settings.MEMORY_TURN_TOKENS)) for m in turns]
+    older,recent=split_turns(turns,max(0,budget-estimate_tokens(summary)),max_turns)
+    memory=ConversationMemory(summary=summary)
+    for message in recent:
+        memory.add(message.role,message.content)
+    return memory,older
+
+
+async def summarize_turns(summary:str,turns:List[Message])->str:
+    """Fold messages into the running summary with one small LLM call"""
+    client=get_openai_client()
+    transcript="\n\n".join(f"{m.role.upper()}: {m.content}" for m in turns)
+    stage=stage_config("summary")
+    async with upstream_slot("openai"):
+        with span("llm.memory_summary",upstream="openai",messages=len(turns),model=stage.model):
+            response=await client.chat.completions.create(
+                messages=[
+                    {"role":"system","content":SUMMARY_PROMPT},
+                    {"role":"user","content":f"Current summary:\n{summary or '(none yet)'}\n\nNew messages:\n{transcript}"}
+                ],
+                **stage.request_args()
+            )
+    record_llm_usage(response.model or stage.model,response.usage,stage="summary")
+    return (response.choices[0].message.content or summary).strip()
@@ -0,0 +1,109 @@
+"""
+Prompt assembly, ordered for OpenAI's automatic prompt caching.
+
+The API reuses the longest prefix of a request (tools first, then messages)
+that it has seen recently, once the prompt is at least 1024 tokens. Cached
+input tokens are cheaper and faster. So everything that is the same for
+every request comes first and stays byte-identical: the rules
+(STATIC_SYSTEM_PROMPT) and the tool schemas. Then come the parts that vary,
+from the slowest changing to the fastest: today's date, the conversation,
+the question, and finally the tool calls and results.
+
+Because of this order, the final-answer call starts with the whole prompt
+of the tool-decision call. The next turn of a thread starts with most of
+the previous turn. Both calls send the same tools for the same reason; the
+final one sets tool_choice="none". The date message is rebuilt when the
+date changes, so long-lived workers do not stay on the day they started.
+"""
+from datetime import date
+from functools import lru_cache
+from typing import Dict,Iterable,List,Optional
+from agent.tools.base import BaseTool
+
+#No dates, counters or per-request values in here: any change invalidates every cached prefix
+STATIC_SYSTEM_PROMPT="""
+You are KNOWDEX,the most accurate and up-to-date AI research assistant in Africa.
+Today's date is given in the next system message; "the current year" below means its year.
+STRICT RULES-OBEY EVERY SINGLE ONE:
+1. Never output HTML tags like <strong>,<b>,<em>,<br>,<p> - Use plain text only.
+   Use **bold**  or **italic** with markdown if needed.
+
+2. TIME AWARENESS (THIS IS CRITICAL):
+     - If user says "current","now","today","latest","this year",the current year,"recent news","population now";
+     ONLY use information from January 1 of the current year to today.
+     - If user says "recent" or "in the last few years" - use data from the last five years up to the current year.
+     - For historical questions (e.g,"technologies in Africa since 2000")->go back as far as needed.
+     - Never cite data from earlier years when user wants current info.
+     - Specific month mentioned ("November","January 2024","october this year")->Only news/events from that exact month/year,
+       if no year given -> assume the current year.
+
+3.  Always use brave_search tool FIRST for:
+      .News,Population,Prices,Elections,Funding,Startup,Tech,Policy,Sports,Weather,ETC.
+      . Any question that changes over time
+
+4.  Every factual claim must end with [1],[2],[3] etc.
+
+5.  At the end,list all sources with full title and URL.
+
+6.  Be concise,professional,and extremly accurate.
+
+7.  Always call brave_search first for anything that changes over time(news,population,prices,startups,artists,elections,etc)
+
+8.   Always make sure you complete user question,for example when user asks about USA presidential election and you search the web using brave_search make sure you search the start of the election to the finish of the election.
+
+9.    Always make sure you start the beginning of a user prompt and make sure you search the whole web to get a result
+
+11.  There are informations all over the web,do not say you could not see anything...thye least you can say is maybe they are keeping the information private ,but there would always be rumours
+
+
+10.  You are running in the current year -> act like it.
+
+DO NOT HALLUCINATE.SEARCH FIRST.BE CURRENT.
+
+
+
+"""
+
+BRAVE_SEARCH_TOOL={
+    "type":"function",
+    "function":{
+        "name":"brave_search",
+        "description":"Search the internet for current information",
+        "parameters":{
+            "type":"object",
+            "properties":{
+                "query":{"type":"string","description":"Search query"}
+            },
+            "required":["query"]
+        }
+    }
+}
+
+
+@lru_cache(maxsize=2)
+def _date_text(today:date)->str:
+    return f"Today's date is {today:%B %d,%Y} ({today.year}). Treat today as {today:%B %d,%Y}."
+
+
+def date_message(today:Optional[date]=None)->dict:
+    """The dynamic system message: today's date, rebuilt when the date changes"""
+    return {"role":"system","content":_date_text(today or date.today())}
+
+
+def tool_schemas(tools:Iterable[BaseTool])->List[dict]:
+    """brave_search plus the given registry tools, in a fixed order so the tools prefix stays identical"""
+    return [BRAVE_SEARCH_TOOL]+[
+        {"type":"function","function":{"name":tool.name,"description":tool.description,"parameters":tool.parameters}}
+        for tool in sorted(tools,key=lambda tool:tool.name)
+    ]
+
+
+def build_messages(question:str,history:Optional[List[dict]]=None,today:Optional[date]=None)->List[Dict]:
+    """Static rules, today's date, the conversation so far, the question"""
+    return [
+        {"role":"system","content":STATIC_SYSTEM_PROMPT},
+        date_message(today),
+        *(history or []),
+        {"role":"user","content":question},
+    ]
+
@@ -0,0 +1,266 @@
+"""
+Fair sharing of upstream capacity (OpenAI and Brave calls) between users.
+
+Each upstream has a fixed number of concurrent calls (SCHEDULER_CAPACITY)
+for the whole process. Every call waits in upstream_slot() until it gets
+one, so a user who pastes dozens of questions queues behind their own calls,
+not everyone else's:
+
+  - interactive requests (modes in SCHEDULER_INTERACTIVE_MODES: Chainlit,
+    /api/research) go before batch work (batch, refresh-ahead, memory
+    summaries). SCHEDULER_BATCH_SHARE of the grants still goes to waiting
+    batch work, so it is slowed down, not starved
+  - within a class, users take turns by weighted round-robin: a user with
+    weight 3 (SCHEDULER_WEIGHTS) gets up to 3 calls per turn, others 1.
+    The sessions (chat threads) of a user take turns within its share
+  - a user has at most SCHEDULER_USER_CONCURRENCY calls running per upstream
+
+The user and session come from set_requester() (the Chainlit user and
+thread, the API caller's address); the class from the mode of the tracked
+usage, unless set_requester() fixed it (the batch endpoint always queues as
+batch, whatever mode the client asked for). Wait times per user are in scheduler_stats() (GET
+/api/usage/scheduler), per class in knowdex_scheduler_wait_seconds.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict,deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator,Deque,Dict,Optional,Tuple
+from agent.config import settings
+from agent.utils.accounting import current_usage
+from agent.utils.telemetry import metrics
+
+PRIORITIES=("interactive","batch")
+_STATS_USERS=1000                   #users with wait statistics kept, least recently seen dropped first
+_RECENT_WAITS=256                   #waits per user the percentiles are computed from
+
+_requester:ContextVar[Optional[Tuple[str,str]]]=ContextVar("knowdex_requester",default=None)
+_priority:ContextVar[Optional[str]]=ContextVar("knowdex_priority",default=None)
+wait_seconds=metrics.histogram(
+    "knowdex_scheduler_wait_seconds",
+    "Time upstream calls waited for a fair-share slot, per upstream and class"
+)
+
+
+def set_requester(user:Optional[str],session:Optional[str]=None,priority:Optional[str]=None):
+    """
+    Attribute the upstream calls of the current request (and the tasks it
+    starts) to a user and session; `priority` (one of PRIORITIES) overrides
+    the class the tracked mode would give
+    """
+    if priority is not None and priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority {priority!r}")
+    user=user or "anonymous"
+    _requester.set((user,session or user))
+    _priority.set(priority)
+
+
+def current_requester()->Tuple[str,str]:
+    """(user, session); background jobs and scripts without a requester share "system" """
+    return _requester.get() or ("system","system")
+
+
+def current_priority()->str:
+    forced=_priority.get()
+    if forced is not None:
+        return forced
+    tracked=current_usage()
+    if tracked is None or tracked.mode in settings.SCHEDULER_INTERACTIVE_MODES:
+        return "interactive"
+    return "batch"
+
+
+def _percentile(sorted_values:list,q:float)->float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(1,math.ceil(q/100*len(sorted_values)))-1]
+
+
+class FairScheduler:
+    """The call slots of one upstream, handed out as described in the module docstring"""
+
+    def __init__(self,upstream:str,capacity:int,user_limit:int):
+        self.upstream=upstream
+        self.capacity=max(1,capacity)
+        self.user_limit=max(1,user_limit)
+        self.in_use=0
+        self.running:Dict[str,int]={}
+        #class -> user -> session -> waiting futures; the first user/session is the one whose turn it is
+        self.queues:Dict[str,"OrderedDict[str,OrderedDict[str,Deque[asyncio.Future]]]"]={p:OrderedDict() for p in PRIORITIES}
+        self.credit:Dict[Tuple[str,str],int]={}     #grants left in the current turn of a user
+        self.interactive_streak=0                   #interactive grants in a row while batch work waited
+        self.stats:"OrderedDict[str,dict]"=OrderedDict()
+
+    def weight(self,user:str)->int:
+        return max(1,int(settings.SCHEDULER_WEIGHTS.get(user,1)))
+
+    @asynccontextmanager
+    async def slot(self)->AsyncIterator[None]:
+        user,session=current_requester()
+        priority=current_priority()
+        await self.acquire(user,session,priority)
+        try:
+            yield
+        finally:
+            self.release(user)
+
+    async def acquire(self,user:str,session:str,priority:str):
+        started=time.perf_counter()
+        waiter=asyncio.get_running_loop().create_future()
+        self.queues[priority].setdefault(user,OrderedDict()).setdefault(session,deque()).append(waiter)
+        self._dispatch()
+        try:
+            await waiter        #returns at once when the slot was free
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(user)      #granted just as the caller went away
+            else:
+                self._remove(priority,user,session,waiter)
+            raise
+        self._record(user,priority,time.perf_counter()-started)
+
+    def release(self,user:str):
+        self.in_use-=1
+        running=self.running.get(user,1)-1
+        if running>0:
+            self.running[user]=running
+        else:
+            self.running.pop(user,None)
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.in_use<self.capacity:
+            granted=self._next()
+            if granted is None:
+                return
+            user,waiter=granted
+            self.in_use+=1
+            self.running[user]=self.running.get(user,0)+1
+            waiter.set_result(None)
+
+    def _next(self)->Optional[Tuple[str,asyncio.Future]]:
+        order=PRIORITIES
+        share=settings.SCHEDULER_BATCH_SHARE
+        if share>0 and self.interactive_streak+1>=1/share:
+            order=tuple(reversed(PRIORITIES))
+        for priority in order:
+            granted=self._pop(priority)
+            if granted is not None:
+                if priority=="batch":
+                    self.interactive_streak=0
+                elif self.queues["batch"]:
+                    self.interactive_streak+=1
+                return granted
+        return None
+
+    def _pop(self,priority:str)->Optional[Tuple[str,asyncio.Future]]:
+        """The next waiter of a class by weighted round-robin, skipping users at their concurrency cap"""
+        users=self.queues[priority]
+        skipped=0
+        while users and skipped<len(users):
+            user,sessions=next(iter(users.items()))
+            key=(priority,user)
+            if self.running.get(user,0)>=self.user_limit:
+                users.move_to_end(user)
+                self.credit.pop(key,None)
+                skipped+=1
+                continue
+            session,waiters=next(iter(sessions.items()))
+            waiter=waiters.popleft()
+            if waiters:
+                sessions.move_to_end(session)
+            else:
+                del sessions[session]
+            credit=self.credit.get(key,self.weight(user))-1
+            if not sessions:
+                del users[user]
+                self.credit.pop(key,None)
+            elif credit<=0:
+                users.move_to_end(user)
+                self.credit.pop(key,None)
+            else:
+                self.credit[key]=credit
+            if waiter.done():
+                continue        #cancelled, its caller has not removed it yet
+            return user,waiter
+        return None
+
+    def _remove(self,priority:str,user:str,session:str,waiter:asyncio.Future):
+        sessions=self.queues[priority].get(user)
+        if sessions is None or session not in sessions:
+            return
+        try:
+            sessions[session].remove(waiter)
+        except ValueError:
+            return
+        if not sessions[session]:
+            del sessions[session]
+        if not sessions:
+            del self.queues[priority][user]
+            self.credit.pop((priority,user),None)
+
+    def _record(self,user:str,priority:str,seconds:float):
+        wait_seconds.observe(seconds,upstream=self.upstream,priority=priority)
+        stats=self.stats.get(user)
+        if stats is None:
+            stats=self.stats[user]={"granted":0,"wait_total":0.0,"wait_max":0.0,"recent":deque(maxlen=_RECENT_WAITS)}
+            if len(self.stats)>_STATS_USERS:
+                self.stats.popitem(last=False)
+        else:
+            self.stats.move_to_end(user)
+        stats["granted"]+=1
+        stats["wait_total"]+=seconds
+        stats["wait_max"]=max(stats["wait_max"],seconds)
+        stats["recent"].append(seconds)
+
+    def waiting(self,user:Optional[str]=None)->int:
+        return sum(
+            len(waiters)
+            for queue in self.queues.values()
+            for name,sessions in queue.items() if user is None or name==user
+            for waiters in sessions.values()
+        )
+
+    def snapshot(self)->dict:
+        """Slots in use, calls waiting, and per user: weight, running, waiting, grants and wait times (ms)"""
+        users={}
+        for user,stats in self.stats.items():
+            recent=sorted(stats["recent"])
+            users[user]={
+                "weight":self.weight(user),
+                "running":self.running.get(user,0),
+                "waiting":self.waiting(user),
+                "granted":stats["granted"],
+                "wait_mean_ms":round(stats["wait_total"]/stats["granted"]*1000,1),
+                "wait_p50_ms":round(_percentile(recent,50)*1000,1),
+                "wait_p95_ms":round(_percentile(recent,95)*1000,1),
+                "wait_max_ms":round(stats["wait_max"]*1000,1),
+            }
+        return {"capacity":self.capacity,"in_use":self.in_use,"waiting":self.waiting(),"users":users}
+
+
+_schedulers:Dict[str,FairScheduler]={}
+
+
+def get_scheduler(upstream:str)->FairScheduler:
+    scheduler=_schedulers.get(upstream)
+    if scheduler is None:
+        capacity=settings.SCHEDULER_CAPACITY.get(upstream,settings.SCHEDULER_DEFAULT_CAPACITY)
+        scheduler=_schedulers[upstream]=FairScheduler(upstream,capacity,settings.SCHEDULER_USER_CONCURRENCY)
+    return scheduler
+
+
+@asynccontextmanager
+async def upstream_slot(upstream:str)->AsyncIterator[None]:
+    """Hold one of the upstream's call slots for the duration of the block"""
+    if not settings.SCHEDULER_ENABLED:
+        yield
+        return
+    async with get_scheduler(upstream).slot():
+        yield
+
+
+def scheduler_stats()->Dict[str,dict]:
+    return {upstream:scheduler.snapshot() for upstream,scheduler in _schedulers.items()}
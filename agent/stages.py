@@ -0,0 +1,58 @@
+"""
+Model, token limit and temperature for each LLM stage of a request.
+
+    decision  the first call: which tools to run (latency critical, short output)
+    summary   folding old conversation turns into the thread summary (agent/memory)
+    answer    the final, streamed answer
+
+Each stage has its own settings (DECISION_*, MEMORY_*, ANSWER_*); an unset
+model or limit falls back to MODEL / MAX_TOKENS. MODE_MODELS overrides them
+per request mode, the mode of the tracked usage ("research", "quick",
+"batch", ...), e.g. a small fast model for Quick mode's decisions:
+
+    MODE_MODELS='{"quick":{"decision":{"model":"gpt-4.1-nano","max_tokens":200}}}'
+
+Different models do not share OpenAI's prompt cache, so a separate decision
+model costs the answer call its cached prefix (see agent/prompts.py).
+"""
+from typing import Optional
+from pydantic import BaseModel
+from agent.config import settings
+from agent.utils.accounting import current_usage
+
+STAGES=("decision","summary","answer")
+
+
+class StageConfig(BaseModel):
+    stage:str
+    model:str
+    max_tokens:Optional[int]=None      #None or 0: no limit sent
+    temperature:float=0.0
+
+    def request_args(self)->dict:
+        """Keyword arguments for chat.completions.create"""
+        args={"model":self.model,"temperature":self.temperature}
+        if self.max_tokens:
+            args["max_tokens"]=self.max_tokens
+        return args
+
+
+def _defaults(stage:str)->dict:
+    if stage=="decision":
+        return {"model":settings.DECISION_MODEL or settings.MODEL,"max_tokens":settings.DECISION_MAX_TOKENS}
+    if stage=="summary":
+        return {"model":settings.MEMORY_MODEL or settings.MODEL,"max_tokens":settings.MEMORY_SUMMARY_TOKENS}
+    if stage=="answer":
+        max_tokens=settings.MAX_TOKENS if settings.ANSWER_MAX_TOKENS is None else settings.ANSWER_MAX_TOKENS
+        return {"model":settings.ANSWER_MODEL or settings.MODEL,"max_tokens":max_tokens}
+    raise ValueError(f"stage must be one of {', '.join(STAGES)}")
+
+
+def stage_config(stage:str,mode:Optional[str]=None)->StageConfig:
+    """Settings of a stage for `mode`, by default the mode of the request being tracked"""
+    if mode is None:
+        tracked=current_usage()
+        mode=tracked.mode if tracked is not None else None
+    values={"stage":stage,"temperature":settings.TEMPERATURE,**_defaults(stage)}
+    values.update((settings.MODE_MODELS.get(mode) or {}).get(stage) or {})
+    return StageConfig(**values)
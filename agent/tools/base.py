@@ -1,10 +1,16 @@
 from pydantic import BaseModel
-from typing import Any,Dict
+from typing import Any,Dict,List,Tuple
 
 class BaseTool(BaseModel):
     name:str
     description:str
     parameters:Dict[str,Any]
+    #Output built from the requesting user's own data: answers that used it are not shared through the answer cache
+    user_scoped:bool=False
 
     async def run(self,**kwargs)->str:
-        raise NotImplementedError(f"Tool {self.name} not implemented.")
\ No newline at end of file
+        raise NotImplementedError(f"Tool {self.name} not implemented.")
+
+    async def run_with_sources(self,**kwargs)->Tuple[str,List[Dict[str,str]]]:
+        """Output plus the {title,url} sources it cites, for tools whose results can be cited"""
+        return await self.run(**kwargs),[]
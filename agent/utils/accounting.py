@@ -0,0 +1,133 @@
+"""
+Per-request token, search and cost accounting.
+
+The caller starts a RequestUsage with track_usage() before running the agent.
+The agent and its tools then add to it through the module functions, which
+find it in a ContextVar and do nothing when no request is being tracked
+(scripts, tests). Costs are estimates based on the price table in settings.
+"""
+import time
+from contextvars import ContextVar
+from typing import Any,Dict,Optional
+from pydantic import BaseModel,Field
+from agent.config import settings
+from agent.utils.telemetry import metrics
+
+_current_usage:ContextVar[Optional["RequestUsage"]]=ContextVar("knowdex_usage",default=None)
+prompt_tokens_total=metrics.counter(
+    "knowdex_llm_prompt_tokens_total",
+    "Prompt tokens sent to the LLM by model and stage, and whether the upstream prompt cache served them (cached=true)"
+)
+
+
+class RequestUsage(BaseModel):
+    mode:str="research"
+    model:Optional[str]=None
+    prompt_tokens:int=0
+    cached_tokens:int=0                 #of prompt_tokens, served from the upstream prompt cache
+    completion_tokens:int=0
+    llm_calls:int=0
+    search_calls:int=0
+    cached_searches:int=0
+    cache_hits:int=0
+    cost_usd:float=0.0
+    #Per LLM stage (agent/stages.py): model, calls and tokens
+    stages:Dict[str,Dict[str,Any]]=Field(default_factory=dict)
+    started_at:float=Field(default_factory=time.perf_counter)
+    finished_at:Optional[float]=None
+
+    @property
+    def total_tokens(self)->int:
+        return self.prompt_tokens+self.completion_tokens
+
+    @property
+    def duration_ms(self)->float:
+        return ((self.finished_at or time.perf_counter())-self.started_at)*1000
+
+    def finish(self):
+        if self.finished_at is None:
+            self.finished_at=time.perf_counter()
+
+
+def track_usage(mode:str="research")->RequestUsage:
+    """Start accounting for the current request; later calls in this context add to it"""
+    usage=RequestUsage(mode=mode)
+    _current_usage.set(usage)
+    return usage
+
+
+def current_usage()->Optional[RequestUsage]:
+    return _current_usage.get()
+
+
+def model_price(model:str)->dict:
+    """USD per million input/output tokens; dated snapshots match their base model name"""
+    prices=settings.MODEL_PRICES
+    if model in prices:
+        return prices[model]
+    matches=[name for name in prices if model.startswith(name)]
+    if matches:
+        return prices[max(matches,key=len)]
+    return prices.get(settings.MODEL,{"input":0.0,"output":0.0})
+
+
+def estimate_llm_cost(model:str,prompt_tokens:int,completion_tokens:int,cached_tokens:int=0)->float:
+    price=model_price(model)
+    cached_price=price.get("cached_input",price["input"])
+    return ((prompt_tokens-cached_tokens)*price["input"]+cached_tokens*cached_price+completion_tokens*price["output"])/1_000_000
+
+
+def cached_prompt_tokens(usage:Any)->int:
+    """usage.prompt_tokens_details.cached_tokens, 0 when the upstream does not report it"""
+    details=getattr(usage,"prompt_tokens_details",None)
+    if isinstance(details,dict):
+        return details.get("cached_tokens") or 0
+    return getattr(details,"cached_tokens",0) or 0
+
+
+def record_llm_usage(model:str,usage:Any,stage:Optional[str]=None):
+    """Add the `usage` block of an OpenAI chat completion to the current request, under its stage when given"""
+    if usage is None:
+        return
+    prompt_tokens=getattr(usage,"prompt_tokens",0) or 0
+    cached_tokens=min(cached_prompt_tokens(usage),prompt_tokens)
+    completion_tokens=getattr(usage,"completion_tokens",0) or 0
+    prompt_tokens_total.inc(prompt_tokens-cached_tokens,model=model,stage=stage or "other",cached="false")
+    prompt_tokens_total.inc(cached_tokens,model=model,stage=stage or "other",cached="true")
+    tracked=current_usage()
+    if tracked is None:
+        return
+    tracked.model=tracked.model or model
+    tracked.llm_calls+=1
+    tracked.prompt_tokens+=prompt_tokens
+    tracked.cached_tokens+=cached_tokens
+    tracked.completion_tokens+=completion_tokens
+    tracked.cost_usd+=estimate_llm_cost(model,prompt_tokens,completion_tokens,cached_tokens)
+    if stage:
+        totals=tracked.stages.setdefault(
+            stage,{"model":model,"calls":0,"prompt_tokens":0,"cached_tokens":0,"completion_tokens":0}
+        )
+        totals["calls"]+=1
+        totals["prompt_tokens"]+=prompt_tokens
+        totals["cached_tokens"]+=cached_tokens
+        totals["completion_tokens"]+=completion_tokens
+
+
+def record_search(cached:bool=False,billed:bool=True):
+    """Count one search; only paid searches that reached the upstream API add to the cost"""
+    tracked=current_usage()
+    if tracked is None:
+        return
+    tracked.search_calls+=1
+    if cached:
+        tracked.cached_searches+=1
+        tracked.cache_hits+=1
+    elif billed:
+        tracked.cost_usd+=settings.SEARCH_PRICE_USD
+
+
+def record_cache_hit():
+    """Count an LLM or fetch result served from a cache instead of an upstream"""
+    tracked=current_usage()
+    if tracked is not None:
+        tracked.cache_hits+=1
@@ -0,0 +1,402 @@
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any,Dict,Hashable,List,Optional,Tuple
+from agent.utils.jsoncodec import dumps,dumps_bytes,loads
+from agent.utils.telemetry import log_event,metrics
+
+lookups_total=metrics.counter(
+    "knowdex_cache_lookups_total",
+    "Lookups in the tiered caches by cache, tier (memory, disk) and result (hit, miss)"
+)
+
+
+class TTLCache:
+    """
+    Bounded in-memory LRU cache whose entries expire after a TTL.
+    Safe to share between threads (sync callbacks, to_thread workers) and
+    coroutines; every operation is O(1) under a single lock.
+    """
+
+    def __init__(self,maxsize:int=1024,ttl:float=300.0):
+        self.maxsize=maxsize
+        self.ttl=ttl
+        self._data:"OrderedDict[Hashable,tuple]"=OrderedDict()
+        self._lock=threading.Lock()
+        self.hits=0
+        self.misses=0
+
+    def get(self,key:Hashable,default:Any=None)->Any:
+        with self._lock:
+            entry=self._data.get(key)
+            if entry is None:
+                self.misses+=1
+                return default
+            value,expires_at=entry
+            if expires_at<=time.monotonic():
+                del self._data[key]
+                self.misses+=1
+                return default
+            self._data.move_to_end(key)
+            self.hits+=1
+            return value
+
+    def set(self,key:Hashable,value:Any,ttl:Optional[float]=None):
+        with self._lock:
+            self._data[key]=(value,time.monotonic()+(self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data)>self.maxsize:
+                self._data.popitem(last=False)
+
+    def expires_in(self,key:Hashable)->Optional[float]:
+        """Seconds until the entry expires (None when absent); does not count as a hit or refresh LRU order"""
+        with self._lock:
+            entry=self._data.get(key)
+            if entry is None:
+                return None
+            return max(0.0,entry[1]-time.monotonic())
+
+    def expiring(self,within:float)->List[Tuple[Hashable,Any,float]]:
+        """(key,value,seconds left) of live entries that expire within `within` seconds"""
+        now=time.monotonic()
+        with self._lock:
+            return [
+                (key,value,expires_at-now)
+                for key,(value,expires_at) in self._data.items()
+                if now<expires_at<=now+within
+            ]
+
+    def invalidate(self,key:Hashable):
+        with self._lock:
+            self._data.pop(key,None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self)->int:
+        return len(self._data)
+
+    def stats(self)->dict:
+        return {"size":len(self._data),"hits":self.hits,"misses":self.misses}
+
+
+class PopularityCounter:
+    """
+    Hit counts that decay exponentially: a key's score halves every
+    `half_life` seconds without hits, so it reflects recent demand. Bounded;
+    the coldest keys are dropped first.
+    """
+
+    def __init__(self,half_life:float=3600.0,maxsize:int=10000):
+        self.half_life=half_life
+        self.maxsize=maxsize
+        self._data:Dict[Hashable,List[float]]={}
+        self._lock=threading.Lock()
+
+    def _decayed(self,entry:List[float],now:float)->float:
+        return entry[0]*0.5**((now-entry[1])/self.half_life)
+
+    def hit(self,key:Hashable,weight:float=1.0):
+        now=time.monotonic()
+        with self._lock:
+            entry=self._data.get(key)
+            if entry is None:
+                self._data[key]=[weight,now]
+                if len(self._data)>self.maxsize:
+                    self._evict(now)
+            else:
+                entry[0]=self._decayed(entry,now)+weight
+                entry[1]=now
+
+    def _evict(self,now:float):
+        #Drop the coldest tenth at once, so eviction stays rare
+        ranked=sorted(self._data,key=lambda key:self._decayed(self._data[key],now))
+        for key in ranked[:max(1,len(ranked)//10)]:
+            del self._data[key]
+
+    def score(self,key:Hashable)->float:
+        with self._lock:
+            entry=self._data.get(key)
+            return self._decayed(entry,time.monotonic()) if entry else 0.0
+
+    def top(self,n:int=10)->List[Tuple[Hashable,float]]:
+        now=time.monotonic()
+        with self._lock:
+            scored=[(key,self._decayed(entry,now)) for key,entry in self._data.items()]
+        return sorted(scored,key=lambda item:item[1],reverse=True)[:n]
+
+    def __len__(self)->int:
+        return len(self._data)
+
+
+class SqliteCache:
+    """
+    TTL cache in one SQLite file, shared by every process on the host that
+    opens the same path (uvicorn and Chainlit workers) and kept across
+    restarts. Values are stored as JSON, in namespaces (one per cache).
+
+    Nothing here waits on another process's lock, so the cache is safe to
+    call from the event loop. Reads use WAL snapshots, which a writer never
+    blocks. When the file is busy anyway (a checkpoint, recovery), a read
+    counts as a miss instead of waiting (read_timeout, 0 by default). Sets
+    and deletes are queued for one writer thread per process, which may wait
+    up to busy_timeout for the lock. Every `prune_every` writes, that thread
+    also deletes expired rows. Above `max_bytes` it drops the rows that
+    expire soonest until the data is back under 90% of the limit. A full
+    queue drops the write. A failing disk tier (disk full, say) is logged
+    and treated as a miss; the memory tier keeps working.
+    """
+
+    def __init__(self,path:str,max_bytes:int=256*1024*1024,prune_every:int=200,busy_timeout:float=0.5,
+                 read_timeout:float=0.0,max_pending:int=10000):
+        self.path=path
+        self.max_bytes=max_bytes
+        self.prune_every=prune_every
+        self.busy_timeout=busy_timeout
+        self.read_timeout=read_timeout
+        self._local=threading.local()
+        self._lock=threading.Lock()
+        self._pending:"queue.Queue[Optional[tuple]]"=queue.Queue(maxsize=max_pending)
+        self._writer:Optional[threading.Thread]=None
+        self._writes=0
+        self.errors=0
+        self.busy=0         #reads and claims that found the file locked and gave up
+        self.dropped=0      #writes dropped because the queue was full
+
+    def _connect(self)->sqlite3.Connection:
+        conn=getattr(self._local,"conn",None)
+        if conn is None:
+            directory=os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory,exist_ok=True)
+            conn=sqlite3.connect(self.path,timeout=self.busy_timeout,isolation_level=None,check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")     #a crash can lose the last writes, never corrupt the file
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries("
+                "namespace TEXT NOT NULL,key TEXT NOT NULL,value BLOB NOT NULL,"
+                "expires_at REAL NOT NULL,size INTEGER NOT NULL,PRIMARY KEY(namespace,key)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entries_expires_at ON cache_entries(expires_at)")
+            #Opening may wait (once per thread, warmed up at startup); afterwards only the writer thread does
+            if threading.current_thread() is not self._writer:
+                conn.execute(f"PRAGMA busy_timeout={int(self.read_timeout*1000)}")
+            self._local.conn=conn
+        return conn
+
+    def _failed(self,operation:str,error:Exception):
+        if getattr(error,"sqlite_errorcode",None) in (sqlite3.SQLITE_BUSY,sqlite3.SQLITE_LOCKED):
+            self.busy+=1        #contention, expected now and then: not worth a log line
+            return
+        self.errors+=1
+        log_event("disk_cache_error",level=logging.WARNING,path=self.path,operation=operation,error=str(error))
+
+    def get(self,namespace:str,key:str)->Optional[Tuple[Any,float]]:
+        """(value, expires_at as time.time()) of a live entry, else None"""
+        try:
+            row=self._connect().execute(
+                "SELECT value,expires_at FROM cache_entries WHERE namespace=? AND key=? AND expires_at>?",
+                (namespace,key,time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            self._failed("get",e)
+            return None
+        return (loads(row[0]),row[1]) if row else None
+
+    def set(self,namespace:str,key:str,value:Any,ttl:float):
+        """Queued: readers (other processes too) see it once the writer thread got to it"""
+        self._enqueue(("set",namespace,key,dumps_bytes(value,default=str),time.time()+ttl))
+
+    def delete(self,namespace:str,key:Optional[str]=None):
+        """One entry, or the whole namespace when key is None (queued, in order with the sets)"""
+        self._enqueue(("delete",namespace,key))
+
+    def claim(self,namespace:str,key:str,ttl:float,limit:Optional[int]=None)->bool:
+        """
+        Atomically take `key` for `ttl` seconds, for the processes sharing the
+        file: True for exactly one caller until the claim expires. With
+        `limit`, also False while the namespace has that many live claims.
+        Writes directly, so call it off the event loop (asyncio.to_thread);
+        a locked file counts as not claimed.
+        """
+        now=time.time()
+        try:
+            conn=self._connect()
+            conn.execute("DELETE FROM cache_entries WHERE namespace=? AND key=? AND expires_at<=?",(namespace,key,now))
+            #One statement, so counting and inserting cannot interleave with another process's claim
+            return conn.execute(
+                "INSERT OR IGNORE INTO cache_entries(namespace,key,value,expires_at,size) "
+                "SELECT ?,?,?,?,? WHERE (SELECT COUNT(*) FROM cache_entries WHERE namespace=? AND expires_at>?)<?",
+                (namespace,key,b"1",now+ttl,len(key)+1,namespace,now,limit if limit is not None else 2**62)
+            ).rowcount==1
+        except sqlite3.Error as e:
+            self._failed("claim",e)
+            return False
+
+    def flush(self):
+        """Wait until every queued write is in the file"""
+        if self._writer is not None:
+            self._pending.join()
+
+    def _enqueue(self,operation:tuple):
+        with self._lock:
+            if self._writer is None:
+                self._writer=threading.Thread(target=self._write_loop,name="knowdex-disk-cache",daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+        try:
+            self._pending.put_nowait(operation)
+        except queue.Full:
+            self.dropped+=1
+
+    def _write_loop(self):
+        while True:
+            operation=self._pending.get()
+            try:
+                self._write(operation)
+            finally:
+                self._pending.task_done()
+
+    def _write(self,operation:tuple):
+        kind,namespace,key=operation[:3]
+        try:
+            conn=self._connect()
+            if kind=="set":
+                data,expires_at=operation[3:]
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache_entries(namespace,key,value,expires_at,size) VALUES (?,?,?,?,?)",
+                    (namespace,key,data,expires_at,len(key)+len(data))
+                )
+            elif key is None:
+                conn.execute("DELETE FROM cache_entries WHERE namespace=?",(namespace,))
+            else:
+                conn.execute("DELETE FROM cache_entries WHERE namespace=? AND key=?",(namespace,key))
+        except sqlite3.Error as e:
+            self._failed(kind,e)
+            return
+        if kind=="set":
+            self._writes+=1
+            if self._writes%self.prune_every==0:
+                self.prune()
+
+    def prune(self)->int:
+        """Delete expired entries, then the soonest to expire while over max_bytes; returns how many (the writer thread runs it)"""
+        try:
+            conn=self._connect()
+            removed=conn.execute("DELETE FROM cache_entries WHERE expires_at<=?",(time.time(),)).rowcount
+            total=conn.execute("SELECT COALESCE(SUM(size),0) FROM cache_entries").fetchone()[0]
+            while total>self.max_bytes*0.9:
+                rows=conn.execute(
+                    "SELECT namespace,key,size FROM cache_entries ORDER BY expires_at LIMIT 100"
+                ).fetchall()
+                if not rows:
+                    break
+                conn.executemany("DELETE FROM cache_entries WHERE namespace=? AND key=?",[row[:2] for row in rows])
+                removed+=len(rows)
+                total-=sum(row[2] for row in rows)
+        except sqlite3.Error as e:
+            self._failed("prune",e)
+            return 0
+        return removed
+
+    def stats(self,namespace:Optional[str]=None)->dict:
+        try:
+            query="SELECT COUNT(*),COALESCE(SUM(size),0) FROM cache_entries WHERE expires_at>?"
+            params:tuple=(time.time(),)
+            if namespace is not None:
+                query+=" AND namespace=?"
+                params+=(namespace,)
+            entries,size=self._connect().execute(query,params).fetchone()
+        except sqlite3.Error as e:
+            self._failed("stats",e)
+            entries,size=None,None
+        return {
+            "size":entries,"bytes":size,"errors":self.errors,"busy":self.busy,
+            "pending":self._pending.qsize(),"dropped":self.dropped,
+        }
+
+
+class TieredCache:
+    """
+    A TTLCache (memory tier) in front of a shared SqliteCache (disk tier),
+    with the same interface as TTLCache. Reads try memory, then disk; a disk
+    hit is copied into memory for the rest of its TTL. Writes go to both.
+    Keys must be JSON-serializable (strings, numbers, tuples of them).
+
+    expiring() only sees the memory tier: the entries this process serves.
+    """
+
+    def __init__(self,memory:TTLCache,disk:SqliteCache,namespace:str):
+        self.memory=memory
+        self.disk=disk
+        self.namespace=namespace
+        self.ttl=memory.ttl
+        self.disk_hits=0
+        self.disk_misses=0
+
+    @staticmethod
+    def _disk_key(key:Hashable)->str:
+        return key if isinstance(key,str) else dumps(key)
+
+    def get(self,key:Hashable,default:Any=None)->Any:
+        missing=object()
+        value=self.memory.get(key,missing)
+        if value is not missing:
+            lookups_total.inc(cache=self.namespace,tier="memory",result="hit")
+            return value
+        lookups_total.inc(cache=self.namespace,tier="memory",result="miss")
+        entry=self.disk.get(self.namespace,self._disk_key(key))
+        if entry is None:
+            self.disk_misses+=1
+            lookups_total.inc(cache=self.namespace,tier="disk",result="miss")
+            return default
+        self.disk_hits+=1
+        lookups_total.inc(cache=self.namespace,tier="disk",result="hit")
+        value,expires_at=entry
+        self.memory.set(key,value,ttl=max(0.0,expires_at-time.time()))
+        return value
+
+    def set(self,key:Hashable,value:Any,ttl:Optional[float]=None):
+        ttl=self.ttl if ttl is None else ttl
+        self.memory.set(key,value,ttl=ttl)
+        self.disk.set(self.namespace,self._disk_key(key),value,ttl)
+
+    def expires_in(self,key:Hashable)->Optional[float]:
+        return self.memory.expires_in(key)
+
+    def claim(self,key:Hashable,ttl:float)->bool:
+        """Take an entry for `ttl` seconds across the processes sharing the disk tier (SqliteCache.claim)"""
+        return self.disk.claim(f"{self.namespace}:claims",self._disk_key(key),ttl)
+
+    def expiring(self,within:float)->List[Tuple[Hashable,Any,float]]:
+        return self.memory.expiring(within)
+
+    def invalidate(self,key:Hashable):
+        self.memory.invalidate(key)
+        self.disk.delete(self.namespace,self._disk_key(key))
+
+    def clear(self):
+        self.memory.clear()
+        self.disk.delete(self.namespace)
+
+    def __len__(self)->int:
+        return len(self.memory)
+
+    def stats(self)->dict:
+        """Combined hits/misses (a miss missed both tiers), plus each tier's own"""
+        memory=self.memory.stats()
+        return {
+            "size":memory["size"],
+            "hits":memory["hits"]+self.disk_hits,
+            "misses":self.disk_misses,
+            "tiers":{
+                "memory":memory,
+                "disk":{**self.disk.stats(self.namespace),"hits":self.disk_hits,"misses":self.disk_misses},
+            },
+        }
@@ -0,0 +1,109 @@
+"""
+Near-duplicate detection for search snippets and passages (MinHash + LSH).
+
+News searches often return the same wire story from several outlets with
+slightly different wording around it. Each text is cut into overlapping
+word shingles. The shingles are hashed with DEDUP_NUM_PERM multiply-shift
+hash functions, and the minimum of each one forms the MinHash signature.
+The share of equal positions in two signatures estimates the Jaccard
+similarity of their shingle sets.
+
+Signatures are split into bands for lookup, so only texts that agree on a
+whole band are compared. A text joins the first earlier text whose
+estimated similarity reaches DEDUP_THRESHOLD; the caller then keeps one
+passage per group together with every source URL in it.
+"""
+import re
+import zlib
+from typing import Callable,Dict,List,Optional,Tuple,TypeVar
+import numpy as np
+from agent.config import settings
+from agent.utils.telemetry import metrics
+
+T=TypeVar("T")
+
+_WORD_RE=re.compile(r"\w+")
+_MAX_HASH=np.uint64(0xFFFFFFFF)
+
+collapsed_total=metrics.counter(
+    "knowdex_dedup_collapsed_total",
+    "Passages folded into a near-duplicate shown earlier, by kind (search, past_research)"
+)
+
+
+def shingles(text:str,size:int)->List[str]:
+    words=_WORD_RE.findall(text.lower())
+    if len(words)<=size:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i:i+size]) for i in range(len(words)-size+1)]
+
+
+class NearDuplicateIndex:
+    """
+    Groups of texts seen so far, e.g. over all searches of one research run.
+    find() looks a signature up, add() starts a new group with it.
+    """
+
+    def __init__(self,threshold:Optional[float]=None,num_perm:Optional[int]=None,shingle_size:Optional[int]=None):
+        self.threshold=threshold if threshold is not None else settings.DEDUP_THRESHOLD
+        self.num_perm=num_perm or settings.DEDUP_NUM_PERM
+        self.shingle_size=shingle_size or settings.DEDUP_SHINGLE_SIZE
+        #Two rows per band: a pair at 0.6 similarity shares a band with p=1-(1-0.6**2)**(num_perm/2)~1;
+        #candidates are verified on the full signature anyway
+        self.rows=2
+        self.bands=self.num_perm//self.rows
+        random=np.random.default_rng(1)
+        #Odd multipliers make x -> a*x+b (mod 2^64) a permutation; the high 32 bits are the hash
+        self._a=random.integers(1,2**63,self.num_perm,dtype=np.uint64)|np.uint64(1)
+        self._b=random.integers(0,2**63,self.num_perm,dtype=np.uint64)
+        self._signatures:List[Optional[np.ndarray]]=[]
+        self._buckets:Dict[Tuple[int,bytes],List[int]]={}
+
+    def signature(self,text:str)->Optional[np.ndarray]:
+        hashed=np.array(
+            [zlib.crc32(shingle.encode("utf-8")) for shingle in set(shingles(text,self.shingle_size))],
+            dtype=np.uint64
+        )
+        if not len(hashed):
+            return None
+        with np.errstate(over="ignore"):
+            permuted=(hashed[:,None]*self._a+self._b)>>np.uint64(32)
+        return (permuted&_MAX_HASH).min(axis=0).astype(np.uint32)
+
+    def similarity(self,left:np.ndarray,right:np.ndarray)->float:
+        return float(np.count_nonzero(left==right))/self.num_perm
+
+    def _bands(self,signature:np.ndarray)->List[Tuple[int,bytes]]:
+        return [(band,signature[band*self.rows:(band+1)*self.rows].tobytes()) for band in range(self.bands)]
+
+    def find(self,signature:Optional[np.ndarray])->Optional[int]:
+        """The earliest group this signature is a near-duplicate of"""
+        if signature is None:
+            return None
+        candidates=sorted({group for key in self._bands(signature) for group in self._buckets.get(key,())})
+        for group in candidates:
+            if self.similarity(signature,self._signatures[group])>=self.threshold:
+                return group
+        return None
+
+    def add(self,signature:Optional[np.ndarray])->int:
+        """Start a new group; a text without words (signature None) gets a group nothing can join"""
+        group=len(self._signatures)
+        self._signatures.append(signature)
+        if signature is not None:
+            for key in self._bands(signature):
+                self._buckets.setdefault(key,[]).append(group)
+        return group
+
+
+def group_near_duplicates(items:List[T],text:Callable[[T],str],index:Optional[NearDuplicateIndex]=None)->List[List[T]]:
+    """Items grouped with their near-duplicates, groups in first-seen order"""
+    index=index or NearDuplicateIndex()
+    groups:Dict[int,List[T]]={}
+    for item in items:
+        signature=index.signature(text(item))
+        group=index.find(signature)
+        if group is None:
+            group=index.add(signature)
+        groups.setdefault(group,[]).append(item)
+    return list(groups.values())
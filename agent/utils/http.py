@@ -0,0 +1,293 @@
+"""
+Shared HTTP client with an offline record/replay mode.
+
+Every upstream call (OpenAI, Brave, Wikipedia) goes through one pooled
+httpx.AsyncClient per event loop. Its transport depends on HTTP_MODE:
+
+    live    talk to the network
+    record  talk to the network and append every exchange to a cassette
+    replay  never touch the network, serve exchanges from the cassette
+
+A cassette is a JSON file in CASSETTE_DIR. Exchanges are matched on method,
+URL and a hash of the request body. Requests that changed since recording
+(the system prompt carries today's date) fall back to the next unused
+exchange for the same host and path, in recorded order. Streaming responses
+are kept chunk by chunk, so a replayed SSE stream arrives in the same pieces.
+Replay can add latency and jitter (seeded, so runs are repeatable).
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+import threading
+import weakref
+from contextlib import asynccontextmanager,contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator,Dict,Iterator,List,Optional
+from urllib.parse import urlencode,urlsplit,parse_qsl
+import httpx
+from agent.config import settings
+
+#Response headers that describe the original transfer, not the content we hand back
+_DROPPED_HEADERS={"content-encoding","content-length","transfer-encoding","connection","set-cookie"}
+
+_cassette_name:ContextVar[Optional[str]]=ContextVar("knowdex_cassette",default=None)
+_clients:"weakref.WeakKeyDictionary[asyncio.AbstractEventLoop,httpx.AsyncClient]"=weakref.WeakKeyDictionary()
+
+
+class CassetteMissError(httpx.TransportError):
+    """Replay found no recorded exchange for a request"""
+
+
+# ==================== CASSETTES ====================
+
+def _normalized_url(url:httpx.URL)->str:
+    parts=urlsplit(str(url))
+    query=urlencode(sorted(parse_qsl(parts.query,keep_blank_values=True)))
+    return f"{parts.scheme}://{parts.netloc}{parts.path}"+(f"?{query}" if query else "")
+
+
+def _route(url:httpx.URL)->str:
+    parts=urlsplit(str(url))
+    return f"{parts.netloc}{parts.path}"
+
+
+def request_key(request:httpx.Request)->str:
+    digest=hashlib.sha256(request.content or b"").hexdigest()[:16]
+    return f"{request.method} {_normalized_url(request.url)} {digest}"
+
+
+def _encode_chunk(chunk:bytes)->str:
+    return base64.b64encode(chunk).decode("ascii")
+
+
+class Cassette:
+    """One cassette file: recorded exchanges plus which ones replay has used"""
+
+    def __init__(self,path:str):
+        self.path=path
+        self.interactions:List[dict]=[]
+        self._used:set=set()
+        self._lock=threading.Lock()
+        if os.path.exists(path):
+            with open(path,"r",encoding="utf-8") as f:
+                self.interactions=json.load(f).get("interactions",[])
+
+    def append(self,interaction:dict):
+        with self._lock:
+            self.interactions.append(interaction)
+            self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".",exist_ok=True)
+        tmp_path=f"{self.path}.tmp"
+        with open(tmp_path,"w",encoding="utf-8") as f:
+            json.dump({"version":1,"interactions":self.interactions},f,indent=1)
+        os.replace(tmp_path,self.path)
+
+    def take(self,request:httpx.Request)->Optional[dict]:
+        """Next unused exchange for this request: exact match first, then same route in order"""
+        key=request_key(request)
+        route=_route(request.url)
+        with self._lock:
+            for matches in (
+                lambda item:item["key"]==key,
+                lambda item:item["method"]==request.method and item["route"]==route,
+            ):
+                for index,item in enumerate(self.interactions):
+                    if index not in self._used and matches(item):
+                        self._used.add(index)
+                        return item
+        return None
+
+    def rewind(self):
+        with self._lock:
+            self._used.clear()
+
+
+_cassettes:Dict[str,Cassette]={}
+_cassettes_lock=threading.Lock()
+
+
+def get_cassette(name:Optional[str]=None)->Cassette:
+    name=name or _cassette_name.get() or settings.CASSETTE_NAME
+    path=os.path.join(settings.CASSETTE_DIR,f"{name}.json")
+    with _cassettes_lock:
+        if path not in _cassettes:
+            _cassettes[path]=Cassette(path)
+        return _cassettes[path]
+
+
+@contextmanager
+def use_cassette(name:str)->Iterator[Cassette]:
+    """Record into / replay from a named cassette for the code in this block"""
+    token=_cassette_name.set(name)
+    try:
+        yield get_cassette(name)
+    finally:
+        _cassette_name.reset(token)
+
+
+# ==================== TRANSPORTS ====================
+
+class _ChunkStream(httpx.AsyncByteStream):
+    def __init__(self,chunks:List[bytes],delays:Optional[List[float]]=None):
+        self.chunks=chunks
+        self.delays=delays
+
+    async def __aiter__(self)->AsyncIterator[bytes]:
+        for index,chunk in enumerate(self.chunks):
+            if self.delays and self.delays[index]>0:
+                await asyncio.sleep(self.delays[index])
+            yield chunk
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Forwards to the network and appends each exchange to the current cassette"""
+
+    def __init__(self,inner:httpx.AsyncBaseTransport):
+        self.inner=inner
+
+    async def handle_async_request(self,request:httpx.Request)->httpx.Response:
+        loop=asyncio.get_running_loop()
+        started=loop.time()
+        response=await self.inner.handle_async_request(request)
+        chunks,delays=[],[]
+        last=started
+        try:
+            async for chunk in response.stream:
+                now=loop.time()
+                chunks.append(chunk)
+                delays.append(round(now-last,4))
+                last=now
+        finally:
+            await response.aclose()
+
+        headers=[(k,v) for k,v in response.headers.multi_items() if k.lower() not in _DROPPED_HEADERS]
+        get_cassette().append({
+            "key":request_key(request),
+            "method":request.method,
+            "route":_route(request.url),
+            "url":_normalized_url(request.url),
+            "status":response.status_code,
+            "headers":headers,
+            "chunks":[_encode_chunk(chunk) for chunk in chunks],
+            "delays":delays,
+        })
+        return httpx.Response(
+            response.status_code,
+            headers=headers,
+            stream=_ChunkStream(chunks),
+            request=request,
+        )
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """Serves recorded exchanges; never opens a connection"""
+
+    def __init__(self,latency_ms:float=0.0,jitter_ms:float=0.0,realtime:bool=False,seed:int=0):
+        self.latency=latency_ms/1000
+        self.jitter=jitter_ms/1000
+        self.realtime=realtime
+        self._random=random.Random(seed)
+
+    async def handle_async_request(self,request:httpx.Request)->httpx.Response:
+        interaction=get_cassette().take(request)
+        if interaction is None:
+            raise CassetteMissError(f"No recorded response for {request.method} {request.url}",request=request)
+
+        delay=self.latency+self._random.uniform(-self.jitter,self.jitter)
+        if delay>0:
+            await asyncio.sleep(delay)
+        chunks=[base64.b64decode(chunk) for chunk in interaction["chunks"]]
+        return httpx.Response(
+            interaction["status"],
+            headers=interaction["headers"],
+            stream=_ChunkStream(chunks,interaction.get("delays") if self.realtime else None),
+            request=request,
+        )
+
+
+class PinnedAddressTransport(httpx.AsyncBaseTransport):
+    """
+    Connects to request.extensions["pinned_address"] when given, instead of
+    resolving the host again, so a host checked by its resolved address
+    cannot be re-pointed between the check and the connection. The Host
+    header and the TLS server name (sni_hostname) stay the original host.
+    """
+
+    def __init__(self,inner:httpx.AsyncBaseTransport):
+        self.inner=inner
+
+    async def handle_async_request(self,request:httpx.Request)->httpx.Response:
+        address=request.extensions.get("pinned_address")
+        if address:
+            #A copy, so the client and the recorder still see the URL with its host name
+            request=httpx.Request(
+                request.method,
+                request.url.copy_with(host=address),
+                headers=request.headers,
+                stream=request.stream,
+                extensions={**request.extensions,"sni_hostname":request.url.host},
+            )
+        return await self.inner.handle_async_request(request)
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+def build_transport(mode:Optional[str]=None)->httpx.AsyncBaseTransport:
+    mode=mode or settings.HTTP_MODE
+    if mode=="replay":
+        return ReplayTransport(
+            latency_ms=settings.REPLAY_LATENCY_MS,
+            jitter_ms=settings.REPLAY_JITTER_MS,
+            realtime=settings.REPLAY_REALTIME,
+            seed=settings.REPLAY_SEED,
+        )
+    #Pinning sits below recording, so cassettes keep the host names
+    inner=PinnedAddressTransport(httpx.AsyncHTTPTransport(limits=httpx.Limits(max_connections=100,max_keepalive_connections=20)))
+    if mode=="record":
+        return RecordingTransport(inner)
+    if mode!="live":
+        raise ValueError(f"HTTP_MODE must be live, record or replay, not {mode!r}")
+    return inner
+
+
+# ==================== SHARED CLIENT ====================
+
+def get_http_client()->httpx.AsyncClient:
+    """The pooled client of the running event loop (connections are bound to their loop)"""
+    loop=asyncio.get_running_loop()
+    client=_clients.get(loop)
+    if client is None or client.is_closed:
+        client=_clients[loop]=httpx.AsyncClient(transport=build_transport())
+    return client
+
+
+@asynccontextmanager
+async def http_session()->AsyncIterator[httpx.AsyncClient]:
+    """Drop-in for `async with httpx.AsyncClient() as client` that reuses the shared pool"""
+    yield get_http_client()
+
+
+def get_openai_client():
+    """AsyncOpenAI on the shared pool; the SDK is imported on first use, it is most of our import time"""
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        base_url=settings.OPENAI_BASE_URL,
+        http_client=get_http_client()
+    )
+
+
+async def close_http_clients():
+    """Close the running loop's shared client (app shutdown)"""
+    client=_clients.pop(asyncio.get_running_loop(),None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,97 @@
+"""
+One JSON codec for every hot path, backed by orjson when it is installed.
+
+dumps() returns str (TEXT columns, log lines), dumps_bytes() returns bytes
+(frames written straight to a socket) and loads() takes str or bytes (HTTP
+bodies as received). Both backends write the same compact form: no spaces,
+non-ASCII kept as UTF-8, non-string dict keys turned into strings. Stored
+values do not depend on which backend wrote them. `default` is called for
+objects neither backend knows; pass a module-level function such as str,
+not a new lambda per call. Note that orjson writes datetimes itself, as
+ISO 8601.
+
+JSON_CODEC picks the backend: "auto" (orjson if importable), "orjson" or
+"json". set_codec() switches it at runtime, e.g. for benchmarks/bench_json.py.
+"""
+import json
+from typing import Any,Callable,Dict,Optional,Union
+
+
+class StdlibCodec:
+    name="json"
+
+    def __init__(self):
+        self._decoder=json.JSONDecoder()
+        #json.dumps builds a new encoder per call unless every option is the default; keep ours
+        self._encoders:Dict[Optional[Callable],json.JSONEncoder]={}
+
+    def _encoder(self,default:Optional[Callable])->json.JSONEncoder:
+        encoder=self._encoders.get(default)
+        if encoder is None:
+            encoder=self._encoders[default]=json.JSONEncoder(separators=(",",":"),ensure_ascii=False,default=default)
+        return encoder
+
+    def dumps(self,obj:Any,default:Optional[Callable]=None)->str:
+        return self._encoder(default).encode(obj)
+
+    def dumps_bytes(self,obj:Any,default:Optional[Callable]=None)->bytes:
+        return self.dumps(obj,default).encode("utf-8")
+
+    def loads(self,data:Union[str,bytes,bytearray,memoryview])->Any:
+        if not isinstance(data,str):
+            data=bytes(data).decode("utf-8")
+        return self._decoder.decode(data)
+
+
+class OrjsonCodec:
+    name="orjson"
+
+    def __init__(self):
+        import orjson
+        self._orjson=orjson
+        self._options=orjson.OPT_NON_STR_KEYS
+
+    def dumps(self,obj:Any,default:Optional[Callable]=None)->str:
+        return self._orjson.dumps(obj,default=default,option=self._options).decode("utf-8")
+
+    def dumps_bytes(self,obj:Any,default:Optional[Callable]=None)->bytes:
+        return self._orjson.dumps(obj,default=default,option=self._options)
+
+    def loads(self,data:Union[str,bytes,bytearray,memoryview])->Any:
+        return self._orjson.loads(data)
+
+
+def get_codec(name:str="auto"):
+    if name in ("auto","orjson"):
+        try:
+            return OrjsonCodec()
+        except ImportError:
+            if name=="orjson":
+                raise
+    elif name!="json":
+        raise ValueError(f"JSON_CODEC must be auto, orjson or json, not {name!r}")
+    return StdlibCodec()
+
+
+_codec=get_codec()
+
+
+def set_codec(name:str):
+    global _codec
+    _codec=get_codec(name)
+
+
+def codec_name()->str:
+    return _codec.name
+
+
+def dumps(obj:Any,default:Optional[Callable]=None)->str:
+    return _codec.dumps(obj,default)
+
+
+def dumps_bytes(obj:Any,default:Optional[Callable]=None)->bytes:
+    return _codec.dumps_bytes(obj,default)
+
+
+def loads(data:Union[str,bytes,bytearray,memoryview])->Any:
+    return _codec.loads(data)
@@ -1,10 +1,110 @@
-import json
+import asyncio
+from typing import AsyncIterator,Optional
 from fastapi.responses import StreamingResponse
+from agent.config import settings
+from agent.custom_types import StreamChunk
+from agent.utils.jsoncodec import dumps_bytes
+from agent.utils.telemetry import metrics
+
+#Chunk kinds that may be merged into one frame; everything else is sent as is
+COALESCED_KINDS=("answer","status")
+
+stream_tokens=metrics.counter(
+    "knowdex_stream_tokens_total",
+    "Chunks produced by the agent stream, before coalescing",
+)
+stream_frames=metrics.counter(
+    "knowdex_stream_frames_total",
+    "Frames actually sent to clients after coalescing",
+)
+
 
 async def openai_to_sse(generator):
+    #Frames go out as ready-made bytes, so the response does not encode each one again
     async for token in generator:
         if token:
-            yield f"data:{json.dumps({"type":"token","content":token})}\n\n"
+            yield b"data:"+dumps_bytes({"type":"token","content":token})+b"\n\n"
 
 def sse_response(generator):
-    return StreamingResponse(openai_to_sse(generator),media_type="text/event-stream")
\ No newline at end of file
+    return StreamingResponse(openai_to_sse(generator),media_type="text/event-stream")
+
+
+async def coalesce_stream(
+    source:AsyncIterator[StreamChunk],
+    window_ms:Optional[float]=None,
+    max_chars:Optional[int]=None,
+    surface:str="chainlit"
+)->AsyncIterator[StreamChunk]:
+    """
+    Merge consecutive chunks of the same kind into one frame, flushed when the
+    oldest pending chunk is `window_ms` old or the frame reaches `max_chars`,
+    whichever comes first. The first chunk (time to first byte), sources and
+    errors are never held back, and the stream end flushes at once. A window
+    of 0 passes every chunk through.
+    """
+    window=(settings.STREAM_FLUSH_MS if window_ms is None else window_ms)/1000
+    max_chars=settings.STREAM_FLUSH_CHARS if max_chars is None else max_chars
+    loop=asyncio.get_running_loop()
+    iterator=source.__aiter__()
+
+    pending:list=[]
+    pending_kind=None
+    pending_chars=0
+    deadline=None
+    next_chunk:Optional[asyncio.Future]=None
+    first=True
+
+    def flush()->StreamChunk:
+        nonlocal pending,pending_kind,pending_chars,deadline
+        frame=StreamChunk("".join(pending),kind=pending_kind)
+        pending,pending_kind,pending_chars,deadline=[],None,0,None
+        stream_frames.inc(surface=surface)
+        return frame
+
+    try:
+        while True:
+            try:
+                if deadline is None and next_chunk is None:
+                    #Nothing pending, so no timer: wait for the next chunk directly
+                    chunk=await iterator.__anext__()
+                else:
+                    #One __anext__ task stays alive across timeouts, so no chunk is lost to a cancel
+                    if next_chunk is None:
+                        next_chunk=asyncio.ensure_future(iterator.__anext__())
+                    timeout=None if deadline is None else max(0.0,deadline-loop.time())
+                    done,_=await asyncio.wait((next_chunk,),timeout=timeout)
+                    if not done:
+                        yield flush()
+                        continue
+                    finished,next_chunk=next_chunk,None
+                    chunk=finished.result()
+            except StopAsyncIteration:
+                break
+            stream_tokens.inc(surface=surface)
+
+            if first or window<=0 or chunk.kind not in COALESCED_KINDS:
+                first=False
+                if pending:
+                    yield flush()
+                stream_frames.inc(surface=surface)
+                yield chunk
+                continue
+            if pending and chunk.kind!=pending_kind:
+                yield flush()
+            if not pending:
+                pending_kind=chunk.kind
+                deadline=loop.time()+window
+            pending.append(chunk)
+            pending_chars+=len(chunk)
+            if pending_chars>=max_chars:
+                yield flush()
+        if pending:
+            yield flush()
+    finally:
+        #Close the source too (an early exit or a client gone), so its own finally blocks run now, not at GC
+        if next_chunk is not None and not next_chunk.done():
+            next_chunk.cancel()
+            await asyncio.wait((next_chunk,))     #a running __anext__ would make aclose() fail
+        aclose=getattr(iterator,"aclose",None)
+        if aclose is not None:
+            await aclose()
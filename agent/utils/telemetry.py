@@ -0,0 +1,267 @@
+"""
+Structured timing spans, Prometheus-style histograms and JSON logs.
+
+Every span is observed into `knowdex_stage_duration_seconds{stage,upstream}`
+and logged as one JSON line carrying the current request id, which is kept
+in a ContextVar so it follows a request through the router, the agent and
+the data layer without being passed around.
+"""
+import functools
+import inspect
+import logging
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime,timezone
+from typing import Dict,Iterator,Optional,Tuple
+from agent.utils.jsoncodec import dumps
+
+DEFAULT_BUCKETS=(0.005,0.01,0.025,0.05,0.1,0.25,0.5,1.0,2.5,5.0,10.0,30.0,60.0)
+
+request_id_var:ContextVar[Optional[str]]=ContextVar("knowdex_request_id",default=None)
+_stage_totals:ContextVar[Optional[Dict[str,float]]]=ContextVar("knowdex_stage_totals",default=None)
+
+logger=logging.getLogger("knowdex")
+if not logger.handlers:
+    _handler=logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.propagate=False
+if logger.level==logging.NOTSET:
+    logger.setLevel(logging.INFO)
+
+
+# ==================== REQUEST ID ====================
+
+def new_request_id()->str:
+    return uuid.uuid4().hex
+
+
+def set_request_id(request_id:Optional[str]=None)->str:
+    """Bind a request id to the current context (a fresh one when None)"""
+    request_id=request_id or new_request_id()
+    request_id_var.set(request_id)
+    return request_id
+
+
+def get_request_id()->Optional[str]:
+    return request_id_var.get()
+
+
+# ==================== LOGGING ====================
+
+def log_event(event:str,level:int=logging.INFO,**fields):
+    """Log one structured JSON line tagged with the current request id"""
+    if not logger.isEnabledFor(level):
+        return
+    payload={
+        "ts":datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "level":logging.getLevelName(level).lower(),
+        "event":event,
+        "request_id":get_request_id(),
+    }
+    payload.update(fields)
+    logger.log(level,dumps(payload,default=str))
+
+
+# ==================== METRICS ====================
+
+def _label_key(labels:Dict[str,str])->Tuple[Tuple[str,str],...]:
+    return tuple(sorted((key,str(value)) for key,value in labels.items() if value is not None))
+
+
+def _format_labels(key:Tuple[Tuple[str,str],...],extra:Tuple[Tuple[str,str],...]=())->str:
+    pairs=key+extra
+    if not pairs:
+        return ""
+    escaped=(value.replace("\\","\\\\").replace('"','\\"').replace("\n","\\n") for _,value in pairs)
+    return "{"+",".join(f'{name}="{value}"' for (name,_),value in zip(pairs,escaped))+"}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, rendered in Prometheus text format"""
+
+    def __init__(self,name:str,help_text:str,buckets=DEFAULT_BUCKETS):
+        self.name=name
+        self.help_text=help_text
+        self.buckets=tuple(sorted(buckets))
+        self._series:Dict[tuple,list]={}
+        self._lock=threading.Lock()
+
+    def observe(self,value:float,**labels):
+        key=_label_key(labels)
+        with self._lock:
+            series=self._series.get(key)
+            if series is None:
+                #[bucket counts..., +Inf count, sum]
+                series=self._series[key]=[0]*(len(self.buckets)+1)+[0.0]
+            series[bisect_left(self.buckets,value)]+=1
+            series[-1]+=value
+
+    def render(self)->str:
+        lines=[f"# HELP {self.name} {self.help_text}",f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items=[(key,list(series)) for key,series in self._series.items()]
+        for key,series in items:
+            cumulative=0
+            for bound,count in zip(self.buckets,series):
+                cumulative+=count
+                lines.append(f"{self.name}_bucket{_format_labels(key,(('le',repr(bound)),))} {cumulative}")
+            cumulative+=series[len(self.buckets)]
+            lines.append(f"{self.name}_bucket{_format_labels(key,(('le','+Inf'),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return "\n".join(lines)
+
+
+class Counter:
+    """Monotonic counter per label set"""
+
+    def __init__(self,name:str,help_text:str):
+        self.name=name
+        self.help_text=help_text
+        self._values:Dict[tuple,float]={}
+        self._lock=threading.Lock()
+
+    def inc(self,value:float=1,**labels):
+        key=_label_key(labels)
+        with self._lock:
+            self._values[key]=self._values.get(key,0)+value
+
+    def render(self)->str:
+        lines=[f"# HELP {self.name} {self.help_text}",f"# TYPE {self.name} counter"]
+        with self._lock:
+            items=list(self._values.items())
+        for key,value in items:
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return "\n".join(lines)
+
+
+class Gauge:
+    """Last-set value per label set"""
+
+    def __init__(self,name:str,help_text:str):
+        self.name=name
+        self.help_text=help_text
+        self._values:Dict[tuple,float]={}
+        self._lock=threading.Lock()
+
+    def set(self,value:float,**labels):
+        with self._lock:
+            self._values[_label_key(labels)]=value
+
+    def render(self)->str:
+        lines=[f"# HELP {self.name} {self.help_text}",f"# TYPE {self.name} gauge"]
+        with self._lock:
+            items=list(self._values.items())
+        for key,value in items:
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return "\n".join(lines)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics:Dict[str,object]={}
+        self._lock=threading.Lock()
+
+    def histogram(self,name:str,help_text:str,buckets=DEFAULT_BUCKETS)->Histogram:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name]=Histogram(name,help_text,buckets)
+            return self._metrics[name]
+
+    def counter(self,name:str,help_text:str)->Counter:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name]=Counter(name,help_text)
+            return self._metrics[name]
+
+    def gauge(self,name:str,help_text:str)->Gauge:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name]=Gauge(name,help_text)
+            return self._metrics[name]
+
+    def render(self)->str:
+        with self._lock:
+            metrics=list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics)+"\n"
+
+
+metrics=MetricsRegistry()
+
+stage_duration=metrics.histogram(
+    "knowdex_stage_duration_seconds",
+    "Time spent in each stage of a request, per upstream",
+)
+stage_errors=metrics.counter(
+    "knowdex_stage_errors_total",
+    "Stages that ended with an exception, per upstream",
+)
+
+
+def collect_stages()->Dict[str,float]:
+    """
+    Start summing stage durations (ms, keyed "stage" or "stage:upstream") for
+    the current context, e.g. one question of a batch; returns the live dict
+    """
+    totals:Dict[str,float]={}
+    _stage_totals.set(totals)
+    return totals
+
+
+def _observe(stage:str,upstream:Optional[str],seconds:float):
+    stage_duration.observe(seconds,stage=stage,upstream=upstream)
+    totals=_stage_totals.get()
+    if totals is not None:
+        key=f"{stage}:{upstream}" if upstream else stage
+        totals[key]=round(totals.get(key,0.0)+seconds*1000,3)
+
+
+def record_stage(stage:str,seconds:float,upstream:Optional[str]=None,**fields):
+    """Record a duration measured elsewhere (e.g. time to first byte)"""
+    _observe(stage,upstream,seconds)
+    log_event("span",stage=stage,upstream=upstream,duration_ms=round(seconds*1000,3),**fields)
+
+
+@contextmanager
+def span(stage:str,upstream:Optional[str]=None,**fields)->Iterator[dict]:
+    """
+    Time a block of code. Works around awaits too, so it can wrap an upstream
+    call inside a coroutine. The yielded dict can be filled with extra fields
+    for the log line (status codes, result counts...).
+    """
+    extra=dict(fields)
+    started=time.perf_counter()
+    status="ok"
+    try:
+        yield extra
+    except BaseException:
+        status="error"
+        stage_errors.inc(stage=stage,upstream=upstream)
+        raise
+    finally:
+        seconds=time.perf_counter()-started
+        _observe(stage,upstream,seconds)
+        log_event("span",stage=stage,upstream=upstream,status=status,duration_ms=round(seconds*1000,3),**extra)
+
+
+def timed(stage:str,upstream:Optional[str]=None):
+    """Decorator form of span() for plain and async functions"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args,**kwargs):
+                with span(stage,upstream):
+                    return await func(*args,**kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args,**kwargs):
+            with span(stage,upstream):
+                return func(*args,**kwargs)
+        return wrapper
+    return decorator
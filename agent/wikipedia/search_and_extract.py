@@ -1,6 +1,9 @@
 from agent.tools .base import BaseTool
 from agent.tools.registry import registry
-import httpx
+from agent.utils.http import http_session
+from agent.utils.jsoncodec import loads
+from agent.utils.accounting import record_search
+from agent.utils.telemetry import span
 
 @registry.register
 class WikepediaTool(BaseTool):
@@ -20,14 +23,17 @@ class WikepediaTool(BaseTool):
             "srsearch":query,
             "format":"json"
         }
-        async with httpx.AsyncClient() as client:
-            response=await client.get(search_url,params=params)
-            data=response.json()
+        async with http_session() as client:
+            with span("search",upstream="wikipedia"):
+                response=await client.get(search_url,params=params)
+                data=loads(response.content)
+            record_search(billed=False)
             results=data["query"]["search"]
             if not results:
                 return "No wikipedia page found."
             title=results[0]["title"]
             extract_url="https://en.wikipedia.org/api/rest_v1/page/summary/"+ title
-            response_2=await client.get(extract_url)
-            summary=response_2.json().get("extract","No summary")
+            with span("fetch",upstream="wikipedia"):
+                response_2=await client.get(extract_url)
+                summary=loads(response_2.content).get("extract","No summary")
             return f"Wikipedia:{title}\n\n{summary}"
\ No newline at end of file
@@ -0,0 +1,65 @@
+"""
+Transparent compression for large text columns.
+
+Values at or above COMPRESS_MIN_BYTES are stored as a BLOB: one codec byte
+followed by the compressed UTF-8 text. Smaller values stay plain TEXT, so
+short answers remain readable with any SQLite client. zstd is used when the
+`zstandard` package is installed, zlib otherwise; both are always readable
+if zstd is available at read time.
+"""
+import zlib
+from typing import Optional
+from sqlalchemy.types import Text,TypeDecorator
+
+try:
+    import zstandard
+except ImportError:
+    zstandard=None
+
+COMPRESS_MIN_BYTES=512
+
+CODEC_ZLIB=b"\x01"
+CODEC_ZSTD=b"\x02"
+
+if zstandard is not None:
+    _zstd_compressor=zstandard.ZstdCompressor(level=6)
+    _zstd_decompressor=zstandard.ZstdDecompressor()
+
+
+def compress_text(value:Optional[str]):
+    """Return value unchanged when small, codec-tagged compressed bytes otherwise"""
+    if value is None:
+        return None
+    raw=value.encode("utf-8")
+    if len(raw)<COMPRESS_MIN_BYTES:
+        return value
+    if zstandard is not None:
+        return CODEC_ZSTD+_zstd_compressor.compress(raw)
+    return CODEC_ZLIB+zlib.compress(raw,6)
+
+
+def decompress_text(value):
+    """Inverse of compress_text; plain strings pass straight through"""
+    if value is None or isinstance(value,str):
+        return value
+    value=bytes(value)
+    codec,body=value[:1],value[1:]
+    if codec==CODEC_ZLIB:
+        return zlib.decompress(body).decode("utf-8")
+    if codec==CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("This row was compressed with zstd; install the zstandard package to read it")
+        return _zstd_decompressor.decompress(body).decode("utf-8")
+    raise ValueError(f"Unknown compression codec {codec!r}")
+
+
+class CompressedText(TypeDecorator):
+    """Text column that compresses large values on write and decodes them on read"""
+    impl=Text
+    cache_ok=True
+
+    def process_bind_param(self,value,dialect):
+        return compress_text(value)
+
+    def process_result_value(self,value,dialect):
+        return decompress_text(value)
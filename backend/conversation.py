@@ -0,0 +1,186 @@
+"""
+Per-thread conversation memory on top of the Chainlit steps table.
+
+A follow-up question is sent with the thread's rolling summary plus its
+newest messages, within MEMORY_TOKEN_BUDGET (agent/memory/conversation.py).
+Messages that slide out of that window are folded into the summary after
+the answer has been sent, oldest first and a bounded batch per call, so
+each message enters the summary exactly once. Neither the prompt nor a
+summarizing call grows with the thread, and only steps past the summary
+are ever read, through the (thread_id, created_at) index.
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import Dict,List,Optional,Tuple
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session,select
+from agent.config import settings
+from agent.custom_types import Message
+from agent.memory.conversation import ConversationMemory,build_memory,summarize_turns
+from agent.utils.accounting import track_usage
+from agent.utils.cache import TTLCache
+from agent.utils.jsoncodec import loads
+from agent.utils.telemetry import log_event
+from backend.database import engine
+from backend.models import Step,ThreadSummary
+from backend.storage import extract_final_answer
+
+TURN_TYPES=("user_message","assistant_message")
+
+#thread id -> (summary, covered_until); threads without a summary are cached too
+summary_cache=TTLCache(maxsize=settings.MEMORY_CACHE_SIZE,ttl=settings.MEMORY_CACHE_TTL)
+_compacting:Dict[str,asyncio.Task]={}
+
+
+def _turn_text(step_type:str,input:Optional[str],output:Optional[str],metadata:Optional[str])->str:
+    if step_type=="user_message":
+        return (output or input or "").strip()
+    #Assistant steps hold the streamed progress lines too; on_message keeps the bare answer in metadata
+    try:
+        answer=loads(metadata or "{}").get("answer")
+    except (json.JSONDecodeError,AttributeError):
+        answer=None
+    return (answer if answer is not None else extract_final_answer(output or "")).strip()
+
+
+def get_summary(thread_id:str)->Tuple[str,Optional[datetime]]:
+    cached=summary_cache.get(thread_id)
+    if cached is not None:
+        return cached
+    with Session(engine) as session:
+        row=session.get(ThreadSummary,thread_id)
+        found=(row.summary,row.covered_until) if row else ("",None)
+    summary_cache.set(thread_id,found)
+    return found
+
+
+def save_summary(thread_id:str,summary:str,covered_until:datetime,turns:int):
+    with Session(engine) as session:
+        session.execute(
+            sqlite_insert(ThreadSummary.__table__)
+            .values(thread_id=thread_id,summary=summary,covered_until=covered_until,turns=turns,updated_at=datetime.utcnow())
+            .on_conflict_do_update(
+                index_elements=["thread_id"],
+                set_={
+                    "summary":summary,
+                    "covered_until":covered_until,
+                    "turns":ThreadSummary.__table__.c.turns+turns,
+                    "updated_at":datetime.utcnow(),
+                }
+            )
+        )
+        session.commit()
+    summary_cache.set(thread_id,(summary,covered_until))
+
+
+def _turn_rows(
+    thread_id:str,
+    after:Optional[datetime]=None,
+    until:Optional[datetime]=None,
+    exclude_step_id:Optional[str]=None,
+    limit:Optional[int]=None,
+    newest:bool=True
+)->List[tuple]:
+    """User/assistant step rows in (after, until], oldest first: the newest `limit` of them, or the oldest"""
+    query=(
+        select(Step.created_at,Step.type,Step.input,Step.output,Step.step_metadata)
+        .where(Step.thread_id==thread_id)
+        .where(Step.type.in_(TURN_TYPES))
+    )
+    if after is not None:
+        query=query.where(Step.created_at>after)
+    if until is not None:
+        query=query.where(Step.created_at<=until)
+    if exclude_step_id:
+        query=query.where(Step.id!=exclude_step_id)
+    #Newest: the window plus what may be waiting to be summarized; oldest: one batch to fold
+    limit=limit or settings.MEMORY_MAX_TURNS*3
+    if newest:
+        order=(Step.created_at.desc(),Step.id.desc())
+    else:
+        order=(Step.created_at,Step.id)
+    with Session(engine) as session:
+        rows=session.exec(query.order_by(*order).limit(limit)).all()
+    return list(reversed(rows)) if newest else list(rows)
+
+
+def _messages(rows:List[tuple])->List[Tuple[datetime,Message]]:
+    turns=[]
+    for created_at,step_type,input,output,metadata in rows:
+        text=_turn_text(step_type,input,output,metadata)
+        if text:
+            turns.append((created_at,Message(role="user" if step_type=="user_message" else "assistant",content=text)))
+    return turns
+
+
+def load_turns(
+    thread_id:str,
+    after:Optional[datetime]=None,
+    exclude_step_id:Optional[str]=None,
+    limit:Optional[int]=None
+)->List[Tuple[datetime,Message]]:
+    """The newest user/assistant messages of a thread after `after`, oldest first"""
+    return _messages(_turn_rows(thread_id,after,exclude_step_id=exclude_step_id,limit=limit))
+
+
+def load_conversation(thread_id:str,exclude_step_id:Optional[str]=None)->ConversationMemory:
+    """Summary and recent messages of a thread, ready for run_research(history=...)"""
+    summary,covered_until=get_summary(thread_id)
+    turns=load_turns(thread_id,covered_until,exclude_step_id)
+    memory,_=build_memory(summary,[message for _,message in turns])
+    return memory
+
+
+async def compact_thread(thread_id:str)->int:
+    """
+    Fold every message older than the window into the summary; returns how
+    many were folded. The newest messages decide where the window starts.
+    Everything from the summary's end up to there is then folded forward,
+    oldest first, a bounded batch per call. That includes messages older than
+    the newest turns read, e.g. of a thread from before this feature or one
+    that grew while compaction failed.
+    """
+    summary,covered_until=get_summary(thread_id)
+    turns=load_turns(thread_id,covered_until)
+    _,older=build_memory(summary,[message for _,message in turns])
+    if not older:
+        return 0
+    fold_until=turns[len(older)-1][0]
+    folded=0
+    while True:
+        rows=_turn_rows(thread_id,covered_until,fold_until,newest=False)
+        if not rows:
+            return folded
+        messages=[message for _,message in _messages(rows)]
+        if messages:
+            summary=await summarize_turns(summary,messages)
+        covered_until=rows[-1][0]
+        #Saved per batch, so a failure later on does not fold these again
+        save_summary(thread_id,summary,covered_until,len(messages))
+        folded+=len(messages)
+
+
+async def _compact(thread_id:str):
+    #Own accounting, so the summary call is not added to the answer that was just saved
+    usage=track_usage("memory")
+    try:
+        folded=await compact_thread(thread_id)
+        if folded:
+            log_event("conversation_compacted",thread_id=thread_id,messages=folded,cost_usd=round(usage.cost_usd,6))
+    except Exception as e:
+        log_event("conversation_compaction_failed",level=logging.WARNING,thread_id=thread_id,error=str(e))
+
+
+def schedule_compaction(thread_id:Optional[str])->Optional[asyncio.Task]:
+    """Summarize in the background, off the answer's critical path; one run per thread at a time"""
+    if not thread_id or not settings.MEMORY_ENABLED:
+        return None
+    running=_compacting.get(thread_id)
+    if running and not running.done():
+        return running
+    task=asyncio.create_task(_compact(thread_id))
+    _compacting[thread_id]=task
+    task.add_done_callback(lambda _:_compacting.pop(thread_id,None))
+    return task
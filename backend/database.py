@@ -1,7 +1,10 @@
 from sqlmodel import SQLModel,create_engine
+from sqlalchemy import event
+from backend.compression import decompress_text
+import os
 
 
-DATABASE_URL="sqlite:///./knowdex_local.db"
+DATABASE_URL=os.getenv("DATABASE_URL","sqlite:///./knowdex_local.db")
 
 engine=create_engine(
     DATABASE_URL,
@@ -10,6 +13,11 @@ engine=create_engine(
     connect_args={"check_same_thread":False}
 )
 
+#The FTS triggers and views read compressed answers through this function
+@event.listens_for(engine,"connect")
+def register_sql_functions(dbapi_connection,connection_record):
+    dbapi_connection.create_function("knowdex_text",1,decompress_text,deterministic=True)
+
 def get_db():
     with engine.begin() as conn:
         yield conn 
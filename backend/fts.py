@@ -0,0 +1,219 @@
+"""
+Full-text search over research history and chat steps (SQLite FTS5).
+
+The FTS tables are external-content indexes: they store only the inverted
+index and read the text back from `research` / `steps`, so the database does
+not keep a second copy of every answer. Triggers keep them in sync on every
+insert, update and delete, whichever code path does the write.
+
+Note: external-content tables are keyed by the base table's rowid, which
+SQLite may renumber on VACUUM. Call `rebuild_fts()` after a VACUUM.
+"""
+import re
+import uuid
+from typing import List,Optional
+from sqlalchemy import bindparam,text
+from backend.database import engine
+from backend.models import Research
+
+RESEARCH_FTS="research_fts"
+STEPS_FTS="steps_fts"
+
+SNIPPET_START="**"
+SNIPPET_END="**"
+SNIPPET_TOKENS=16
+
+_TOKEN_RE=re.compile(r"\w+",re.UNICODE)
+
+#Answers may be stored compressed (backend/compression.py), so the research index
+#reads them through a view that decodes with the knowdex_text() SQL function
+RESEARCH_FTS_SOURCE="research_fts_source"
+
+_RESEARCH_DDL=[
+    f"""CREATE VIEW IF NOT EXISTS {RESEARCH_FTS_SOURCE} AS
+        SELECT rowid AS rid,question,knowdex_text(answer) AS answer FROM research""",
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {RESEARCH_FTS} USING fts5(
+        question,answer,
+        content='{RESEARCH_FTS_SOURCE}',content_rowid='rid',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS research_fts_ai AFTER INSERT ON research BEGIN
+        INSERT INTO {RESEARCH_FTS}(rowid,question,answer) VALUES (new.rowid,new.question,knowdex_text(new.answer));
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS research_fts_ad AFTER DELETE ON research BEGIN
+        INSERT INTO {RESEARCH_FTS}({RESEARCH_FTS},rowid,question,answer) VALUES ('delete',old.rowid,old.question,knowdex_text(old.answer));
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS research_fts_au AFTER UPDATE OF question,answer ON research BEGIN
+        INSERT INTO {RESEARCH_FTS}({RESEARCH_FTS},rowid,question,answer) VALUES ('delete',old.rowid,old.question,knowdex_text(old.answer));
+        INSERT INTO {RESEARCH_FTS}(rowid,question,answer) VALUES (new.rowid,new.question,knowdex_text(new.answer));
+    END""",
+]
+
+_STEPS_DDL=[
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {STEPS_FTS} USING fts5(
+        input,output,
+        content='steps',content_rowid='rowid',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS steps_fts_ai AFTER INSERT ON steps BEGIN
+        INSERT INTO {STEPS_FTS}(rowid,input,output) VALUES (new.rowid,new.input,new.output);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS steps_fts_ad AFTER DELETE ON steps BEGIN
+        INSERT INTO {STEPS_FTS}({STEPS_FTS},rowid,input,output) VALUES ('delete',old.rowid,old.input,old.output);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS steps_fts_au AFTER UPDATE OF input,output ON steps BEGIN
+        INSERT INTO {STEPS_FTS}({STEPS_FTS},rowid,input,output) VALUES ('delete',old.rowid,old.input,old.output);
+        INSERT INTO {STEPS_FTS}(rowid,input,output) VALUES (new.rowid,new.input,new.output);
+    END""",
+]
+
+
+def _table_exists(conn,name:str)->bool:
+    row=conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE name=:name"),{"name":name}
+    ).first()
+    return row is not None
+
+
+def _install(conn,fts_table:str,ddl:List[str]):
+    #Backfill only when the index is created, existing rows are picked up once
+    created=not _table_exists(conn,fts_table)
+    for statement in ddl:
+        conn.execute(text(statement))
+    if created:
+        conn.execute(text(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')"))
+
+
+def ensure_research_fts(conn):
+    """Create the research FTS index and its sync triggers if missing"""
+    row=conn.execute(
+        text("SELECT sql FROM sqlite_master WHERE name=:name"),{"name":RESEARCH_FTS}
+    ).first()
+    if row is not None and RESEARCH_FTS_SOURCE not in row[0]:
+        #Indexes built before answers were compressed read the raw column; rebuild them
+        for trigger in ("research_fts_ai","research_fts_ad","research_fts_au"):
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+        conn.execute(text(f"DROP TABLE {RESEARCH_FTS}"))
+    _install(conn,RESEARCH_FTS,_RESEARCH_DDL)
+
+
+def ensure_steps_fts(conn):
+    """Create the chat steps FTS index and its sync triggers if missing"""
+    _install(conn,STEPS_FTS,_STEPS_DDL)
+
+
+def rebuild_fts():
+    """Re-read every row into the FTS indexes (needed after VACUUM)"""
+    with engine.begin() as conn:
+        for fts_table in (RESEARCH_FTS,STEPS_FTS):
+            if _table_exists(conn,fts_table):
+                conn.execute(text(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')"))
+
+
+def to_match_query(search:str)->Optional[str]:
+    """
+    Turn free text typed by a user into a safe FTS5 MATCH expression.
+    Every word is quoted (so FTS operators in the input are inert) and all
+    words must match; the last word is a prefix so search-as-you-type works.
+    """
+    tokens=_TOKEN_RE.findall(search or "")
+    if not tokens:
+        return None
+    terms=[f'"{token}"' for token in tokens]
+    terms[-1]+="*"
+    return " ".join(terms)
+
+
+def search_research(user_id:uuid.UUID,search:str,limit:int=20,offset:int=0)->List[dict]:
+    """Ranked (bm25) search over one user's research questions and answers"""
+    match=to_match_query(search)
+    if not match:
+        return []
+    statement=text(f"""
+        SELECT r.id AS id,r.question AS question,r.created_at AS created_at,
+               bm25({RESEARCH_FTS},2.0,1.0) AS score,
+               snippet({RESEARCH_FTS},0,:start,:end,'…',:tokens) AS question_snippet,
+               snippet({RESEARCH_FTS},1,:start,:end,'…',:tokens) AS answer_snippet
+        FROM {RESEARCH_FTS}
+        JOIN research r ON r.rowid={RESEARCH_FTS}.rowid
+        WHERE {RESEARCH_FTS} MATCH :match AND r.user_id=:user_id
+        ORDER BY score
+        LIMIT :limit OFFSET :offset
+    """).bindparams(
+        bindparam("user_id",type_=Research.__table__.c.user_id.type)
+    ).columns(
+        id=Research.__table__.c.id.type,
+        created_at=Research.__table__.c.created_at.type,
+    )
+    with engine.connect() as conn:
+        rows=conn.execute(statement,{
+            "match":match,
+            "user_id":user_id,
+            "start":SNIPPET_START,
+            "end":SNIPPET_END,
+            "tokens":SNIPPET_TOKENS,
+            "limit":limit,
+            "offset":offset,
+        }).mappings().all()
+    return [dict(row) for row in rows]
+
+
+def search_threads(user_id:Optional[str],search:str,limit:int=20,offset:int=0)->List[dict]:
+    """
+    Ranked search over chat steps, grouped per thread.
+    Each thread is scored by its best matching step. Snippets are only built
+    for the threads on the requested page, not for every hit.
+    """
+    match=to_match_query(search)
+    if not match:
+        return []
+    user_clause="AND t.user_id=:user_id" if user_id else ""
+    #bm25() is only usable inside the FTS query itself, so rank hits first and group after
+    ranking=text(f"""
+        WITH hits AS MATERIALIZED (
+            SELECT s.thread_id AS thread_id,bm25({STEPS_FTS}) AS score
+            FROM {STEPS_FTS}
+            JOIN steps s ON s.rowid={STEPS_FTS}.rowid
+            JOIN threads t ON t.id=s.thread_id
+            WHERE {STEPS_FTS} MATCH :match {user_clause}
+        )
+        SELECT thread_id,MIN(score) AS score FROM hits
+        GROUP BY thread_id
+        ORDER BY score
+        LIMIT :limit OFFSET :offset
+    """)
+    snippets=text(f"""
+        SELECT s.thread_id AS thread_id,bm25({STEPS_FTS}) AS score,
+               snippet({STEPS_FTS},-1,:start,:end,'…',:tokens) AS snippet
+        FROM {STEPS_FTS}
+        JOIN steps s ON s.rowid={STEPS_FTS}.rowid
+        WHERE {STEPS_FTS} MATCH :match AND s.thread_id IN :thread_ids
+    """).bindparams(bindparam("thread_ids",expanding=True))
+    with engine.connect() as conn:
+        ranked=conn.execute(ranking,{
+            "match":match,
+            "user_id":user_id,
+            "limit":limit,
+            "offset":offset,
+        }).mappings().all()
+        if not ranked:
+            return []
+        best={}
+        for row in conn.execute(snippets,{
+            "match":match,
+            "thread_ids":[row["thread_id"] for row in ranked],
+            "start":SNIPPET_START,
+            "end":SNIPPET_END,
+            "tokens":SNIPPET_TOKENS,
+        }).mappings():
+            current=best.get(row["thread_id"])
+            if current is None or row["score"]<current["score"]:
+                best[row["thread_id"]]=row
+    return [
+        {
+            "thread_id":row["thread_id"],
+            "score":row["score"],
+            "snippet":best[row["thread_id"]]["snippet"] if row["thread_id"] in best else None,
+        }
+        for row in ranked
+    ]
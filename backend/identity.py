@@ -0,0 +1,96 @@
+"""
+Identity cache: email -> user record, shared by header auth, the API routers
+and the Chainlit data layer so a known visitor costs no database query.
+
+Users are created with a single INSERT ... SELECT ... WHERE NOT EXISTS
+statement, which SQLite runs atomically, so concurrent first visits of the
+same email (threads or worker processes) end up with one row. A visitor
+whose name changed (a new X-User-Name) gets the row updated and the cached
+record invalidated; whatever changes a user row must call invalidate_user().
+"""
+import uuid
+from datetime import datetime
+from typing import Optional
+from pydantic import BaseModel,ConfigDict
+from sqlalchemy import exists,insert,literal,select as sa_select,update
+from sqlmodel import Session,select
+from agent.config import settings
+from agent.utils.cache import TTLCache
+from backend.database import engine
+from backend.models import User
+
+identity_cache=TTLCache(maxsize=settings.IDENTITY_CACHE_SIZE,ttl=settings.IDENTITY_CACHE_TTL)
+
+
+class UserRecord(BaseModel):
+    """Immutable snapshot of a User row, safe to share between requests"""
+    model_config=ConfigDict(frozen=True)
+
+    id:uuid.UUID
+    email:str
+    name:Optional[str]=None
+    created_at:datetime
+
+
+def _load(session:Session,email:str)->Optional[UserRecord]:
+    #Oldest row wins in databases that already hold duplicates from before this module
+    user=session.exec(
+        select(User).where(User.email==email).order_by(User.created_at,User.id)
+    ).first()
+    if not user:
+        return None
+    return UserRecord(id=user.id,email=user.email,name=user.name,created_at=user.created_at)
+
+
+def get_user_record(email:str)->Optional[UserRecord]:
+    """Look a user up by email, from the cache when possible"""
+    record=identity_cache.get(email)
+    if record is not None:
+        return record
+    with Session(engine) as session:
+        record=_load(session,email)
+    if record is not None:
+        identity_cache.set(email,record)
+    return record
+
+
+def get_or_create_user(email:str,name:Optional[str]=None)->UserRecord:
+    """Return the user for this email, creating it exactly once if needed; a different name is stored"""
+    record=get_user_record(email)
+    if record is not None:
+        if name is not None and name!=record.name:
+            record=rename_user(email,name)
+        return record
+
+    columns=User.__table__.c
+    candidate=sa_select(
+        literal(uuid.uuid4(),columns.id.type),
+        literal(email,columns.email.type),
+        literal(name,columns.name.type),
+        literal(datetime.utcnow(),columns.created_at.type),
+    ).where(~exists().where(columns.email==email))
+    with Session(engine) as session:
+        session.execute(
+            insert(User.__table__).from_select(["id","email","name","created_at"],candidate)
+        )
+        session.commit()
+        record=_load(session,email)
+    identity_cache.set(email,record)
+    return record
+
+
+def rename_user(email:str,name:str)->Optional[UserRecord]:
+    """Store a user's new display name"""
+    with Session(engine) as session:
+        session.execute(update(User.__table__).where(User.__table__.c.email==email).values(name=name))
+        session.commit()
+    invalidate_user(email)
+    return get_user_record(email)
+
+
+def invalidate_user(email:Optional[str]=None):
+    """Forget one cached identity (after its row changed or was deleted) or all of them"""
+    if email is None:
+        identity_cache.clear()
+    else:
+        identity_cache.invalidate(email)
@@ -1,19 +1,40 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse,PlainTextResponse
 import uvicorn
-from backend.routers import research,history
-from backend.database import engine
-from backend.models import User,Research
+from backend.routers import research,history,search,usage,admin
+from backend.migrations import run_migrations
+from backend.retention import start_retention_job
+from backend.refresh_ahead import start_refresh_ahead
+from backend.profiling import start_loop_monitor
+from backend.warmup import readiness,start_warmup
+from backend.middleware import RequestIdMiddleware
+from agent.utils.http import close_http_clients
+from agent.utils.telemetry import metrics
 import os
 
-with engine.begin() as conn:
-    User.metadata.create_all(bind=conn)
-    Research.metadata.create_all(bind=conn)
+@asynccontextmanager
+async def lifespan(app:FastAPI):
+    #Only a version check once the schema is current
+    run_migrations()
+    start_warmup()
+    retention_job=start_retention_job()
+    loop_monitor=start_loop_monitor()
+    refresh_job=start_refresh_ahead()
+    yield
+    loop_monitor.cancel()
+    if refresh_job:
+        refresh_job.cancel()
+    if retention_job:
+        retention_job.cancel()
+    await close_http_clients()
 
 app=FastAPI(
     title="KNOWDEX-AI Research Agent",
     description="Streaming + Citations + Permanent History",
-    version="1.0"
+    version="1.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -22,10 +43,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
+app.add_middleware(RequestIdMiddleware)
 
 app.include_router(research.router,prefix="/api")
 app.include_router(history.router,prefix="/api")
+app.include_router(search.router,prefix="/api")
+app.include_router(usage.router,prefix="/api")
+app.include_router(admin.router,prefix="/admin",include_in_schema=False)
 
 @app.get("/")
 def home():
@@ -33,10 +59,26 @@ def home():
         "message":"KNOWDEX Backend is LIVE with permanent memory!",
         "endpoints":{
             "Ask a question(streaming)":"POST/api/research ->{question:'Your question'}",
-            "See all saved chats":"GET/api/history"
+            "See all saved chats":"GET/api/history",
+            "Search saved chats":"GET/api/search?q=your words",
+            "Token and cost usage":"GET/api/usage?group_by=day|user|mode|model",
+            "Latency metrics(Prometheus)":"GET/metrics",
+            "Readiness(503 until warm-up is done)":"GET/ready"
         },
         "status":"Portfolio-ready"
 
     }
 
+#GET/METRICS ENDPOINT
+@app.get("/metrics",response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Per-stage and per-upstream latency histograms in Prometheus text format"""
+    return PlainTextResponse(metrics.render(),media_type="text/plain; version=0.0.4")
+
+#GET/READY ENDPOINT
+@app.get("/ready")
+def ready():
+    """Readiness for health checks: 200 once the startup warm-up has run, 503 before"""
+    return JSONResponse(readiness.report(),status_code=200 if readiness.ready else 503)
+
     
\ No newline at end of file
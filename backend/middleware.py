@@ -0,0 +1,45 @@
+"""
+Request id propagation: read X-Request-ID (or make one up), bind it to the
+telemetry context for the whole request, streamed body and background tasks
+included, and echo it back on the response.
+"""
+import time
+from agent.utils.telemetry import record_stage,set_request_id
+
+REQUEST_ID_HEADER=b"x-request-id"
+
+
+class RequestIdMiddleware:
+    """Plain ASGI middleware, so streaming responses are not buffered"""
+
+    def __init__(self,app):
+        self.app=app
+
+    async def __call__(self,scope,receive,send):
+        if scope["type"]!="http":
+            return await self.app(scope,receive,send)
+
+        incoming=dict(scope.get("headers") or []).get(REQUEST_ID_HEADER)
+        request_id=set_request_id(incoming.decode("latin-1")[:128] if incoming else None)
+        started=time.perf_counter()
+        status={"code":500}
+
+        async def send_with_request_id(message):
+            if message["type"]=="http.response.start":
+                status["code"]=message["status"]
+                headers=[(k,v) for k,v in message.get("headers",[]) if k.lower()!=REQUEST_ID_HEADER]
+                headers.append((REQUEST_ID_HEADER,request_id.encode("latin-1")))
+                message={**message,"headers":headers}
+            await send(message)
+
+        try:
+            await self.app(scope,receive,send_with_request_id)
+        finally:
+            route=scope.get("route")
+            record_stage(
+                "http",
+                time.perf_counter()-started,
+                method=scope.get("method"),
+                path=getattr(route,"path","unmatched"),
+                status_code=status["code"],
+            )
@@ -0,0 +1,98 @@
+"""
+Schema migrations, tracked in SQLite's PRAGMA user_version.
+
+Each migration runs once per database, in order, and the version is bumped
+after it succeeds. When the schema is current, startup costs one PRAGMA
+read instead of create_all plus the FTS checks on every import. Migrations
+must stay idempotent: two processes starting on a fresh database (the
+backend and Chainlit) may both run one. A new table or index means a new
+migration at the end of MIGRATIONS, never an edit to an old one.
+
+Run ahead of a deploy (e.g. as part of the build command) with:
+
+    python -m backend.migrations
+"""
+import threading
+import time
+from typing import Callable,List,Tuple
+from sqlmodel import SQLModel
+from agent.utils.telemetry import log_event
+from backend.database import engine
+from backend.fts import ensure_research_fts,ensure_steps_fts
+from backend.models import Step
+from backend.retention import backfill_archive_activity
+from backend.storage import migrate_research_storage
+
+_lock=threading.Lock()
+
+
+def _create_tables():
+    with engine.begin() as conn:
+        SQLModel.metadata.create_all(bind=conn)
+        #create_all only adds indexes together with new tables
+        for index in Step.__table__.indexes:
+            index.create(bind=conn,checkfirst=True)
+
+
+def _create_fts():
+    with engine.begin() as conn:
+        ensure_research_fts(conn)
+        ensure_steps_fts(conn)
+
+
+def _add_column(table:str,column:str,definition:str):
+    """ALTER TABLE ADD COLUMN unless the column exists (fresh databases get it from create_tables)"""
+    with engine.begin() as conn:
+        columns={row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _add_archive_activity():
+    _add_column("archive","last_activity_at","DATETIME")
+    backfill_archive_activity()
+
+
+#(version,name,migration)
+MIGRATIONS:List[Tuple[int,str,Callable[[],object]]]=[
+    (1,"create_tables",_create_tables),
+    (2,"full_text_indexes",_create_fts),
+    (3,"research_sources_and_answers",migrate_research_storage),
+    (4,"usage_cached_tokens",lambda:_add_column("research_usage","cached_tokens","INTEGER NOT NULL DEFAULT 0")),
+    (5,"archive_last_activity",_add_archive_activity),
+]
+SCHEMA_VERSION=MIGRATIONS[-1][0]
+
+
+def schema_version()->int:
+    with engine.connect() as conn:
+        return conn.exec_driver_sql("PRAGMA user_version").scalar() or 0
+
+
+def _set_version(version:int):
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"PRAGMA user_version={int(version)}")
+
+
+def run_migrations()->int:
+    """Bring the database up to SCHEMA_VERSION; returns how many migrations ran"""
+    if schema_version()>=SCHEMA_VERSION:
+        return 0
+    with _lock:
+        current=schema_version()
+        applied=0
+        for version,name,migration in MIGRATIONS:
+            if version<=current:
+                continue
+            started=time.perf_counter()
+            migration()
+            _set_version(version)
+            applied+=1
+            log_event("migration_applied",version=version,name=name,duration_ms=round((time.perf_counter()-started)*1000,1))
+        return applied
+
+
+if __name__=="__main__":
+    before=schema_version()
+    applied=run_migrations()
+    print(f"Schema version {before} -> {schema_version()} ({applied} migration(s) applied)")
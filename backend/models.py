@@ -1,7 +1,9 @@
 from sqlmodel import SQLModel,Field
+from sqlalchemy import Index
 from typing import Optional
 from datetime import datetime
 import uuid
+from backend.compression import CompressedText
 
 #User Table
 class User(SQLModel,table=True):
@@ -19,8 +21,122 @@ class Research(SQLModel,table=True):
     user_id:uuid.UUID=Field(foreign_key="user.id")
     #what user asked
     question:str=Field(index=True)
-    #The full answer from knowdex (with citations)
-    answer:str=Field(default="")
+    #The final answer from knowdex (no progress lines), compressed when large
+    answer:str=Field(default="",sa_type=CompressedText)
+    #Legacy JSON sources, now kept in research_source/source (see backend/storage.py)
     sources:str=Field(default="[]")
     #The time the research  happened
     created_at:datetime=Field(default_factory=datetime.utcnow)
+
+
+#Every cited URL is stored once and shared by all the research that cites it
+class Source(SQLModel,table=True):
+    id:Optional[int]=Field(default=None,primary_key=True)
+    url:str=Field(unique=True)
+    title:Optional[str]=Field(default=None)
+
+
+#Ordered link between a research row and its sources
+class ResearchSource(SQLModel,table=True):
+    __tablename__="research_source"
+
+    research_id:uuid.UUID=Field(foreign_key="research.id",primary_key=True)
+    position:int=Field(primary_key=True)
+    source_id:int=Field(foreign_key="source.id",index=True)
+
+
+#Chainlit chat history: one thread per conversation, one step per message
+class Thread(SQLModel,table=True):
+    __tablename__="threads"
+
+    id:str=Field(primary_key=True)
+    user_id:str=Field(index=True)
+    name:Optional[str]=Field(default=None)
+    created_at:datetime=Field(default_factory=datetime.utcnow)
+    #JSON strings (renamed from metadata to avoid the SQLModel conflict)
+    thread_metadata:str=Field(default="{}")
+    tags:Optional[str]=Field(default=None)
+
+
+class Step(SQLModel,table=True):
+    __tablename__="steps"
+    __table_args__=(
+        #Serves the windowed, newest-first step loading of get_thread
+        Index("ix_steps_thread_id_created_at","thread_id","created_at"),
+    )
+
+    id:str=Field(primary_key=True)
+    thread_id:str=Field(foreign_key="threads.id",index=True)
+    parent_id:Optional[str]=Field(default=None)
+    name:Optional[str]=Field(default=None)
+    type:str=Field(default="user_message")
+    input:Optional[str]=Field(default=None)
+    output:Optional[str]=Field(default=None)
+    created_at:datetime=Field(default_factory=datetime.utcnow)
+    start_time:Optional[str]=Field(default=None)
+    end_time:Optional[str]=Field(default=None)
+    generation:Optional[str]=Field(default=None)
+    step_metadata:str=Field(default="{}")
+
+
+#File/element attachments of a thread
+class ElementModel(SQLModel,table=True):
+    __tablename__="elements"
+
+    id:str=Field(primary_key=True)
+    thread_id:str=Field(foreign_key="threads.id",index=True)
+    type:str
+    url:Optional[str]=Field(default=None)
+    name:str
+    display:str=Field(default="inline")
+    size:Optional[str]=Field(default=None)
+    language:Optional[str]=Field(default=None)
+    for_id:Optional[str]=Field(default=None)
+    mime:Optional[str]=Field(default=None)
+
+
+#Cold threads (their steps and elements) and old research rows, moved out of the
+#hot tables as zlib-compressed JSON and rehydrated when someone opens them again
+class Archive(SQLModel,table=True):
+    __tablename__="archive"
+
+    kind:str=Field(primary_key=True)
+    item_id:str=Field(primary_key=True)
+    user_id:str=Field(index=True)
+    created_at:datetime=Field(index=True)
+    #Newest archived step of a thread: retention counts a thread's age from its last message
+    last_activity_at:Optional[datetime]=Field(default=None)
+    archived_at:datetime=Field(default_factory=datetime.utcnow)
+    payload:bytes
+
+
+#Tokens, searches and estimated cost of each answered question (one row per research row).
+#Not a foreign key on purpose: usage stays countable after the research row is archived
+class ResearchUsage(SQLModel,table=True):
+    __tablename__="research_usage"
+
+    research_id:uuid.UUID=Field(primary_key=True)
+    user_id:uuid.UUID=Field(index=True)
+    mode:str=Field(default="research",index=True)
+    model:Optional[str]=Field(default=None)
+    prompt_tokens:int=Field(default=0)
+    cached_tokens:int=Field(default=0)     #of prompt_tokens, read from the upstream prompt cache
+    completion_tokens:int=Field(default=0)
+    llm_calls:int=Field(default=0)
+    search_calls:int=Field(default=0)
+    cache_hits:int=Field(default=0)
+    cost_usd:float=Field(default=0.0)
+    duration_ms:float=Field(default=0.0)
+    created_at:datetime=Field(default_factory=datetime.utcnow,index=True)
+
+
+#Rolling summary of a thread's older messages, prepended to follow-up questions (see backend/conversation.py)
+class ThreadSummary(SQLModel,table=True):
+    __tablename__="thread_summaries"
+
+    thread_id:str=Field(foreign_key="threads.id",primary_key=True)
+    summary:str=Field(default="")
+    #created_at of the newest step folded into the summary; later steps are still verbatim
+    covered_until:datetime
+    turns:int=Field(default=0)
+    updated_at:datetime=Field(default_factory=datetime.utcnow)
@@ -0,0 +1,284 @@
+"""
+Opt-in profiling of a live process and continuous event-loop lag reporting.
+
+A fraction (PROFILING_SAMPLE_RATE) of /api/research requests is profiled,
+one at a time, either with a low-overhead stack sampler that watches the
+event-loop thread or with cProfile. Both see everything the loop runs while
+the request is in flight, other requests included, since they share the
+thread. With PROFILING_TRACEMALLOC, snapshots taken at the start and the
+end of the request are compared as well: the lines whose allocations grew
+the most, and the bytes retained and peak in between. The last PROFILING_KEEP profiles are kept
+in memory for the /admin endpoints.
+
+The lag monitor wakes up every LOOP_LAG_INTERVAL_MS and reports how late it
+was. While profiling is enabled a watchdog thread also grabs the loop
+thread's stack when it stalls, which names the blocking call (a sync
+database session, a CPU-heavy parse...).
+"""
+import asyncio
+import cProfile
+import io
+import logging
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter,deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Deque,Dict,Iterator,List,Optional
+from agent.config import settings
+from agent.utils.telemetry import get_request_id,log_event,metrics
+
+REPORT_LINES=40
+MEMORY_LINES=20
+
+loop_lag=metrics.histogram(
+    "knowdex_event_loop_lag_seconds",
+    "How late the event loop woke the lag monitor up",
+    buckets=(0.001,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1.0,2.5,5.0),
+)
+loop_lag_last=metrics.gauge(
+    "knowdex_event_loop_lag_last_seconds",
+    "Most recent event loop lag measurement",
+)
+
+_profiles:Deque[dict]=deque(maxlen=settings.PROFILING_KEEP)
+_stalls:Deque[dict]=deque(maxlen=50)
+#cProfile and tracemalloc are process-wide, so only one profile runs at a time
+_profile_lock=threading.Lock()
+
+_loop_state:Dict[str,Optional[float]]={"heartbeat":None,"thread_id":None,"last_lag":0.0,"max_lag":0.0}
+_lag_task:Optional[asyncio.Task]=None
+_watchdog:Optional[threading.Thread]=None
+
+
+# ==================== STACK SAMPLER ====================
+
+def _frame_label(frame)->str:
+    code=frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def thread_stack(thread_id:int)->List[str]:
+    """Current Python stack of a thread, outermost call first"""
+    frame=sys._current_frames().get(thread_id)
+    stack=[]
+    while frame is not None:
+        stack.append(_frame_label(frame))
+        frame=frame.f_back
+    return stack[::-1]
+
+
+class StackSampler:
+    """Records one thread's stack every `interval` seconds from a background thread"""
+
+    def __init__(self,thread_id:int,interval:float):
+        self.thread_id=thread_id
+        self.interval=interval
+        self.counts:Counter=Counter()
+        self._stop=threading.Event()
+        self._thread=threading.Thread(target=self._run,name="knowdex-stack-sampler",daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            stack=thread_stack(self.thread_id)
+            if stack:
+                self.counts[";".join(stack)]+=1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self)->Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.counts
+
+
+def _sampling_report(counts:Counter)->str:
+    """Leaf functions by share of samples, then the folded stacks (flamegraph.pl / speedscope input)"""
+    total=sum(counts.values()) or 1
+    leaves:Counter=Counter()
+    for stack,count in counts.items():
+        leaves[stack.rsplit(";",1)[-1]]+=count
+    lines=[f"{total} samples","","Top functions (self):"]
+    for label,count in leaves.most_common(REPORT_LINES):
+        lines.append(f"{100*count/total:6.1f}%  {count:6d}  {label}")
+    lines+=["","Folded stacks:"]
+    lines+=[f"{stack} {count}" for stack,count in counts.most_common()]
+    return "\n".join(lines)
+
+
+# ==================== PROFILES ====================
+
+def _cprofile_report(profiler:cProfile.Profile)->str:
+    out=io.StringIO()
+    pstats.Stats(profiler,stream=out).sort_stats("cumulative").print_stats(REPORT_LINES)
+    return out.getvalue()
+
+
+_TRACEMALLOC_FILTER=(tracemalloc.Filter(False,tracemalloc.__file__),)
+
+
+def _memory_report(before:tracemalloc.Snapshot,after:tracemalloc.Snapshot)->dict:
+    """Growth between two snapshots, biggest first (tracemalloc's own bookkeeping left out)"""
+    diff=after.filter_traces(_TRACEMALLOC_FILTER).compare_to(before.filter_traces(_TRACEMALLOC_FILTER),"lineno")
+    return {
+        "retained_bytes":sum(stat.size_diff for stat in diff),
+        "peak_bytes":tracemalloc.get_traced_memory()[1],
+        "top":[str(stat) for stat in diff[:MEMORY_LINES]],
+    }
+
+
+def _should_sample()->bool:
+    return settings.PROFILING_ENABLED and random.random()<settings.PROFILING_SAMPLE_RATE
+
+
+@contextmanager
+def profile_block(label:str,force:bool=False)->Iterator[Optional[dict]]:
+    """
+    Profile the enclosed code when this request is sampled (or force=True).
+    Yields the profile record, or None when not profiling; never raises
+    because a profile could not be taken.
+    """
+    if not (force or _should_sample()) or not _profile_lock.acquire(blocking=False):
+        yield None
+        return
+    try:
+        record={
+            "id":uuid.uuid4().hex[:12],
+            "label":label,
+            "request_id":get_request_id(),
+            "mode":settings.PROFILING_MODE,
+            "started_at":datetime.utcnow().isoformat(timespec="seconds"),
+        }
+        #Already tracing (started with -X tracemalloc, say): diff the snapshots, leave tracing on
+        started_tracing=settings.PROFILING_TRACEMALLOC and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(10)
+        before=None
+        if settings.PROFILING_TRACEMALLOC:
+            tracemalloc.reset_peak()
+            before=tracemalloc.take_snapshot()
+
+        profiler=sampler=None
+        if settings.PROFILING_MODE=="cprofile":
+            profiler=cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                #Another profiler (a debugger, coverage) owns the hook
+                profiler=None
+        else:
+            sampler=StackSampler(threading.get_ident(),settings.PROFILING_SAMPLE_INTERVAL_MS/1000)
+            sampler.start()
+
+        started=time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["duration_ms"]=round((time.perf_counter()-started)*1000,1)
+            record["raw"]=None
+            if profiler is not None:
+                profiler.disable()
+                profiler.create_stats()
+                record["report"]=_cprofile_report(profiler)
+                record["raw"]=marshal.dumps(profiler.stats)
+            elif sampler is not None:
+                record["report"]=_sampling_report(sampler.stop())
+            else:
+                record["report"]="Profiler unavailable (another profiler is active)"
+            if before is not None:
+                record["memory"]=_memory_report(before,tracemalloc.take_snapshot())
+                if started_tracing:
+                    tracemalloc.stop()
+            _profiles.append(record)
+            log_event("profile_captured",profile_id=record["id"],label=label,duration_ms=record["duration_ms"])
+    finally:
+        _profile_lock.release()
+
+
+async def capture_loop_profile(seconds:float)->Optional[dict]:
+    """Profile whatever the event loop runs for the next `seconds` (ad hoc, from the admin API)"""
+    with profile_block(f"event loop for {seconds:g}s",force=True) as record:
+        if record is None:
+            return None
+        await asyncio.sleep(seconds)
+    return record
+
+
+def list_profiles()->List[dict]:
+    return [
+        {key:value for key,value in record.items() if key not in ("report","raw","memory")}
+        for record in reversed(_profiles)
+    ]
+
+
+def get_profile(profile_id:str)->Optional[dict]:
+    return next((record for record in _profiles if record["id"]==profile_id),None)
+
+
+# ==================== EVENT LOOP LAG ====================
+
+async def loop_lag_monitor():
+    """Measure how late the loop wakes us up, forever"""
+    interval=settings.LOOP_LAG_INTERVAL_MS/1000
+    _loop_state["thread_id"]=threading.get_ident()
+    while True:
+        expected=time.perf_counter()+interval
+        _loop_state["heartbeat"]=time.monotonic()
+        await asyncio.sleep(interval)
+        lag=max(0.0,time.perf_counter()-expected)
+        loop_lag.observe(lag)
+        loop_lag_last.set(lag)
+        _loop_state["last_lag"]=lag
+        _loop_state["max_lag"]=max(_loop_state["max_lag"],lag)
+        if lag*1000>=settings.LOOP_LAG_WARN_MS:
+            log_event("event_loop_lag",level=logging.WARNING,lag_ms=round(lag*1000,1))
+
+
+def _watch_loop():
+    """Grab the loop thread's stack once per stall, while it is still blocked"""
+    interval=settings.LOOP_LAG_INTERVAL_MS/1000
+    threshold=interval+settings.LOOP_LAG_WARN_MS/1000
+    reported=None
+    while True:
+        time.sleep(min(interval,settings.LOOP_LAG_WARN_MS/1000)/2)
+        heartbeat,thread_id=_loop_state["heartbeat"],_loop_state["thread_id"]
+        if heartbeat is None or heartbeat==reported:
+            continue
+        stalled=time.monotonic()-heartbeat
+        if stalled<threshold:
+            continue
+        reported=heartbeat
+        stack=thread_stack(thread_id)
+        _stalls.append({
+            "at":datetime.utcnow().isoformat(timespec="seconds"),
+            "stalled_ms":round(stalled*1000,1),
+            "stack":stack,
+        })
+        log_event("event_loop_blocked",level=logging.WARNING,stalled_ms=round(stalled*1000,1),where=stack[-1] if stack else None)
+
+
+def loop_report()->dict:
+    return {
+        "last_lag_ms":round((_loop_state["last_lag"] or 0)*1000,2),
+        "max_lag_ms":round((_loop_state["max_lag"] or 0)*1000,2),
+        "stalls":list(reversed(_stalls)),
+    }
+
+
+def start_loop_monitor()->asyncio.Task:
+    """Start the lag monitor once per process (and the stall watchdog when profiling is on)"""
+    global _lag_task,_watchdog
+    if _lag_task is None or _lag_task.done():
+        _lag_task=asyncio.get_running_loop().create_task(loop_lag_monitor())
+    if settings.PROFILING_ENABLED and _watchdog is None:
+        _watchdog=threading.Thread(target=_watch_loop,name="knowdex-loop-watchdog",daemon=True)
+        _watchdog.start()
+    return _lag_task
@@ -0,0 +1,187 @@
+"""
+Refresh-ahead for hot cache entries (agent/caching.py).
+
+Every REFRESH_AHEAD_INTERVAL seconds the refresher looks for search results
+(and cached answers, when ANSWER_CACHE_TTL is set) that expire within
+REFRESH_AHEAD_WINDOW seconds. Entries that are popular enough are fetched
+again in the background, hottest first, so the next user gets a warm entry
+instead of the full pipeline. Demand is tracked with in-memory, decaying
+hit counters.
+
+Upstream spend is capped per kind and per rolling hour, for all the workers
+of a host together: each refresh first claims its entry, then one unit of
+the hour's budget, in the shared disk tier (memory-only caches fall back to
+a budget per process). So an entry is refreshed by one worker, not by every
+worker that has it in memory. At most REFRESH_AHEAD_CONCURRENCY refreshes
+run at once per process. Entries past the budget simply expire.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from typing import Dict,List,Optional,Tuple
+from agent.caching import (
+    answer_cache,answer_cache_enabled,disk_cache,fetch_search_results,mark_refreshing,popularity,search_cache,store_answer
+)
+from agent.config import settings
+from agent.utils.accounting import track_usage
+from agent.utils.cache import TieredCache
+from agent.utils.telemetry import log_event,metrics,span
+
+refresh_total=metrics.counter(
+    "knowdex_refresh_ahead_total",
+    "Background cache refreshes by kind and outcome (ok, error, over_budget, claimed: another worker has it)"
+)
+_refresh_task:Optional[asyncio.Task]=None
+
+
+class HourlyBudget:
+    """At most `per_hour` spends in any rolling hour"""
+
+    def __init__(self,per_hour:int):
+        self.per_hour=per_hour
+        self._spent:deque=deque()
+
+    def _expire(self,now:float):
+        while self._spent and self._spent[0]<=now-3600:
+            self._spent.popleft()
+
+    def take(self)->bool:
+        now=time.monotonic()
+        self._expire(now)
+        if len(self._spent)>=self.per_hour:
+            return False
+        self._spent.append(now)
+        return True
+
+    def remaining(self)->int:
+        self._expire(time.monotonic())
+        return max(0,self.per_hour-len(self._spent))
+
+
+async def answer_question(question:str)->Tuple[str,List[dict]]:
+    """Run the full agent for a question and return its answer and sources"""
+    #Imported here, so starting the refresher does not import the agent at startup
+    from agent.agent import run_research
+    answer=""
+    sources=[]
+    async for chunk in run_research(question):
+        if chunk.kind=="answer":
+            answer+=chunk
+        elif chunk.kind=="sources":
+            sources=chunk.sources
+        elif chunk.kind=="error":
+            raise RuntimeError(chunk.strip())
+    return answer,sources
+
+
+class RefreshAhead:
+    def __init__(self):
+        self.caches={"search":search_cache,"answer":answer_cache}
+        self.per_hour={
+            "search":settings.REFRESH_AHEAD_SEARCHES_PER_HOUR,
+            "answer":settings.REFRESH_AHEAD_ANSWERS_PER_HOUR,
+        }
+        self.budgets={kind:HourlyBudget(per_hour) for kind,per_hour in self.per_hour.items()}
+        self.semaphore=asyncio.Semaphore(settings.REFRESH_AHEAD_CONCURRENCY)
+        self.in_flight=set()
+        self.tasks=set()
+
+    def kinds(self)->List[str]:
+        return ["search","answer"] if answer_cache_enabled() else ["search"]
+
+    def due(self,kind:str)->List[Tuple[object,dict,float]]:
+        """(key,value,score) of popular entries about to expire, hottest first"""
+        counter=popularity[kind]
+        entries=[
+            (key,value,counter.score(key))
+            for key,value,_ in self.caches[kind].expiring(settings.REFRESH_AHEAD_WINDOW)
+            if (kind,key) not in self.in_flight
+        ]
+        return sorted(
+            [entry for entry in entries if entry[2]>=settings.REFRESH_AHEAD_MIN_SCORE],
+            key=lambda entry:entry[2],
+            reverse=True
+        )
+
+    def claim(self,kind:str,key)->str:
+        """
+        "ok" when this process may refresh the entry, "claimed" when another
+        worker is on it, "over_budget" when the hour's budget is spent.
+        Writes to the disk tier: run it off the event loop
+        """
+        cache=self.caches[kind]
+        if not isinstance(cache,TieredCache):
+            return "ok" if self.budgets[kind].take() else "over_budget"
+        #Once refreshed the entry is not due again, so holding it for the window is enough
+        if not cache.claim(key,settings.REFRESH_AHEAD_WINDOW):
+            return "claimed"
+        if not disk_cache.claim(f"refresh_budget:{kind}",uuid.uuid4().hex,3600,limit=self.per_hour[kind]):
+            return "over_budget"
+        return "ok"
+
+    async def tick(self)->Dict[str,int]:
+        """Start refreshes for everything due that fits the budget; returns how many started per kind"""
+        started={}
+        for kind in self.kinds():
+            started[kind]=0
+            for key,value,score in self.due(kind):
+                outcome=await asyncio.to_thread(self.claim,kind,key)
+                if outcome!="ok":
+                    refresh_total.inc(kind=kind,outcome=outcome)
+                    continue
+                self.in_flight.add((kind,key))
+                task=asyncio.create_task(self._refresh(kind,key,value))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+                started[kind]+=1
+        return started
+
+    async def _refresh(self,kind:str,key,value:dict):
+        mark_refreshing()
+        usage=track_usage("refresh")
+        outcome="ok"
+        try:
+            async with self.semaphore:
+                with span("refresh_ahead",kind=kind):
+                    if kind=="search":
+                        results=await fetch_search_results(value["query"],value["count"])
+                        search_cache.set(key,{**value,"results":results})
+                    else:
+                        answer,sources=await answer_question(value["question"])
+                        store_answer(value["question"],answer,sources)
+        except Exception as e:
+            outcome="error"
+            log_event("refresh_ahead_failed",level=logging.WARNING,kind=kind,error=str(e))
+        finally:
+            self.in_flight.discard((kind,key))
+            refresh_total.inc(kind=kind,outcome=outcome)
+            if usage.cost_usd:
+                log_event("refresh_ahead_cost",kind=kind,cost_usd=round(usage.cost_usd,6))
+
+
+refresher:Optional[RefreshAhead]=None
+
+
+async def refresh_ahead_loop():
+    global refresher
+    refresher=RefreshAhead()
+    while True:
+        try:
+            started=await refresher.tick()
+            if any(started.values()):
+                log_event("refresh_ahead",**started)
+        except Exception as e:
+            log_event("refresh_ahead_tick_failed",level=logging.ERROR,error=str(e))
+        await asyncio.sleep(settings.REFRESH_AHEAD_INTERVAL)
+
+
+def start_refresh_ahead()->Optional[asyncio.Task]:
+    """Start the refresher once per process (needs a running loop)"""
+    global _refresh_task
+    if not settings.REFRESH_AHEAD_ENABLED:
+        return None
+    if _refresh_task is None or _refresh_task.done():
+        _refresh_task=asyncio.get_running_loop().create_task(refresh_ahead_loop())
+    return _refresh_task
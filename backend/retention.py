@@ -0,0 +1,363 @@
+"""
+History retention: set-based deletes, archival of cold data and rehydration.
+
+Threads whose last message is older than ARCHIVE_AFTER_DAYS keep only their
+`threads` row (so they still show up in the sidebar); their steps and
+elements move into the `archive` table as one zlib-compressed JSON blob.
+Research rows older than that move there whole, sources included. Opening
+an archived thread or research entry puts it back in the hot tables.
+Anything older than RETENTION_DAYS is deleted, archived or not; for a
+thread that is the time of its last message, wherever it is stored.
+"""
+import asyncio
+import logging
+import uuid
+import zlib
+from datetime import datetime,timedelta
+from typing import Dict,List,Optional
+from sqlalchemy import delete,func,select as sa_select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session,select
+from agent.config import settings
+from agent.utils.jsoncodec import dumps_bytes,loads
+from agent.utils.telemetry import log_event,span
+from backend.database import engine
+from backend.fts import rebuild_fts
+from backend.models import Archive,ElementModel,Research,ResearchSource,ResearchUsage,Step,Thread,ThreadSummary
+from backend.storage import attach_sources,delete_research_sources,load_sources
+
+THREAD="thread"
+RESEARCH="research"
+
+_retention_task:Optional[asyncio.Task]=None
+
+
+# ==================== PAYLOAD ENCODING ====================
+
+def _column_types(table)->Dict[str,type]:
+    types={}
+    for column in table.columns:
+        try:
+            types[column.name]=column.type.python_type
+        except NotImplementedError:
+            types[column.name]=object
+    return types
+
+
+def _pack_rows(table,rows)->List[dict]:
+    """Table rows as JSON-ready dicts (datetimes and UUIDs as strings)"""
+    packed=[]
+    for row in rows:
+        packed.append({
+            key:(value.isoformat() if isinstance(value,datetime) else str(value) if isinstance(value,uuid.UUID) else value)
+            for key,value in dict(row).items()
+        })
+    return packed
+
+
+def _unpack_rows(table,rows:List[dict])->List[dict]:
+    """Inverse of _pack_rows, restores the column python types"""
+    types=_column_types(table)
+    unpacked=[]
+    for row in rows:
+        values={}
+        for key,value in row.items():
+            kind=types.get(key,object)
+            if value is not None and kind is datetime:
+                value=datetime.fromisoformat(value)
+            elif value is not None and kind is uuid.UUID:
+                value=uuid.UUID(value)
+            values[key]=value
+        unpacked.append(values)
+    return unpacked
+
+
+def _compress(payload:dict)->bytes:
+    return zlib.compress(dumps_bytes(payload),6)
+
+
+def _decompress(blob:bytes)->dict:
+    return loads(zlib.decompress(blob))
+
+
+def _insert_missing(session:Session,table,rows:List[dict]):
+    """Insert rows, skipping primary keys that are already present"""
+    if rows:
+        session.execute(sqlite_insert(table).values(rows).on_conflict_do_nothing())
+
+
+# ==================== BULK DELETES ====================
+
+def delete_threads(session:Session,thread_ids:List[str]):
+    """Delete threads with their steps, elements, summaries and archived history in a few set-based statements"""
+    if not thread_ids:
+        return
+    session.execute(delete(ThreadSummary).where(ThreadSummary.thread_id.in_(thread_ids)))
+    session.execute(delete(ElementModel).where(ElementModel.thread_id.in_(thread_ids)))
+    session.execute(delete(Step).where(Step.thread_id.in_(thread_ids)))
+    session.execute(delete(Archive).where(Archive.kind==THREAD,Archive.item_id.in_(thread_ids)))
+    session.execute(delete(Thread).where(Thread.id.in_(thread_ids)))
+
+
+# ==================== THREADS ====================
+
+def archive_thread(session:Session,thread_id:str)->bool:
+    """Move a thread's steps and elements into the archive, keeping the thread row"""
+    thread=session.get(Thread,thread_id)
+    if not thread:
+        return False
+
+    steps=session.execute(
+        sa_select(Step.__table__).where(Step.thread_id==thread_id).order_by(Step.created_at)
+    ).mappings().all()
+    if not steps:
+        return False
+    elements=session.execute(
+        sa_select(ElementModel.__table__).where(ElementModel.thread_id==thread_id)
+    ).mappings().all()
+
+    payload={
+        "steps":_pack_rows(Step.__table__,steps),
+        "elements":_pack_rows(ElementModel.__table__,elements),
+    }
+    last_activity=steps[-1]["created_at"]
+    #A thread that got new messages without being reopened keeps its older archive
+    existing=session.get(Archive,(THREAD,thread_id))
+    if existing:
+        previous=_decompress(existing.payload)
+        payload["steps"]=previous["steps"]+payload["steps"]
+        payload["elements"]=previous["elements"]+payload["elements"]
+        if existing.last_activity_at and existing.last_activity_at>last_activity:
+            last_activity=existing.last_activity_at
+        session.delete(existing)
+        session.flush()
+
+    if not thread.name:
+        #The sidebar names untitled threads after their first message, which is about to leave
+        first_input=next((step["input"] for step in steps if step["input"]),None)
+        thread.name=first_input[:50]+"..." if first_input else None
+        session.add(thread)
+
+    session.add(Archive(
+        kind=THREAD,
+        item_id=thread_id,
+        user_id=thread.user_id,
+        created_at=thread.created_at,
+        last_activity_at=last_activity,
+        payload=_compress(payload),
+    ))
+    session.execute(delete(ElementModel).where(ElementModel.thread_id==thread_id))
+    session.execute(delete(Step).where(Step.thread_id==thread_id))
+    return True
+
+
+def rehydrate_thread(thread_id:str)->bool:
+    """Put an archived thread's steps and elements back into the hot tables"""
+    with Session(engine) as session:
+        archived=session.get(Archive,(THREAD,thread_id))
+        if not archived:
+            return False
+        payload=_decompress(archived.payload)
+        _insert_missing(session,Step.__table__,_unpack_rows(Step.__table__,payload["steps"]))
+        _insert_missing(session,ElementModel.__table__,_unpack_rows(ElementModel.__table__,payload["elements"]))
+        session.delete(archived)
+        session.commit()
+        return True
+
+
+def backfill_archive_activity():
+    """Set last_activity_at of thread archives written before the column existed, from their payload"""
+    with Session(engine) as session:
+        archived=session.exec(
+            select(Archive).where(Archive.kind==THREAD,Archive.last_activity_at.is_(None))
+        ).all()
+        for item in archived:
+            steps=_decompress(item.payload)["steps"]
+            item.last_activity_at=max(
+                (datetime.fromisoformat(step["created_at"]) for step in steps if step.get("created_at")),
+                default=item.created_at
+            )
+            session.add(item)
+        session.commit()
+
+
+def _cold_thread_ids(session:Session,cutoff:datetime,limit:int)->List[str]:
+    return list(session.exec(
+        select(Step.thread_id)
+        .group_by(Step.thread_id)
+        .having(func.max(Step.created_at)<cutoff)
+        .limit(limit)
+    ).all())
+
+
+def archive_cold_threads(cutoff:datetime,batch_size:int=500)->int:
+    """Archive every thread whose newest step is older than cutoff, one transaction per batch"""
+    archived=0
+    while True:
+        with Session(engine) as session:
+            thread_ids=_cold_thread_ids(session,cutoff,batch_size)
+            if not thread_ids:
+                return archived
+            moved=sum(1 for thread_id in thread_ids if archive_thread(session,thread_id))
+            session.commit()
+        archived+=moved
+        if moved==0:
+            #Only orphaned steps left in the batch, nothing more to do this sweep
+            return archived
+
+
+# ==================== RESEARCH ====================
+
+def _research_payload(archived:Archive)->dict:
+    payload=_decompress(archived.payload)
+    #Archives written before sources moved to their own table hold just the row
+    if "research" not in payload:
+        payload={"research":payload,"sources":[]}
+    payload["research"]=_unpack_rows(Research.__table__,[payload["research"]])[0]
+    return payload
+
+
+def archive_old_research(cutoff:datetime,batch_size:int=500)->int:
+    """Move research rows created before cutoff (with their sources) into the archive"""
+    archived=0
+    while True:
+        with Session(engine) as session:
+            rows=session.execute(
+                sa_select(Research.__table__).where(Research.created_at<cutoff).limit(batch_size)
+            ).mappings().all()
+            if not rows:
+                return archived
+            research_ids=[row["id"] for row in rows]
+            sources=load_sources(session,research_ids)
+            for row in rows:
+                session.add(Archive(
+                    kind=RESEARCH,
+                    item_id=str(row["id"]),
+                    user_id=str(row["user_id"]),
+                    created_at=row["created_at"],
+                    payload=_compress({
+                        "research":_pack_rows(Research.__table__,[row])[0],
+                        "sources":sources[row["id"]],
+                    }),
+                ))
+            delete_research_sources(session,research_ids)
+            session.execute(delete(Research).where(Research.id.in_(research_ids)))
+            session.commit()
+        archived+=len(rows)
+
+
+def rehydrate_research(research_id:uuid.UUID)->Optional[Research]:
+    """Return a research row, pulling it back out of the archive if needed"""
+    with Session(engine) as session:
+        research=session.get(Research,research_id)
+        if research:
+            return research
+        archived=session.get(Archive,(RESEARCH,str(research_id)))
+        if not archived:
+            return None
+        payload=_research_payload(archived)
+        _insert_missing(session,Research.__table__,[payload["research"]])
+        attach_sources(session,research_id,payload["sources"])
+        session.delete(archived)
+        session.commit()
+        return session.get(Research,research_id)
+
+
+def load_archived_research(user_id:uuid.UUID)->List[dict]:
+    """
+    Decode a user's archived research rows without moving them back.
+    Each row carries its sources list under "sources".
+    """
+    with Session(engine) as session:
+        archived=session.exec(
+            select(Archive)
+            .where(Archive.kind==RESEARCH,Archive.user_id==str(user_id))
+            .order_by(Archive.created_at.desc())
+        ).all()
+        rows=[]
+        for item in archived:
+            payload=_research_payload(item)
+            rows.append({**payload["research"],"sources":payload["sources"]})
+        return rows
+
+
+# ==================== RETENTION ====================
+
+def purge_expired(cutoff:datetime,batch_size:int=500)->Dict[str,int]:
+    """Delete threads without a message since cutoff (hot or archived) and research older than cutoff"""
+    removed={"threads":0,"research":0}
+    while True:
+        with Session(engine) as session:
+            recent=select(Step.thread_id).where(Step.created_at>=cutoff)
+            #An archived thread's messages are in its archive row, not in steps
+            recent_archived=select(Archive.item_id).where(Archive.kind==THREAD,Archive.last_activity_at>=cutoff)
+            thread_ids=list(session.exec(
+                select(Thread.id)
+                .where(Thread.created_at<cutoff)
+                .where(Thread.id.not_in(recent))
+                .where(Thread.id.not_in(recent_archived))
+                .limit(batch_size)
+            ).all())
+            if not thread_ids:
+                break
+            delete_threads(session,thread_ids)
+            session.commit()
+        removed["threads"]+=len(thread_ids)
+
+    with Session(engine) as session:
+        expired=select(Research.id).where(Research.created_at<cutoff)
+        session.execute(delete(ResearchSource).where(ResearchSource.research_id.in_(expired)))
+        removed["research"]+=session.execute(delete(Research).where(Research.created_at<cutoff)).rowcount
+        removed["research"]+=session.execute(
+            delete(Archive).where(Archive.kind==RESEARCH,Archive.created_at<cutoff)
+        ).rowcount
+        session.execute(delete(ResearchUsage).where(ResearchUsage.created_at<cutoff))
+        session.commit()
+    return removed
+
+
+def run_retention(now:Optional[datetime]=None)->Dict[str,int]:
+    """One sweep of the configured retention policy"""
+    now=now or datetime.utcnow()
+    summary={"threads_archived":0,"research_archived":0,"threads_deleted":0,"research_deleted":0}
+
+    if settings.RETENTION_DAYS>0:
+        removed=purge_expired(now-timedelta(days=settings.RETENTION_DAYS),settings.RETENTION_BATCH_SIZE)
+        summary["threads_deleted"]=removed["threads"]
+        summary["research_deleted"]=removed["research"]
+
+    if settings.ARCHIVE_AFTER_DAYS>0:
+        cutoff=now-timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+        summary["threads_archived"]=archive_cold_threads(cutoff,settings.RETENTION_BATCH_SIZE)
+        summary["research_archived"]=archive_old_research(cutoff,settings.RETENTION_BATCH_SIZE)
+
+    if settings.RETENTION_VACUUM and any(summary.values()):
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.exec_driver_sql("VACUUM")
+        #VACUUM may renumber rowids, which the external-content FTS indexes are keyed on
+        rebuild_fts()
+
+    return summary
+
+
+async def retention_loop():
+    """Run the retention sweep forever, off the event loop"""
+    while True:
+        try:
+            with span("retention.sweep",upstream="sqlite"):
+                summary=await asyncio.to_thread(run_retention)
+            if any(summary.values()):
+                log_event("retention_sweep",**summary)
+        except Exception as e:
+            log_event("retention_sweep_failed",level=logging.ERROR,error=str(e))
+        await asyncio.sleep(settings.RETENTION_INTERVAL_SECONDS)
+
+
+def start_retention_job()->Optional[asyncio.Task]:
+    """Start the background retention job once per process (needs a running loop)"""
+    global _retention_task
+    if settings.ARCHIVE_AFTER_DAYS<=0 and settings.RETENTION_DAYS<=0:
+        return None
+    if _retention_task is None or _retention_task.done():
+        _retention_task=asyncio.get_running_loop().create_task(retention_loop())
+    return _retention_task
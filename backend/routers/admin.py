@@ -0,0 +1,62 @@
+from fastapi import APIRouter,Depends,Header,HTTPException,Query
+from fastapi.responses import PlainTextResponse,Response
+from typing import List,Optional
+import secrets
+from agent.config import settings
+from backend.profiling import capture_loop_profile,get_profile,list_profiles,loop_report
+
+def require_admin(x_admin_token:Optional[str]=Header(None)):
+    """Admin endpoints do not exist unless profiling is enabled, and need the admin token"""
+    if not settings.PROFILING_ENABLED:
+        raise HTTPException(status_code=404,detail="Not Found")
+    if not settings.ADMIN_TOKEN or not x_admin_token or not secrets.compare_digest(x_admin_token,settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=403,detail="Admin token required")
+
+router=APIRouter(dependencies=[Depends(require_admin)])
+
+#GET/ADMIN/PROFILES ENDPOINT
+@router.get("/profiles")
+async def get_profiles()->List[dict]:
+    """Recent profiles, newest first (without their reports)"""
+    return list_profiles()
+
+#POST/ADMIN/PROFILES/CAPTURE ENDPOINT
+@router.post("/profiles/capture")
+async def capture_profile(seconds:float=Query(5.0,gt=0,le=60)):
+    """Profile the whole event loop for a few seconds, whatever it is running"""
+    record=await capture_loop_profile(seconds)
+    if record is None:
+        raise HTTPException(status_code=409,detail="Another profile is already running")
+    return {key:value for key,value in record.items() if key not in ("report","raw","memory")}
+
+#GET/ADMIN/PROFILES/{ID} ENDPOINT
+@router.get("/profiles/{profile_id}",response_class=PlainTextResponse)
+async def get_profile_report(profile_id:str):
+    """Readable report of one profile, plus its memory diff when tracemalloc was on"""
+    record=get_profile(profile_id)
+    if not record:
+        raise HTTPException(status_code=404,detail="Profile not found")
+    text=f"{record['label']}\n{record['mode']} profile, {record['duration_ms']}ms, request {record['request_id']}\n\n{record['report']}"
+    memory=record.get("memory")
+    if memory:
+        text+=f"\n\nMemory: {memory['retained_bytes']} bytes retained, {memory['peak_bytes']} bytes peak\n"+"\n".join(memory["top"])
+    return text
+
+#GET/ADMIN/PROFILES/{ID}/RAW ENDPOINT
+@router.get("/profiles/{profile_id}/raw")
+async def get_profile_raw(profile_id:str):
+    """cProfile stats file, loadable with pstats or snakeviz"""
+    record=get_profile(profile_id)
+    if not record or not record.get("raw"):
+        raise HTTPException(status_code=404,detail="No cProfile data for this profile")
+    return Response(
+        record["raw"],
+        media_type="application/octet-stream",
+        headers={"Content-Disposition":f'attachment; filename="knowdex-{profile_id}.prof"'}
+    )
+
+#GET/ADMIN/LOOP ENDPOINT
+@router.get("/loop")
+async def get_loop_report():
+    """Event loop lag and the stacks of recent stalls (blocking calls)"""
+    return loop_report()
@@ -1,8 +1,13 @@
 from fastapi import APIRouter,HTTPException
 from sqlmodel import Session,select
 from typing import List
+import uuid
+from agent.utils.jsoncodec import dumps
 from backend.database import engine
-from backend.models import Research,User
+from backend.identity import UserRecord,get_user_record
+from backend.models import Research
+from backend.retention import load_archived_research,rehydrate_research
+from backend.storage import load_sources
 from pydantic import BaseModel
 
 router=APIRouter()
@@ -14,33 +19,53 @@ class ResearchHistoryResponse(BaseModel):
     sources:str
     created_at:str
 
+def format_research(r,sources:List[dict])->dict:
+    return {
+        "id":str(r["id"]),
+        "question":r["question"],
+        "answer":r["answer"],
+        "sources":dumps(sources),
+        "created_at":r["created_at"].strftime("%B %d,%Y at %I:%M%p")
+    }
+
+def get_history_user()->UserRecord:
+    user=get_user_record("user@knowdex.local")
+
+    if not user:
+        raise HTTPException(status_code=404,detail="No User found")
+    return user
+
 #GET/API/HISTORY ENDPOINT
 @router.get("/history",response_model=List[ResearchHistoryResponse])
-async def get_history():
-    """Returns every question and answer a user ever asked KNOWDEX sorted newest first"""
+async def get_history(include_archived:bool=False):
+    """
+    Returns every question and answer a user ever asked KNOWDEX sorted newest first.
+    Entries moved to the archive by the retention job are only listed with include_archived=true.
+    """
+    user=get_history_user()
     with Session(engine) as session:
-        statement=select(User).where(User.email=="user@knowdex.local")
-        user=session.exec(statement).first()
-
-        if not user:
-            raise HTTPException(status_code=404,detail="No User found")
-        
         statement=(
             select(Research)
             .where(Research.user_id==user.id)
             .order_by(Research.created_at.desc())
         )
         researches=session.exec(statement).all()
+        sources=load_sources(session,[r.id for r in researches])
 
-        history=[]
-        for r in researches:
-            history.append(
-                {
-                    "id":str(r.id),
-                    "question":r.question,
-                    "answer":r.answer,
-                    "sources":r.sources,
-                    "created_at":r.created_at.strftime("%B %d,%Y at %I:%M%p")
-                }
-            )
-        return history
+        history=[format_research(r.model_dump(),sources[r.id]) for r in researches]
+
+    if include_archived:
+        history.extend(format_research(r,r["sources"]) for r in load_archived_research(user.id))
+    return history
+
+#GET/API/HISTORY/{ID} ENDPOINT
+@router.get("/history/{research_id}",response_model=ResearchHistoryResponse)
+async def get_history_item(research_id:uuid.UUID):
+    """Returns one saved research entry, bringing it back from the archive if it was archived"""
+    user=get_history_user()
+    research=rehydrate_research(research_id)
+    if not research or research.user_id!=user.id:
+        raise HTTPException(status_code=404,detail="Research not found")
+    with Session(engine) as session:
+        sources=load_sources(session,[research.id])
+    return format_research(research.model_dump(),sources[research.id])
@@ -1,77 +1,133 @@
-from fastapi import APIRouter,BackgroundTasks
-from pydantic import BaseModel
-from typing import AsyncGenerator
-import json
+from fastapi import APIRouter,BackgroundTasks,Request
+from pydantic import BaseModel,Field
+from typing import AsyncGenerator,List,Optional
+import asyncio
+import time
 from agent.agent import run_research
-from backend.database import engine
-from backend.models import Research,User
-from sqlmodel import Session,select
+from agent.batch import BatchResult,run_batch
+from agent.config import settings
+from agent.knowledge.past_research import set_research_user
+from agent.scheduler import set_requester
+from agent.utils.accounting import track_usage
+from agent.utils.jsoncodec import dumps_bytes
+from agent.utils.streaming import coalesce_stream
+from agent.utils.telemetry import record_stage
+from backend.identity import UserRecord,get_or_create_user
+from backend.profiling import profile_block
+from backend.storage import save_research
 from fastapi.responses import StreamingResponse
 
 router=APIRouter()
 
 class ResearchRequest(BaseModel):
     question:str
+    mode:str="research"
 
-def get_user()->User:
-    with Session(engine) as session:
-        statement=select(User).where(User.email=='user@knowdex.local')
-        user=session.exec(statement).first()
-        if user:
-            return user
-        user=User(email="user@knowdex.local",name="Test User")
-        session.add(user)
-        session.commit()
-        session.refresh(user)
-        return user
+class BatchResearchRequest(BaseModel):
+    questions:List[str]=Field(min_length=1,max_length=settings.BATCH_MAX_QUESTIONS)
+    mode:str="batch"
+    concurrency:Optional[int]=Field(default=None,ge=1,le=settings.BATCH_MAX_CONCURRENCY)
+    save:bool=True
+
+def get_user()->UserRecord:
+    return get_or_create_user("user@knowdex.local","Test User")
+
+def caller_id(http_request:Request)->str:
+    """
+    Who the fair-share scheduler queues an API call as. Every API request is
+    the same test user (get_user), so callers are told apart by address
+    (behind a proxy, run uvicorn with --proxy-headers).
+    """
+    host=http_request.client.host if http_request.client else "unknown"
+    return f"api:{host}"
 
 #POST/API/RESEARCH ENDPOINT
 @router.post("/research",response_class=StreamingResponse,response_model=None)
 async def research_endpoint(
     request:ResearchRequest,
-    background_tasks:BackgroundTasks
+    background_tasks:BackgroundTasks,
+    http_request:Request
 )->StreamingResponse:
     """
     1. Streams the answer live (word by word)
     2. When finished -> saves everything to database automatically
     """
+    started=time.perf_counter()
     user=get_user()
+    usage=track_usage(request.mode)
+    set_requester(caller_id(http_request))
+    set_research_user(user.id)
     full_answer=""
     sources_list=[]
 
     def save_to_db():
-        with Session(engine) as session:
-            research=Research(
-                user_id=user.id,
-                question=request.question,
-                answer=full_answer.strip(),
-                sources=json.dumps(sources_list)
-            )
-            session.add(research)
-            session.commit()
+        save_research(
+            user_id=user.id,
+            question=request.question,
+            answer=full_answer,
+            sources=sources_list,
+            usage=usage
+        )
 
     async def stream_response()->AsyncGenerator[str,None]:
         nonlocal full_answer
-        async for chunk in run_research(request.question):
-            yield chunk
+        first_byte=True
+        #A sampled fraction of requests is profiled when PROFILING_ENABLED is on
+        with profile_block(f"POST /api/research: {request.question[:80]}"):
+            async for chunk in coalesce_stream(run_research(request.question),surface="api"):
+                yield chunk
+                if first_byte:
+                    record_stage("ttfb",time.perf_counter()-started)
+                    first_byte=False
 
-            stripped=chunk.strip()
-            if stripped.startswith("http") or stripped.startswith("["):
-                pass
-            else:
-                full_answer+=chunk
-            
-            lower_chunk=chunk.lower()
-            if "sources:" in lower_chunk:
-                lines=chunk.strip().split("\n")
-                for i in range(1,len(lines),2):
-                    if i + 1 < len(lines):
-                        title=lines[i].strip("[]1234567890.")
-                        url=lines[i+1].strip()
-                        if url.startswith("http"):
-                            sources_list.append({"title":title,"url":url})
+                #Only the final answer and its sources are stored, not the progress lines
+                if chunk.kind=="answer":
+                    full_answer+=chunk
+                elif chunk.kind=="sources":
+                    sources_list.extend(chunk.sources)
 
+        usage.finish()
         background_tasks.add_task(save_to_db)
         yield "\n\n[DONE]"
+        record_stage("request",time.perf_counter()-started,answer_chars=len(full_answer))
+
+    return StreamingResponse(stream_response(),media_type="text/plain")
+
+#POST/API/RESEARCH/BATCH ENDPOINT
+@router.post("/research/batch",response_class=StreamingResponse,response_model=None)
+async def batch_research_endpoint(request:BatchResearchRequest,http_request:Request)->StreamingResponse:
+    """
+    Researches many questions at once (bounded concurrency, shared searches).
+    Streams one NDJSON line per question as it finishes ({"type":"result",...},
+    in completion order, "index" is its position in the request), then one
+    {"type":"summary",...} line with timings and search reuse.
+    """
+    user=get_user()
+    #All questions of the batch queue behind interactive calls as this caller's batch work, whatever request.mode says
+    set_requester(caller_id(http_request),"batch",priority="batch")
+    set_research_user(user.id)
+
+    def save(result:BatchResult):
+        save_research(
+            user_id=user.id,
+            question=result.question,
+            answer=result.answer,
+            sources=result.sources,
+            usage=result.usage
+        )
+
+    async def stream_lines()->AsyncGenerator[bytes,None]:
+        async for item in run_batch(request.questions,request.concurrency,request.mode):
+            if isinstance(item,BatchResult):
+                if request.save and not item.error and item.duplicate_of is None:
+                    await asyncio.to_thread(save,item)
+                line={
+                    "type":"result",
+                    **item.model_dump(exclude={"usage"}),
+                    "usage":item.usage.model_dump(include={"prompt_tokens","cached_tokens","completion_tokens","search_calls","cached_searches","cost_usd"}) if item.usage else None,
+                }
+            else:
+                line={"type":"summary",**item.model_dump()}
+            yield dumps_bytes(line)+b"\n"
 
-    return StreamingResponse(stream_response(),media_type="text/plain")
\ No newline at end of file
+    return StreamingResponse(stream_lines(),media_type="application/x-ndjson")
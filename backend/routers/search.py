@@ -0,0 +1,40 @@
+from fastapi import APIRouter,HTTPException,Query
+from typing import List
+from backend.fts import search_research
+from backend.identity import get_user_record
+from pydantic import BaseModel
+
+router=APIRouter()
+
+class ResearchSearchResult(BaseModel):
+    id:str
+    question:str
+    question_snippet:str
+    answer_snippet:str
+    score:float
+    created_at:str
+
+#GET/API/SEARCH ENDPOINT
+@router.get("/search",response_model=List[ResearchSearchResult])
+async def search_history(
+    q:str=Query(...,min_length=1,description="Words to look for in past questions and answers"),
+    limit:int=Query(20,ge=1,le=100),
+    offset:int=Query(0,ge=0)
+):
+    """Full-text search over the user's research history, best matches first (bm25)"""
+    user=get_user_record("user@knowdex.local")
+    if not user:
+        raise HTTPException(status_code=404,detail="No User found")
+
+    results=search_research(user.id,q,limit=limit,offset=offset)
+    return [
+        {
+            "id":str(r["id"]),
+            "question":r["question"],
+            "question_snippet":r["question_snippet"] or "",
+            "answer_snippet":r["answer_snippet"] or "",
+            "score":r["score"],
+            "created_at":r["created_at"].strftime("%B %d,%Y at %I:%M%p")
+        }
+        for r in results
+    ]
@@ -0,0 +1,76 @@
+from fastapi import APIRouter,HTTPException,Query
+from datetime import datetime,timedelta
+from typing import Dict,List,Literal,Optional
+import uuid
+from agent.scheduler import scheduler_stats
+from backend.identity import get_user_record
+from backend.usage import research_usage,usage_summary
+from pydantic import BaseModel
+
+router=APIRouter()
+
+class UsageSummary(BaseModel):
+    group:str
+    requests:int
+    prompt_tokens:int
+    completion_tokens:int
+    cached_tokens:int
+    cached_share:float
+    search_calls:int
+    cache_hits:int
+    cost_usd:float
+    tokens_p50:int
+    tokens_p95:int
+    cost_p50_usd:float
+    cost_p95_usd:float
+    latency_p50_ms:float
+    latency_p95_ms:float
+
+class ResearchUsageResponse(BaseModel):
+    research_id:str
+    mode:str
+    model:Optional[str]
+    prompt_tokens:int
+    cached_tokens:int
+    completion_tokens:int
+    llm_calls:int
+    search_calls:int
+    cache_hits:int
+    cost_usd:float
+    duration_ms:float
+    created_at:str
+
+#GET/API/USAGE ENDPOINT
+@router.get("/usage",response_model=List[UsageSummary])
+async def get_usage(
+    group_by:Literal["user","day","mode","model"]="day",
+    days:int=Query(30,ge=1,le=3650,description="How far back to look"),
+    mine:bool=Query(False,description="Only count the current user's requests")
+):
+    """Tokens, searches, cache hits and estimated cost of answered questions, with p50/p95 per group"""
+    user_id=None
+    if mine:
+        user=get_user_record("user@knowdex.local")
+        if not user:
+            raise HTTPException(status_code=404,detail="No User found")
+        user_id=user.id
+    return usage_summary(group_by,since=datetime.utcnow()-timedelta(days=days),user_id=user_id)
+
+#GET/API/USAGE/SCHEDULER ENDPOINT
+@router.get("/usage/scheduler")
+async def get_scheduler_stats()->Dict[str,dict]:
+    """Per upstream: slots in use and waiting calls, and per user its weight and wait times (p50/p95/max ms)"""
+    return scheduler_stats()
+
+#GET/API/USAGE/{RESEARCH_ID} ENDPOINT
+@router.get("/usage/{research_id}",response_model=ResearchUsageResponse)
+async def get_research_usage(research_id:uuid.UUID):
+    """Accounting of one answered question"""
+    usage=research_usage(research_id)
+    if not usage:
+        raise HTTPException(status_code=404,detail="No usage recorded for this research")
+    return {
+        **usage.model_dump(exclude={"research_id","user_id","created_at"}),
+        "research_id":str(usage.research_id),
+        "created_at":usage.created_at.strftime("%B %d,%Y at %I:%M%p")
+    }
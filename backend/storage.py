@@ -0,0 +1,174 @@
+"""
+Research persistence: final answers plus deduplicated, URL-interned sources.
+
+A research row keeps only the final answer text (compressed when large, see
+backend/compression.py). Its citations live in `source` (one row per URL,
+shared by every answer that cites it) and the ordered `research_source`
+join table.
+"""
+import json
+import re
+import uuid
+from typing import Dict,List,Optional
+from sqlalchemy import delete,or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session,select
+from agent.utils.accounting import RequestUsage
+from agent.utils.jsoncodec import loads
+from agent.utils.telemetry import span
+from backend.database import engine
+from backend.models import Research,ResearchSource,ResearchUsage,Source
+
+#Markers of the streamed progress text that older rows stored along with the answer
+_LEGACY_PREFIX="KNOWDEX is waking up"
+_LEGACY_ANSWER_MARKER="Generating answer...\n\n"
+_LEGACY_FINISHED="KNOWDEX has finished"
+_CITATION_BLOCK_RE=re.compile(r"\n\nSources:\n(?:\[\d+\][^\n]*\n(?:\S*://\S*)?\n?)*\s*$")
+
+
+def intern_sources(session:Session,sources:List[dict])->List[int]:
+    """Return source ids for the given {title,url} dicts, inserting unseen URLs once"""
+    urls=[]
+    for source in sources:
+        url=(source.get("url") or "").strip()
+        if url and url not in urls:
+            urls.append(url)
+    if not urls:
+        return []
+
+    titles={}
+    for source in sources:
+        titles.setdefault((source.get("url") or "").strip(),source.get("title"))
+    session.execute(
+        sqlite_insert(Source.__table__)
+        .values([{"url":url,"title":titles.get(url)} for url in urls])
+        .on_conflict_do_nothing(index_elements=["url"])
+    )
+    ids={row.url:row.id for row in session.exec(select(Source).where(Source.url.in_(urls))).all()}
+    return [ids[url] for url in urls]
+
+
+def attach_sources(session:Session,research_id:uuid.UUID,sources:List[dict]):
+    """Link a research row to its sources, in citation order"""
+    source_ids=intern_sources(session,sources)
+    if source_ids:
+        session.execute(
+            sqlite_insert(ResearchSource.__table__)
+            .values([
+                {"research_id":research_id,"position":position,"source_id":source_id}
+                for position,source_id in enumerate(source_ids)
+            ])
+            .on_conflict_do_nothing()
+        )
+
+
+def save_research(
+    user_id:uuid.UUID,
+    question:str,
+    answer:str,
+    sources:List[dict],
+    session:Optional[Session]=None,
+    usage:Optional[RequestUsage]=None
+)->Research:
+    """Store one answered question with its sources and, when tracked, its token/cost usage"""
+    if session is None:
+        with span("db.save_research",upstream="sqlite"),Session(engine) as session:
+            research=save_research(user_id,question,answer,sources,session,usage)
+            session.commit()
+            session.refresh(research)
+            return research
+
+    research=Research(user_id=user_id,question=question,answer=answer.strip())
+    session.add(research)
+    session.flush()
+    attach_sources(session,research.id,sources)
+    if usage is not None:
+        usage.finish()
+        session.add(ResearchUsage(
+            research_id=research.id,
+            user_id=user_id,
+            mode=usage.mode,
+            model=usage.model,
+            prompt_tokens=usage.prompt_tokens,
+            cached_tokens=usage.cached_tokens,
+            completion_tokens=usage.completion_tokens,
+            llm_calls=usage.llm_calls,
+            search_calls=usage.search_calls,
+            cache_hits=usage.cache_hits,
+            cost_usd=usage.cost_usd,
+            duration_ms=usage.duration_ms,
+            created_at=research.created_at,
+        ))
+    return research
+
+
+def load_sources(session:Session,research_ids:List[uuid.UUID])->Dict[uuid.UUID,List[dict]]:
+    """Sources of many research rows in one query, keyed by research id"""
+    found:Dict[uuid.UUID,List[dict]]={research_id:[] for research_id in research_ids}
+    if not research_ids:
+        return found
+    rows=session.exec(
+        select(ResearchSource.research_id,Source.title,Source.url)
+        .join(Source,Source.id==ResearchSource.source_id)
+        .where(ResearchSource.research_id.in_(research_ids))
+        .order_by(ResearchSource.research_id,ResearchSource.position)
+    ).all()
+    for research_id,title,url in rows:
+        found[research_id].append({"title":title,"url":url})
+    return found
+
+
+def delete_research_sources(session:Session,research_ids:List[uuid.UUID]):
+    """Drop the source links of research rows that are being deleted or archived"""
+    if research_ids:
+        session.execute(delete(ResearchSource).where(ResearchSource.research_id.in_(research_ids)))
+
+
+# ==================== MIGRATION OF OLDER ROWS ====================
+
+def extract_final_answer(stored:str)->str:
+    """
+    Recover the final answer from a row that stored the whole stream:
+    drop the progress lines before "Generating answer...", the appended
+    citation block and the closing "KNOWDEX has finished" line.
+    """
+    if _LEGACY_ANSWER_MARKER not in stored:
+        #A run that failed before answering stored nothing but progress text
+        return "" if stored.lstrip().startswith(_LEGACY_PREFIX) else stored.strip()
+    answer=stored.rsplit(_LEGACY_ANSWER_MARKER,1)[1]
+    answer=answer.rstrip()
+    if answer.endswith(_LEGACY_FINISHED):
+        answer=answer[:-len(_LEGACY_FINISHED)]
+    answer=_CITATION_BLOCK_RE.sub("",answer.rstrip()+"\n")
+    return answer.strip()
+
+
+def migrate_research_storage(batch_size:int=500)->int:
+    """
+    Move legacy JSON sources into the source tables and strip progress text
+    from stored answers. Safe to run repeatedly; migrated rows no longer match.
+    """
+    migrated=0
+    while True:
+        with Session(engine) as session:
+            rows=session.exec(
+                select(Research)
+                .where(or_(
+                    Research.sources!="[]",
+                    Research.answer.like(_LEGACY_PREFIX+"%"),
+                ))
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                return migrated
+            for research in rows:
+                try:
+                    legacy_sources=loads(research.sources or "[]")
+                except json.JSONDecodeError:
+                    legacy_sources=[]
+                attach_sources(session,research.id,[s for s in legacy_sources if isinstance(s,dict)])
+                research.answer=extract_final_answer(research.answer or "")
+                research.sources="[]"
+                session.add(research)
+            session.commit()
+        migrated+=len(rows)
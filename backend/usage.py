@@ -0,0 +1,101 @@
+"""
+Aggregates over research_usage: totals and p50/p95 per user, day, mode or model.
+
+Percentiles are computed in Python (SQLite has no percentile function) over
+the rows of the requested window only, one indexed range scan.
+"""
+import math
+import uuid
+from datetime import datetime
+from typing import Dict,List,Optional
+from sqlalchemy import String,cast
+from sqlmodel import Session,func,select
+from backend.database import engine
+from backend.models import ResearchUsage,User
+
+GROUP_BY=("user","day","mode","model")
+
+
+def percentile(sorted_values:List[float],q:float)->float:
+    """Nearest-rank percentile of an already sorted list (q in 0..100)"""
+    if not sorted_values:
+        return 0.0
+    rank=max(1,math.ceil(q/100*len(sorted_values)))
+    return sorted_values[rank-1]
+
+
+def _group_column(group_by:str):
+    if group_by=="user":
+        return func.coalesce(User.email,cast(ResearchUsage.user_id,String))
+    if group_by=="day":
+        return func.date(ResearchUsage.created_at)
+    if group_by=="mode":
+        return ResearchUsage.mode
+    if group_by=="model":
+        return func.coalesce(ResearchUsage.model,"unknown")
+    raise ValueError(f"group_by must be one of {', '.join(GROUP_BY)}")
+
+
+def usage_summary(
+    group_by:str="day",
+    since:Optional[datetime]=None,
+    until:Optional[datetime]=None,
+    user_id:Optional[uuid.UUID]=None
+)->List[dict]:
+    """Request count, token/search/cache totals (prompt tokens served by the prompt cache included), cost and p50/p95 per group"""
+    key=_group_column(group_by).label("key")
+    statement=select(
+        key,
+        ResearchUsage.prompt_tokens,
+        ResearchUsage.completion_tokens,
+        ResearchUsage.search_calls,
+        ResearchUsage.cache_hits,
+        ResearchUsage.cost_usd,
+        ResearchUsage.duration_ms,
+        ResearchUsage.cached_tokens,
+    )
+    if group_by=="user":
+        statement=statement.outerjoin(User,User.id==ResearchUsage.user_id)
+    if since is not None:
+        statement=statement.where(ResearchUsage.created_at>=since)
+    if until is not None:
+        statement=statement.where(ResearchUsage.created_at<until)
+    if user_id is not None:
+        statement=statement.where(ResearchUsage.user_id==user_id)
+
+    groups:Dict[str,List[tuple]]={}
+    with Session(engine) as session:
+        for row in session.exec(statement):
+            groups.setdefault(str(row[0]),[]).append(row[1:])
+
+    summary=[]
+    for group,rows in groups.items():
+        prompt_tokens=sum(row[0] for row in rows)
+        cached_tokens=sum(row[6] for row in rows)
+        tokens=sorted(prompt+completion for prompt,completion,*_ in rows)
+        costs=sorted(row[4] for row in rows)
+        durations=sorted(row[5] for row in rows)
+        summary.append({
+            "group":group,
+            "requests":len(rows),
+            "prompt_tokens":prompt_tokens,
+            "completion_tokens":sum(row[1] for row in rows),
+            "cached_tokens":cached_tokens,
+            "cached_share":round(cached_tokens/prompt_tokens,4) if prompt_tokens else 0.0,
+            "search_calls":sum(row[2] for row in rows),
+            "cache_hits":sum(row[3] for row in rows),
+            "cost_usd":round(sum(costs),6),
+            "tokens_p50":percentile(tokens,50),
+            "tokens_p95":percentile(tokens,95),
+            "cost_p50_usd":round(percentile(costs,50),6),
+            "cost_p95_usd":round(percentile(costs,95),6),
+            "latency_p50_ms":round(percentile(durations,50),1),
+            "latency_p95_ms":round(percentile(durations,95),1),
+        })
+    summary.sort(key=lambda item:item["group"],reverse=group_by=="day")
+    return summary
+
+
+def research_usage(research_id:uuid.UUID)->Optional[ResearchUsage]:
+    with Session(engine) as session:
+        return session.get(ResearchUsage,research_id)
@@ -0,0 +1,117 @@
+"""
+Startup warm-up and readiness, shared by the backend and Chainlit.
+
+Right after the server starts listening, warm_up() does the work the first
+user would otherwise wait for: it opens the database pool and the shared
+disk cache, imports the OpenAI SDK (deferred at import time, see
+agent/utils/http.py) and the agent (deferred by chainlit_app.py), opens the
+upstream connections and loads the past-research index. Each step is timed and best-effort; a failed step is
+logged and the request that needs it simply pays for it later. Until every
+step has run, GET /ready answers 503, so a platform health check only
+routes traffic to a warm instance.
+"""
+import asyncio
+import importlib
+import logging
+import time
+from typing import Dict,Optional
+from agent.config import settings
+from agent.utils.http import get_http_client
+from agent.utils.telemetry import log_event,metrics,span
+from backend.database import engine
+
+warmup_seconds=metrics.gauge("knowdex_warmup_seconds","Duration of each startup warm-up step")
+_warmup_task:Optional[asyncio.Task]=None
+
+
+class Readiness:
+    def __init__(self):
+        self.ready=False
+        self.steps:Dict[str,float]={}
+        self.errors:Dict[str,str]={}
+        self.duration_ms:Optional[float]=None
+
+    def report(self)->dict:
+        return {
+            "status":"ready" if self.ready else "warming_up",
+            "warmup_ms":self.duration_ms,
+            "steps":self.steps,
+            "errors":self.errors,
+        }
+
+
+readiness=Readiness()
+
+
+def _open_database():
+    """Fill the connection pool (each new connection also registers our SQL functions)"""
+    size=engine.pool.size() if hasattr(engine.pool,"size") else 1
+    connections=[engine.connect() for _ in range(max(1,size))]
+    try:
+        for conn in connections:
+            conn.exec_driver_sql("SELECT 1")
+    finally:
+        for conn in connections:
+            conn.close()
+
+
+async def _preconnect():
+    """One cheap request per upstream so the TLS connections are pooled before the first question"""
+    if settings.HTTP_MODE!="live" or not settings.WARMUP_PRECONNECT:
+        return
+    client=get_http_client()
+    await asyncio.gather(
+        client.head(settings.OPENAI_BASE_URL or "https://api.openai.com/v1",timeout=5.0),
+        client.head(settings.BRAVE_BASE_URL,timeout=5.0),
+        return_exceptions=True    #any response, even an error status, leaves a warm connection
+    )
+
+
+async def _open_disk_cache():
+    """Open the shared cache file (created on first use) on the loop thread, whose connection requests use"""
+    from agent.caching import disk_cache
+    if settings.CACHE_DISK_ENABLED:
+        disk_cache.stats()
+
+
+async def _load_knowledge_index():
+    if "past_research" in settings.AGENT_TOOLS:
+        from agent.knowledge.past_research import ensure_fresh
+        await ensure_fresh()
+
+
+async def warm_up():
+    steps=(
+        ("database",lambda:asyncio.to_thread(_open_database)),
+        ("disk_cache",_open_disk_cache),
+        ("openai_sdk",lambda:asyncio.to_thread(importlib.import_module,"openai")),
+        ("agent",lambda:asyncio.to_thread(importlib.import_module,"agent.agent")),
+        ("upstream_connections",_preconnect),
+        ("knowledge_index",_load_knowledge_index),
+    )
+    started=time.perf_counter()
+    for name,step in steps:
+        step_started=time.perf_counter()
+        try:
+            with span("warmup",step=name):
+                await step()
+        except Exception as e:
+            readiness.errors[name]=str(e)
+            log_event("warmup_step_failed",level=logging.WARNING,step=name,error=str(e))
+        seconds=time.perf_counter()-step_started
+        readiness.steps[name]=round(seconds*1000,1)
+        warmup_seconds.set(round(seconds,4),step=name)
+    readiness.duration_ms=round((time.perf_counter()-started)*1000,1)
+    readiness.ready=True
+    log_event("warmup_finished",duration_ms=readiness.duration_ms,**readiness.steps)
+
+
+def start_warmup()->Optional[asyncio.Task]:
+    """Start the warm-up once per process (needs a running loop)"""
+    global _warmup_task
+    if not settings.WARMUP_ENABLED:
+        readiness.ready=True
+        return None
+    if _warmup_task is None:
+        _warmup_task=asyncio.get_running_loop().create_task(warm_up())
+    return _warmup_task
@@ -0,0 +1,208 @@
+"""
+Load benchmark: POST /api/research and GET /api/history over real HTTP.
+
+Starts the upstream stubs (benchmarks/stubs.py) and the FastAPI backend
+in-process on free ports, against a throwaway database. Then it drives N
+concurrent research streams, followed by concurrent history reads. Nothing
+leaves the machine. Pass --target to load an already running backend instead.
+
+Run with:
+    python -m benchmarks.bench_api --concurrency 1 8 32 --requests 64
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+from benchmarks.common import latency_summary, print_result, quiet_logs, use_temp_database
+
+QUESTION = "What are the latest fintech funding rounds in Nigeria?"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve_in_thread(app, port: int):
+    """Run an ASGI app with uvicorn on a background thread, return once it accepts connections"""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 30
+    while not server.started:
+        if time.monotonic() > deadline or not thread.is_alive():
+            raise RuntimeError(f"Server on port {port} did not start")
+        time.sleep(0.05)
+    return server
+
+
+def start_stack(args) -> str:
+    """Stubs + backend on free ports; returns the backend base URL"""
+    if "agent.config" in sys.modules or "backend.database" in sys.modules:
+        # Settings and the engine have already read the environment: the stack would hit the real APIs
+        raise RuntimeError("start_stack must run before agent/backend modules are imported (use a fresh process)")
+    from benchmarks.stubs import Latency, StubConfig, UpstreamProfile, create_app
+
+    stub_port = free_port()
+    serve_in_thread(create_app(StubConfig(
+        openai=UpstreamProfile(Latency.parse(args.openai_latency), args.error_rate),
+        brave=UpstreamProfile(Latency.parse(args.brave_latency), args.error_rate),
+        token_ms=args.token_ms,
+        seed=1,
+    )), stub_port)
+
+    os.environ.update({
+        "OPENAI_API_KEY": "bench",
+        "BRAVE_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{stub_port}/v1",
+        "BRAVE_BASE_URL": f"http://127.0.0.1:{stub_port}",
+        "HTTP_MODE": "live",
+    })
+    use_temp_database()
+    quiet_logs()
+    from backend.main import app
+
+    backend_port = free_port()
+    serve_in_thread(app, backend_port)
+    return f"http://127.0.0.1:{backend_port}"
+
+
+def seed_history(rows: int):
+    """Add synthetic research rows so /api/history has something realistic to return"""
+    from backend.identity import get_or_create_user
+    from backend.storage import save_research
+
+    user = get_or_create_user("user@knowdex.local", "Test User")
+    for i in range(rows):
+        save_research(
+            user_id=user.id,
+            question=f"Synthetic question {i} about African startups",
+            answer="Synthetic answer text [1]. " * 60,
+            sources=[{"title": f"Source {i % 50}", "url": f"https://example.com/{i % 50}"}],
+        )
+
+
+async def _research_once(client, base_url: str, stats: dict):
+    started = time.perf_counter()
+    ttfb = None
+    received = 0
+    try:
+        async with client.stream("POST", f"{base_url}/api/research", json={"question": QUESTION}) as response:
+            body = []
+            async for text in response.aiter_text():
+                if ttfb is None:
+                    ttfb = time.perf_counter() - started
+                received += len(text)
+                body.append(text)
+            ok = response.status_code == 200 and "Fatal Error" not in "".join(body)
+    except Exception:
+        ok = False
+    total = time.perf_counter() - started
+    if ok:
+        stats["ttfb"].append(ttfb or total)
+        stats["latency"].append(total)
+        stats["chars"] += received
+    else:
+        stats["errors"] += 1
+
+
+async def research_load(base_url: str, concurrency: int, requests: int) -> Dict[str, float]:
+    import httpx
+
+    stats = {"ttfb": [], "latency": [], "chars": 0, "errors": 0}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        queue = asyncio.Queue()
+        for _ in range(requests):
+            queue.put_nowait(None)
+
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                await _research_once(client, base_url, stats)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+
+    return {
+        **latency_summary(stats["ttfb"], "ttfb_"),
+        **latency_summary(stats["latency"]),
+        # About four characters per token, the same estimate the stubs bill with
+        "tokens_per_s": round(stats["chars"] / 4 / wall, 1),
+        "requests_per_s": round(len(stats["latency"]) / wall, 2),
+        "errors": stats["errors"],
+    }
+
+
+async def history_load(base_url: str, concurrency: int, requests: int) -> Dict[str, float]:
+    import httpx
+
+    timings: List[float] = []
+    errors = 0
+    async with httpx.AsyncClient(timeout=60) as client:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(f"{base_url}/api/history")
+                    response.raise_for_status()
+                    timings.append(time.perf_counter() - started)
+                except Exception:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        wall = time.perf_counter() - started
+
+    return {**latency_summary(timings), "requests_per_s": round(len(timings) / wall, 2), "errors": errors}
+
+
+def run(args, base_url: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    base_url = base_url or args.target or start_stack(args)
+    if not args.target and args.history_rows:
+        seed_history(args.history_rows)
+
+    results = {}
+    for concurrency in args.concurrency:
+        name = f"api.research c={concurrency}"
+        results[name] = asyncio.run(research_load(base_url, concurrency, max(args.requests, concurrency)))
+        print_result(name, results[name])
+    for concurrency in args.concurrency:
+        name = f"api.history c={concurrency}"
+        results[name] = asyncio.run(history_load(base_url, concurrency, max(args.requests, concurrency)))
+        print_result(name, results[name])
+    return results
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=64, help="requests per concurrency level")
+    parser.add_argument("--history-rows", type=int, default=500)
+    parser.add_argument("--openai-latency", default="lognormal:300:0.3")
+    parser.add_argument("--brave-latency", default="normal:120:30")
+    parser.add_argument("--token-ms", type=float, default=2.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--target", default=None, help="base URL of a running backend (skips the in-process stack)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
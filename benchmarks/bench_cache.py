@@ -0,0 +1,161 @@
+"""
+Benchmark: the tiered cache (agent/utils/cache.py), memory versus disk tier.
+
+Measures, on a throwaway cache file:
+  - per-operation latency of a memory hit, a disk hit (what another worker
+    or a restarted process sees), a miss and a set (written to both tiers)
+  - the hit rate of a new process reading keys another process wrote,
+    with and without the disk tier (what a restart or a second worker gets)
+  - throughput of several processes reading and writing one file at once,
+    and how many operations failed, gave up on a locked file (busy) or were
+    dropped from a full write queue
+
+Run with:
+    python -m benchmarks.bench_cache --entries 2000 --processes 4
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from typing import Dict, List
+
+from benchmarks.common import latency_summary, print_result, quiet_logs
+
+
+def search_payload(n: int) -> dict:
+    """A cached Brave search: the query and five results"""
+    return {
+        "query": f"fintech funding news {n}",
+        "count": 5,
+        "results": [
+            {
+                "title": f"Fintech funding round {n}-{rank} - TechCabal",
+                "url": f"https://techcabal.com/2026/10/{n}/{rank}/fintech-funding",
+                "description": "Nigerian fintech startups raised new capital this quarter as investors return. " * 2,
+            }
+            for rank in range(5)
+        ],
+    }
+
+
+def new_cache(path: str, disk: bool = True):
+    from agent.utils.cache import SqliteCache, TieredCache, TTLCache
+
+    memory = TTLCache(maxsize=100_000, ttl=900)
+    return TieredCache(memory, SqliteCache(path), "search") if disk else memory
+
+
+def time_each(operation, keys: List[tuple]) -> List[float]:
+    seconds = []
+    for key in keys:
+        started = time.perf_counter()
+        operation(key)
+        seconds.append(time.perf_counter() - started)
+    return seconds
+
+
+def latencies(path: str, entries: int) -> Dict[str, Dict[str, float]]:
+    writer = new_cache(path)
+    keys = [(f"fintech funding news {n}", 5) for n in range(entries)]
+    payloads = {key: search_payload(n) for n, key in enumerate(keys)}
+    results = {
+        "cache.set": latency_summary(time_each(lambda key: writer.set(key, payloads[key]), keys)),
+        "cache.memory_hit": latency_summary(time_each(writer.get, keys)),
+    }
+    writer.disk.flush()         # disk writes are queued for a writer thread
+    reader = new_cache(path)    # same file, empty memory tier: another worker, or after a restart
+    results["cache.disk_hit"] = latency_summary(time_each(reader.get, keys))
+    results["cache.miss"] = latency_summary(time_each(reader.get, [(f"unknown {n}", 5) for n in range(entries)]))
+    return results
+
+
+def _fill(path: str, entries: int, disk: bool):
+    cache = new_cache(path, disk)
+    for n in range(entries):
+        cache.set((f"restart {n}", 5), search_payload(n))
+    if disk:
+        cache.disk.flush()      # pool workers exit without running atexit
+
+
+def _hit_rate(path: str, entries: int, disk: bool) -> float:
+    cache = new_cache(path, disk)
+    hits = sum(cache.get((f"restart {n}", 5)) is not None for n in range(entries))
+    return hits / entries
+
+
+def restart_hit_rate(path: str, entries: int) -> Dict[str, float]:
+    """Keys written by one process, read by a fresh one"""
+    results = {}
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        for disk in (False, True):
+            pool.apply(_fill, (path, entries, disk))
+        for disk in (False, True):
+            results["with_disk" if disk else "memory_only"] = round(pool.apply(_hit_rate, (path, entries, disk)), 3)
+    return results
+
+
+def _worker(path: str, operations: int, keyspace: int, write_share: float, seed: int) -> Dict[str, float]:
+    cache = new_cache(path)
+    rng = random.Random(seed)
+    hits = 0
+    started = time.perf_counter()
+    for _ in range(operations):
+        n = rng.randrange(keyspace)
+        if rng.random() < write_share:
+            cache.set((f"shared {n}", 5), search_payload(n))
+        elif cache.get((f"shared {n}", 5)) is not None:
+            hits += 1
+    cache.disk.flush()
+    return {
+        "seconds": time.perf_counter() - started, "hits": hits,
+        "errors": cache.disk.errors, "busy": cache.disk.busy, "dropped": cache.disk.dropped,
+    }
+
+
+def concurrent_workers(path: str, processes: int, operations: int, write_share: float) -> Dict[str, float]:
+    keyspace = operations
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        outcomes = pool.starmap(
+            _worker, [(path, operations, keyspace, write_share, seed) for seed in range(processes)]
+        )
+    slowest = max(outcome["seconds"] for outcome in outcomes)
+    return {
+        "processes": processes,
+        "ops_per_s": round(processes * operations / slowest, 1),
+        "slowest_worker_s": round(slowest, 3),
+        "reads_hit": sum(outcome["hits"] for outcome in outcomes),
+        "errors": sum(outcome["errors"] for outcome in outcomes),
+        "busy": sum(outcome["busy"] for outcome in outcomes),
+        "dropped": sum(outcome["dropped"] for outcome in outcomes),
+    }
+
+
+def run(args) -> Dict[str, Dict[str, float]]:
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ.setdefault("BRAVE_API_KEY", "bench")
+    workdir = tempfile.mkdtemp(prefix="knowdex-bench-")
+    os.environ["CACHE_DISK_PATH"] = os.path.join(workdir, "cache.db")
+    quiet_logs()
+    results = latencies(os.path.join(workdir, "latency.db"), args.entries)
+    results["cache.restart_hit_rate"] = restart_hit_rate(os.path.join(workdir, "restart.db"), args.entries)
+    results["cache.concurrent"] = concurrent_workers(
+        os.path.join(workdir, "shared.db"), args.processes, args.entries, args.write_share
+    )
+    for name, metrics in results.items():
+        print_result(name, metrics)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=2000, help="keys per phase, and operations per worker")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--write-share", type=float, default=0.2, help="share of worker operations that are sets")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Micro-benchmarks of every KnowdexDataLayer operation on a synthetic dataset
+(10k threads / 100k steps by default) in a throwaway SQLite database.
+
+Each operation runs `--repeat` times against random threads; reads and
+writes hit the same tables a busy deployment would.
+
+Run with:
+    python -m benchmarks.bench_data_layer --threads 10000 --steps-per-thread 10
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Dict, List
+
+from benchmarks.common import latency_summary, print_result, quiet_logs, use_temp_database
+
+USER_EMAIL = "bench@knowdex.local"
+WORDS = ["fintech", "funding", "nigeria", "kenya", "solar", "startup", "policy", "election", "mobile", "money"]
+
+
+def build_dataset(threads: int, steps_per_thread: int, seed: int = 7) -> List[str]:
+    """Bulk insert threads with their steps; returns the thread ids"""
+    from backend.database import engine
+    from backend.identity import get_or_create_user
+    from backend.models import Step, Thread
+
+    rng = random.Random(seed)
+    user = get_or_create_user(USER_EMAIL, "Bench User")
+    thread_ids = [str(uuid.uuid4()) for _ in range(threads)]
+    start = datetime.utcnow() - timedelta(days=60)
+    with engine.begin() as conn:
+        conn.execute(Thread.__table__.insert(), [
+            {
+                "id": thread_id,
+                "user_id": str(user.id),
+                "name": f"Thread {i}",
+                "created_at": start + timedelta(minutes=i),
+                "thread_metadata": "{}",
+                "tags": "[]",
+            }
+            for i, thread_id in enumerate(thread_ids)
+        ])
+        batch = []
+        for i, thread_id in enumerate(thread_ids):
+            for j in range(steps_per_thread):
+                topic = " ".join(rng.choice(WORDS) for _ in range(4))
+                batch.append({
+                    "id": str(uuid.uuid4()),
+                    "thread_id": thread_id,
+                    "parent_id": None,
+                    "name": "assistant" if j % 2 else "user",
+                    "type": "assistant_message" if j % 2 else "user_message",
+                    "input": f"Question about {topic}" if j % 2 == 0 else None,
+                    "output": f"Answer about {topic}. " * 20 if j % 2 else None,
+                    "created_at": start + timedelta(minutes=i, seconds=j),
+                    "start_time": None,
+                    "end_time": None,
+                    "generation": None,
+                    "step_metadata": json.dumps({"index": j}) if j % 3 else "{}",
+                })
+            if len(batch) >= 20_000:
+                conn.execute(Step.__table__.insert(), batch)
+                batch = []
+        if batch:
+            conn.execute(Step.__table__.insert(), batch)
+    return thread_ids
+
+
+async def measure(name: str, operation, repeat: int) -> Dict[str, float]:
+    timings = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        await operation(i)
+        timings.append(time.perf_counter() - started)
+    result = {**latency_summary(timings), "ops_per_s": round(repeat / sum(timings), 1)}
+    print_result(name, result)
+    return result
+
+
+async def run_operations(layer, thread_ids: List[str], repeat: int, seed: int = 11) -> Dict[str, Dict[str, float]]:
+    from chainlit.context import init_http_context
+    from chainlit.types import Pagination, ThreadFilter
+
+    # create_step & co. queue their writes outside of a request context
+    init_http_context()
+    rng = random.Random(seed)
+    user_id = (await layer.get_user(USER_EMAIL))["id"]
+    pick = lambda: rng.choice(thread_ids)
+    new_threads = [str(uuid.uuid4()) for _ in range(repeat)]
+    new_steps = [str(uuid.uuid4()) for _ in range(repeat)]
+    new_elements = [str(uuid.uuid4()) for _ in range(repeat)]
+
+    def step_dict(i, **extra):
+        return {
+            "id": new_steps[i],
+            "threadId": new_threads[i],
+            "name": "user",
+            "type": "user_message",
+            "input": f"Benchmark question {i} about {rng.choice(WORDS)}",
+            "metadata": {},
+            **extra,
+        }
+
+    def element(i):
+        return SimpleNamespace(
+            id=new_elements[i], thread_id=new_threads[i], type="file", url=f"https://example.com/file-{i}.txt", name=f"file-{i}.txt",
+            display="inline", size=None, language=None, for_id=None, mime="text/plain",
+        )
+
+    operations = [
+        ("get_user", lambda i: layer.get_user(USER_EMAIL)),
+        ("create_user (existing)", lambda i: layer.create_user({"identifier": USER_EMAIL, "metadata": {}})),
+        ("create_thread", lambda i: layer.create_thread(new_threads[i], str(user_id), name=f"New {i}")),
+        ("update_thread", lambda i: layer.update_thread(new_threads[i], name=f"Renamed {i}", tags=["bench"])),
+        ("create_step", lambda i: layer.create_step(step_dict(i))),
+        ("update_step", lambda i: layer.update_step(step_dict(i, output="Updated answer", end=datetime.utcnow().isoformat()))),
+        ("create_element", lambda i: layer.create_element(element(i))),
+        ("get_element", lambda i: layer.get_element(new_threads[i], new_elements[i])),
+        ("get_thread", lambda i: layer.get_thread(pick())),
+        ("get_thread_steps", lambda i: layer.get_thread_steps(pick(), limit=50)),
+        ("get_thread_author", lambda i: layer.get_thread_author(pick())),
+        # KnowdexDataLayer reads Pagination.first as the offset of the page
+        ("list_threads (first page)", lambda i: layer.list_threads(Pagination(first=0), ThreadFilter(userId=str(user_id)))),
+        ("list_threads (deep page)", lambda i: layer.list_threads(Pagination(first=len(thread_ids) // 2), ThreadFilter(userId=str(user_id)))),
+        ("list_threads (search)", lambda i: layer.list_threads(Pagination(first=0), ThreadFilter(userId=str(user_id), search=f"{rng.choice(WORDS)} {rng.choice(WORDS)}"))),
+        ("delete_element", lambda i: layer.delete_element(new_elements[i])),
+        ("delete_step", lambda i: layer.delete_step(new_steps[i])),
+        ("delete_thread", lambda i: layer.delete_thread(new_threads[i])),
+    ]
+    results = {}
+    for name, operation in operations:
+        try:
+            results[f"data_layer.{name}"] = await measure(f"data_layer.{name}", operation, repeat)
+        except Exception as e:
+            print(f"data_layer.{name:<32} skipped: {type(e).__name__}: {e}")
+    return results
+
+
+def run(args) -> Dict[str, Dict[str, float]]:
+    workdir = use_temp_database()
+    quiet_logs()
+    from chainlit_data_layer import KnowdexDataLayer
+
+    print(f"Building {args.threads} threads x {args.steps_per_thread} steps in {workdir} ...")
+    started = time.perf_counter()
+    thread_ids = build_dataset(args.threads, args.steps_per_thread)
+    print(f"Dataset ready in {time.perf_counter() - started:.1f}s\n")
+    return asyncio.run(run_operations(KnowdexDataLayer(), thread_ids, args.repeat))
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--threads", type=int, default=10_000)
+    parser.add_argument("--steps-per-thread", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=200)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark: resuming very long conversations.
+
+Builds a throwaway SQLite database with synthetic threads of 10k+ steps and
+compares the old "load every step and decode every metadata" path with the
+windowed get_thread / get_thread_steps paging.
+
+Run with:
+    python -m benchmarks.bench_get_thread --steps 20000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+
+def build_database(step_counts):
+    """Insert one synthetic thread per entry of step_counts, in bulk"""
+    from backend.database import engine
+    from chainlit_data_layer import Step, Thread
+
+    thread_ids = []
+    with engine.begin() as conn:
+        for count in step_counts:
+            thread_id = str(uuid.uuid4())
+            thread_ids.append(thread_id)
+            conn.execute(Thread.__table__.insert(), [{
+                "id": thread_id,
+                "user_id": "bench-user",
+                "name": f"Synthetic thread with {count} steps",
+                "created_at": datetime.utcnow(),
+                "thread_metadata": "{}",
+                "tags": "[]",
+            }])
+            start = datetime.utcnow() - timedelta(days=30)
+            rows = []
+            for i in range(count):
+                rows.append({
+                    "id": str(uuid.uuid4()),
+                    "thread_id": thread_id,
+                    "parent_id": None,
+                    "name": "assistant" if i % 2 else "user",
+                    "type": "assistant_message" if i % 2 else "user_message",
+                    "input": f"Question {i} about African fintech funding rounds",
+                    "output": "Answer text " * 40,
+                    "created_at": start + timedelta(seconds=i),
+                    "start_time": None,
+                    "end_time": None,
+                    "generation": None,
+                    "step_metadata": json.dumps({"language": "en", "index": i}) if i % 3 else "{}",
+                })
+            conn.execute(Step.__table__.insert(), rows)
+    return thread_ids
+
+
+def full_history(thread_id):
+    """The previous get_thread behaviour: every step, every metadata decoded"""
+    from sqlmodel import Session, select
+    from backend.database import engine
+    from chainlit_data_layer import Step
+
+    with Session(engine) as session:
+        steps = session.exec(
+            select(Step).where(Step.thread_id == thread_id).order_by(Step.created_at)
+        ).all()
+        return [
+            {
+                "id": step.id,
+                "output": step.output,
+                "metadata": json.loads(step.step_metadata) if step.step_metadata else {},
+            }
+            for step in steps
+        ]
+
+
+def measure(label, func, repeat):
+    """Run func `repeat` times, report median wall time and peak traced memory"""
+    timings = []
+    tracemalloc.start()
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result = {
+        "operation": label,
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "peak_kib": round(peak / 1024, 1),
+    }
+    print(f"{label:<45} {result['median_ms']:>10.2f} ms {result['peak_kib']:>10.1f} KiB")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, nargs="+", default=[10_000, 50_000])
+    parser.add_argument("--window", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="knowdex-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+    from chainlit_data_layer import KnowdexDataLayer
+
+    print(f"Building synthetic threads {args.steps} in {workdir} ...")
+    thread_ids = build_database(args.steps)
+    layer = KnowdexDataLayer(step_window=args.window)
+
+    results = []
+    for count, thread_id in zip(args.steps, thread_ids):
+        print(f"\nThread with {count} steps (window={args.window})")
+        results.append(measure("full history (previous get_thread)", lambda: full_history(thread_id), args.repeat))
+        results.append(measure("get_thread (newest window)", lambda: asyncio.run(layer.get_thread(thread_id)), args.repeat))
+
+        first_page = asyncio.run(layer.get_thread(thread_id))
+        cursor = first_page["steps"][0]["id"]
+        results.append(measure(
+            "get_thread_steps (one older page)",
+            lambda: asyncio.run(layer.get_thread_steps(thread_id, before=cursor)),
+            args.repeat,
+        ))
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Micro-benchmark: JSON on the hot paths, the json module versus agent/utils/jsoncodec.py.
+
+Times, per operation:
+  - one SSE token frame, as a str that Starlette encodes (the old
+    openai_to_sse) and as pre-built bytes
+  - one chat step as stored and read by the data layer: metadata and
+    generation encoded, metadata decoded
+  - a Brave search response body decoded (httpx's .json() goes through text)
+  - one structured log line (every span writes one)
+  - one compressed retention archive payload round trip
+
+Each codec backend available here is measured ("json" always, "orjson" when
+installed).
+
+Run with:
+    python -m benchmarks.bench_json --number 20000
+"""
+
+import argparse
+import json
+import timeit
+import uuid
+import zlib
+from datetime import datetime, timezone
+from typing import Callable, Dict
+
+from benchmarks.common import print_result
+
+TOKEN = " Nigeria's"
+STEP_METADATA = {
+    "answer": "Moniepoint raised $110 million in a Series C round led by Development Partners International [1]. " * 8,
+    "language": "en-US",
+    "sources": [{"title": f"Source {n}", "url": f"https://example.com/story/{n}"} for n in range(5)],
+}
+GENERATION = {
+    "provider": "openai", "model": "gpt-4o-mini", "settings": {"temperature": 0.0, "max_tokens": 1024},
+    "messages": [{"role": "user", "content": "Latest fintech funding news in Nigeria?"}] * 3,
+    "token_count": 1190,
+}
+BRAVE_BODY = json.dumps({
+    "type": "search",
+    "query": {"original": "fintech funding Nigeria"},
+    "web": {"type": "search", "results": [
+        {
+            "title": f"Fintech funding round {n} - TechCabal",
+            "url": f"https://techcabal.com/2026/10/{n}/fintech-funding",
+            "description": "Nigerian fintech startups raised new capital this quarter as investors return to the market. " * 3,
+            "age": "2 days ago", "language": "en", "family_friendly": True,
+            "profile": {"name": "TechCabal", "url": "https://techcabal.com", "img": "https://imgs.search.brave.com/x.png"},
+            "extra_snippets": ["Funding rounds in Lagos and Nairobi dominated the quarter."] * 4,
+        }
+        for n in range(20)
+    ]},
+}).encode("utf-8")
+LOG_PAYLOAD = {
+    "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"), "level": "info", "event": "span",
+    "request_id": uuid.uuid4().hex, "stage": "llm.final_answer", "upstream": "openai", "status": "ok",
+    "duration_ms": 364.721,
+}
+ARCHIVE = {"research": [
+    {"id": str(uuid.uuid4()), "question": "Question about African startups", "answer": "Answer text [1]. " * 60,
+     "created_at": datetime.now().isoformat()}
+    for _ in range(50)
+]}
+
+
+def stdlib_cases() -> Dict[str, Callable]:
+    """The calls as the code made them before the codec layer"""
+    stored_metadata = json.dumps(STEP_METADATA)
+    blob = zlib.compress(json.dumps(ARCHIVE, separators=(",", ":")).encode("utf-8"), 6)
+    return {
+        "sse_token_frame": lambda: ("data:" + json.dumps({"type": "token", "content": TOKEN}) + "\n\n").encode("utf-8"),
+        "step_write": lambda: (json.dumps(STEP_METADATA), json.dumps(GENERATION)),
+        "step_read": lambda: json.loads(stored_metadata),
+        "brave_decode": lambda: json.loads(BRAVE_BODY.decode("utf-8")),
+        "log_line": lambda: json.dumps(LOG_PAYLOAD, default=str),
+        "archive_roundtrip": lambda: json.loads(zlib.decompress(blob).decode("utf-8")),
+    }
+
+
+def codec_cases(codec) -> Dict[str, Callable]:
+    stored_metadata = codec.dumps(STEP_METADATA)
+    blob = zlib.compress(codec.dumps_bytes(ARCHIVE), 6)
+    return {
+        "sse_token_frame": lambda: b"data:" + codec.dumps_bytes({"type": "token", "content": TOKEN}) + b"\n\n",
+        "step_write": lambda: (codec.dumps(STEP_METADATA), codec.dumps(GENERATION)),
+        "step_read": lambda: codec.loads(stored_metadata),
+        "brave_decode": lambda: codec.loads(BRAVE_BODY),
+        "log_line": lambda: codec.dumps(LOG_PAYLOAD, default=str),
+        "archive_roundtrip": lambda: codec.loads(zlib.decompress(blob)),
+    }
+
+
+def time_cases(cases: Dict[str, Callable], number: int, repeat: int) -> Dict[str, float]:
+    """Best-of-`repeat` nanoseconds per call"""
+    return {
+        name: round(min(timeit.repeat(case, number=number, repeat=repeat)) / number * 1e9, 1)
+        for name, case in cases.items()
+    }
+
+
+def run(args) -> Dict[str, Dict[str, float]]:
+    from agent.utils.jsoncodec import OrjsonCodec, StdlibCodec
+
+    codecs = [StdlibCodec()]
+    try:
+        codecs.append(OrjsonCodec())
+    except ImportError:
+        print("orjson is not installed; only the stdlib backend is measured")
+
+    baseline = time_cases(stdlib_cases(), args.number, args.repeat)
+    results = {"json.before_ns": baseline}
+    for codec in codecs:
+        timings = time_cases(codec_cases(codec), args.number, args.repeat)
+        results[f"json.{codec.name}_ns"] = timings
+        results[f"json.{codec.name}_speedup"] = {
+            name: round(baseline[name] / timings[name], 2) for name in baseline
+        }
+
+    for name, metrics in results.items():
+        print_result(name, metrics)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=20_000, help="calls per timing")
+    parser.add_argument("--repeat", type=int, default=5)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+A/B benchmark: per-stage model settings (agent/stages.py).
+
+Runs the same questions through the agent once per variant and reports per
+stage (tool decision, first token, final answer) the latency and the
+prompt/cached/completion tokens, plus end-to-end latency and cost per
+question. A variant is a set of stage overrides for the mode under test,
+in MODE_MODELS form:
+
+    python -m benchmarks.bench_models --questions 20 \\
+        --variant baseline='{}' \\
+        --variant nano-decision='{"decision":{"model":"gpt-4.1-nano","max_tokens":200}}'
+
+By default the upstreams are the stubs (benchmarks/stubs.py), where each
+model's latency is set with --model-latency. With --live the configured
+OpenAI and Brave endpoints are used instead (and billed).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+from typing import Dict, List
+
+from benchmarks.common import latency_summary, percentile, print_result, quiet_logs, use_temp_database
+
+QUESTIONS = [
+    "What are the latest fintech funding rounds in Nigeria?",
+    "Which African startups raised money this month?",
+    "What is the population of Lagos now?",
+    "Who won the most recent election in Ghana?",
+    "What are the newest mobile money regulations in Kenya?",
+]
+STAGE_KEYS = {
+    "decision": "llm.tool_decision:openai",
+    "first_token": "llm.first_token:openai",
+    "answer": "llm.final_answer:openai",
+}
+DEFAULT_VARIANTS = [
+    "baseline={}",
+    'nano-decision={"decision":{"model":"gpt-4.1-nano","max_tokens":200}}',
+]
+
+
+def parse_variants(specs: List[str]) -> Dict[str, dict]:
+    variants = {}
+    for spec in specs:
+        name, _, overrides = spec.partition("=")
+        variants[name] = json.loads(overrides or "{}")
+    return variants
+
+
+def start_stubs(args):
+    from benchmarks.bench_api import free_port, serve_in_thread
+    from benchmarks.stubs import Latency, StubConfig, UpstreamProfile, create_app, parse_model_latency
+
+    port = free_port()
+    serve_in_thread(create_app(StubConfig(
+        openai=UpstreamProfile(Latency.parse(args.openai_latency)),
+        brave=UpstreamProfile(Latency.parse(args.brave_latency)),
+        token_ms=args.token_ms,
+        model_latency=parse_model_latency(args.model_latency),
+        seed=1,
+    )), port)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+    os.environ["BRAVE_BASE_URL"] = f"http://127.0.0.1:{port}"
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ.setdefault("BRAVE_API_KEY", "bench")
+
+
+def summarize_variant(results) -> Dict[str, float]:
+    """Latency per stage (p50/p95 ms), tokens per stage (mean), end to end latency and cost"""
+    answered = [result for result in results if result.error is None]
+    summary = {"questions": len(results), "errors": len(results) - len(answered)}
+    for stage, key in STAGE_KEYS.items():
+        values = sorted(result.timings.get(key, 0.0) for result in answered)
+        summary[f"{stage}_p50_ms"] = round(percentile(values, 50), 1)
+        summary[f"{stage}_p95_ms"] = round(percentile(values, 95), 1)
+    for stage in ("decision", "answer"):
+        stages = [result.usage.stages.get(stage, {}) for result in answered]
+        for field in ("prompt_tokens", "cached_tokens", "completion_tokens"):
+            summary[f"{stage}_{field}"] = round(sum(s.get(field, 0) for s in stages) / max(len(stages), 1), 1)
+        models = {s["model"] for s in stages if s.get("model")}
+        summary[f"{stage}_model"] = ",".join(sorted(models)) or "-"
+    summary.update(latency_summary([result.duration_ms / 1000 for result in answered], prefix="total_"))
+    summary["cost_per_question_usd"] = round(
+        sum(result.usage.cost_usd for result in answered) / max(len(answered), 1), 6
+    )
+    return summary
+
+
+async def run_variant(name: str, overrides: dict, args) -> Dict[str, float]:
+    from agent.batch import research_one
+    from agent.config import settings
+
+    settings.MODE_MODELS = {**settings.MODE_MODELS, args.mode: overrides}
+    results = []
+    for n in range(args.questions):
+        # Distinct per variant and round, so neither variant is served by the other's search cache
+        question = f"{QUESTIONS[n % len(QUESTIONS)]} ({name} {n})"
+        results.append(await research_one(n, question, mode=args.mode))
+    return summarize_variant(results)
+
+
+def compare(results: Dict[str, Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    """Relative change of each variant's latencies, tokens and cost against the first variant"""
+    names = list(results)
+    baseline = results[names[0]]
+    comparison = {}
+    for name in names[1:]:
+        comparison[f"models.{name}_vs_{names[0]}"] = {
+            metric: round((value - baseline[metric]) / baseline[metric], 3)
+            for metric, value in results[name].items()
+            if isinstance(value, (int, float)) and isinstance(baseline.get(metric), (int, float)) and baseline[metric]
+            and metric not in ("questions", "errors")
+        }
+    return comparison
+
+
+def run(args) -> Dict[str, Dict[str, float]]:
+    use_temp_database()
+    os.environ["CACHE_DISK_ENABLED"] = "false"
+    if not args.live:
+        start_stubs(args)
+    quiet_logs()
+    from backend.migrations import run_migrations
+
+    run_migrations()
+
+    async def main():
+        from agent.utils.http import close_http_clients
+
+        results = {}
+        for name, overrides in parse_variants(args.variant or DEFAULT_VARIANTS).items():
+            results[name] = await run_variant(name, overrides, args)
+        await close_http_clients()
+        return results
+
+    variants = asyncio.run(main())
+    results = {f"models.{name}": summary for name, summary in variants.items()}
+    results.update(compare(variants))
+    for name, metrics in results.items():
+        print_result(name, metrics)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--variant", action="append", metavar="NAME=JSON", help="stage overrides (repeatable; the first is the baseline)")
+    parser.add_argument("--mode", default="research", help="request mode the overrides apply to")
+    parser.add_argument("--questions", type=int, default=10, help="questions per variant")
+    parser.add_argument("--live", action="store_true", help="use the real upstreams instead of the stubs")
+    parser.add_argument("--openai-latency", default="lognormal:600:0.4")
+    parser.add_argument("--brave-latency", default="normal:250:60")
+    parser.add_argument("--token-ms", type=float, default=5.0)
+    parser.add_argument(
+        "--model-latency", action="append", metavar="MODEL=SPEC",
+        default=["gpt-4o-mini=lognormal:600:0.4", "gpt-4.1-nano=lognormal:250:0.4"],
+        help="per-model stub latency",
+    )
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark: fair-share scheduling of upstream calls (agent/scheduler.py).
+
+Simulates one heavy user who submits many questions at once, next to light
+users who ask one question at a time, against an upstream with a fixed
+number of concurrent calls. Each question makes two calls (tool decision and
+answer) with lognormal service times. Compares a plain FIFO semaphore with
+the fair scheduler and reports, per user kind, the wait for a slot and the
+question latency (p50/p95 ms), plus how long the heavy user's questions
+took overall. Weights and caps can be varied to tune SCHEDULER_* settings.
+
+Run with:
+    python -m benchmarks.bench_scheduler --heavy-questions 40 --light-users 3 --capacity 4
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List
+
+from benchmarks.common import latency_summary, print_result, quiet_logs
+
+
+class FifoSlots:
+    """Baseline: first come, first served, no per-user limits"""
+
+    def __init__(self, capacity: int):
+        self.semaphore = asyncio.Semaphore(capacity)
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self.semaphore:
+            yield
+
+
+async def ask(slots, user: str, mode: str, rng: random.Random, args, waits: List[float]) -> float:
+    from agent.scheduler import set_requester
+    from agent.utils.accounting import track_usage
+
+    set_requester(user)
+    track_usage(mode)
+    started = time.perf_counter()
+    for median_ms in (args.decision_ms, args.answer_ms):
+        queued = time.perf_counter()
+        async with slots.slot():
+            waits.append(time.perf_counter() - queued)
+            await asyncio.sleep(rng.lognormvariate(0, 0.4) * median_ms / 1000)
+    return time.perf_counter() - started
+
+
+async def light_user(slots, n: int, rng: random.Random, args, waits, latencies, stop: asyncio.Event):
+    while not stop.is_set():
+        await asyncio.sleep(rng.expovariate(1000 / args.think_ms))
+        if stop.is_set():
+            break
+        latencies.append(await ask(slots, f"light-{n}", "research", rng, args, waits))
+
+
+async def scenario(slots, args) -> Dict[str, Dict[str, float]]:
+    rng = random.Random(args.seed)
+    waits = {"heavy": [], "light": []}
+    latencies = {"heavy": [], "light": []}
+    stop = asyncio.Event()
+    light = [
+        asyncio.create_task(light_user(slots, n, random.Random(args.seed + n + 1), args, waits["light"], latencies["light"], stop))
+        for n in range(args.light_users)
+    ]
+    started = time.perf_counter()
+    latencies["heavy"] = await asyncio.gather(*(
+        ask(slots, "heavy", args.heavy_mode, rng, args, waits["heavy"]) for _ in range(args.heavy_questions)
+    ))
+    heavy_seconds = time.perf_counter() - started
+    stop.set()
+    await asyncio.gather(*light)
+
+    results = {}
+    for kind in ("heavy", "light"):
+        wait = latency_summary(waits[kind], prefix="wait_")
+        latency = latency_summary(latencies[kind], prefix="question_")
+        results[kind] = {
+            "questions": len(latencies[kind]),
+            "wait_p50_ms": wait["wait_p50_ms"],
+            "wait_p99_ms": wait["wait_p99_ms"],
+            "question_p50_ms": latency["question_p50_ms"],
+            "question_p99_ms": latency["question_p99_ms"],
+        }
+    results["heavy"]["all_done_s"] = round(heavy_seconds, 2)
+    return results
+
+
+def run(args) -> Dict[str, Dict[str, float]]:
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ.setdefault("BRAVE_API_KEY", "bench")
+    quiet_logs()
+    from agent.config import settings
+    from agent.scheduler import FairScheduler
+
+    settings.SCHEDULER_BATCH_SHARE = args.batch_share
+    settings.SCHEDULER_WEIGHTS = {"heavy": args.heavy_weight}
+    results = {}
+    for name, slots in (
+        ("fifo", lambda: FifoSlots(args.capacity)),
+        ("fair", lambda: FairScheduler("bench", args.capacity, args.user_cap)),
+    ):
+        for kind, metrics in asyncio.run(scenario(slots(), args)).items():
+            results[f"scheduler.{name}.{kind}"] = metrics
+    for name, metrics in results.items():
+        print_result(name, metrics)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--heavy-questions", type=int, default=40, help="questions the heavy user submits at once")
+    parser.add_argument("--heavy-mode", default="research", help='"research" (pasted into the chat) or "batch"')
+    parser.add_argument("--heavy-weight", type=int, default=1)
+    parser.add_argument("--light-users", type=int, default=3)
+    parser.add_argument("--think-ms", type=float, default=500.0, help="mean pause of a light user between questions")
+    parser.add_argument("--capacity", type=int, default=4, help="concurrent upstream calls")
+    parser.add_argument("--user-cap", type=int, default=2, help="concurrent calls per user (fair scheduler only)")
+    parser.add_argument("--batch-share", type=float, default=0.1)
+    parser.add_argument("--decision-ms", type=float, default=300.0, help="median latency of the first call")
+    parser.add_argument("--answer-ms", type=float, default=600.0, help="median latency of the second call")
+    parser.add_argument("--seed", type=int, default=1)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
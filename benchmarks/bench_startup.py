@@ -0,0 +1,165 @@
+"""
+Benchmark: cold start of both entry points.
+
+Imports backend.main and chainlit_app in fresh interpreters with
+`python -X importtime` and reports where the time goes: total import time,
+the slowest modules by cumulative time and third-party packages by their
+own (self) time. Then it starts the backend with uvicorn against the
+upstream stubs and measures how long the process takes to accept
+connections and to report ready on GET /ready (warm-up done).
+
+Every run uses a throwaway database, so migrations run from scratch; pass
+--warm-db to measure a restart against an already migrated database.
+
+Run with:
+    python -m benchmarks.bench_startup --top 15
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from benchmarks.bench_api import free_port, serve_in_thread
+from benchmarks.common import print_result
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINTS = ("backend.main", "chainlit_app")
+OUR_PACKAGES = ("agent", "backend", "benchmarks", "chainlit_app", "chainlit_data_layer")
+
+
+def _env(workdir: str, **extra) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": ROOT,
+        "OPENAI_API_KEY": env.get("OPENAI_API_KEY") or "bench",
+        "BRAVE_API_KEY": env.get("BRAVE_API_KEY") or "bench",
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "KNOWLEDGE_INDEX_DIR": os.path.join(workdir, "knowledge_index"),
+        "CACHE_DISK_PATH": os.path.join(workdir, "cache.db"),
+    })
+    env.update(extra)
+    return env
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """(module, self_us, cumulative_us, depth) for each line of -X importtime output"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def import_profile(module: str, workdir: str) -> List[Tuple[str, int, int, int]]:
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=workdir, env=_env(workdir), capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    return parse_importtime(completed.stderr)
+
+
+def report_imports(module: str, rows, top: int) -> Dict[str, float]:
+    total_us = next((cumulative for name, _, cumulative, _ in rows if name == module), 0)
+    by_package = defaultdict(int)
+    for name, self_us, _, _ in rows:
+        by_package[name.split(".")[0]] += self_us
+
+    print(f"\nimport {module}: {total_us / 1000:.0f} ms")
+    print("  slowest of our modules (cumulative, includes what they import):")
+    ours = [row for row in rows if row[0].split(".")[0] in OUR_PACKAGES]
+    for name, _, cumulative, _ in sorted(ours, key=lambda row: row[2], reverse=True)[:top]:
+        print(f"    {cumulative / 1000:8.1f} ms  {name}")
+    print("  heaviest packages (self time):")
+    for name, self_us in sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"    {self_us / 1000:8.1f} ms  {name}")
+
+    results = {"import_ms": round(total_us / 1000, 1)}
+    for name, self_us in sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:5]:
+        results[f"{name}_ms"] = round(self_us / 1000, 1)
+    return results
+
+
+def backend_cold_start(workdir: str, stub_port: int, timeout: float = 60.0) -> Dict[str, float]:
+    """Seconds from spawning uvicorn until it accepts connections and until /ready answers 200"""
+    import httpx
+
+    port = free_port()
+    env = _env(
+        workdir,
+        OPENAI_BASE_URL=f"http://127.0.0.1:{stub_port}/v1",
+        BRAVE_BASE_URL=f"http://127.0.0.1:{stub_port}",
+    )
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    listening = None
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError("uvicorn exited during startup")
+            try:
+                response = httpx.get(f"http://127.0.0.1:{port}/ready", timeout=1.0)
+            except httpx.TransportError:
+                time.sleep(0.01)
+                continue
+            listening = listening or time.perf_counter() - started
+            if response.status_code == 200:
+                report = response.json()
+                results = {
+                    "listening_ms": round(listening * 1000, 1),
+                    "ready_ms": round((time.perf_counter() - started) * 1000, 1),
+                    "warmup_ms": report["warmup_ms"],
+                }
+                results.update({f"warmup_{step}_ms": ms for step, ms in report["steps"].items()})
+                return results
+            time.sleep(0.01)
+        raise RuntimeError(f"backend not ready after {timeout:.0f}s")
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def run(args) -> Dict[str, Dict[str, float]]:
+    from benchmarks.stubs import StubConfig, create_app
+
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="knowdex-bench-")
+    for module in args.entry_points:
+        if not args.warm_db:
+            workdir = tempfile.mkdtemp(prefix="knowdex-bench-")
+        results[f"startup.import.{module}"] = report_imports(module, import_profile(module, workdir), args.top)
+
+    stub_port = free_port()
+    serve_in_thread(create_app(StubConfig(seed=1)), stub_port)
+    if not args.warm_db:
+        workdir = tempfile.mkdtemp(prefix="knowdex-bench-")
+    results["startup.backend.cold_start"] = backend_cold_start(workdir, stub_port)
+
+    print()
+    for name, metrics in results.items():
+        print_result(name, metrics)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entry-points", nargs="+", default=list(ENTRY_POINTS))
+    parser.add_argument("--top", type=int, default=10, help="rows per table")
+    parser.add_argument("--warm-db", action="store_true", help="reuse one migrated database across runs")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
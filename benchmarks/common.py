@@ -0,0 +1,114 @@
+"""
+Shared helpers for the benchmark suite: throwaway databases, percentile
+summaries, JSON result files and regression checks against a baseline.
+"""
+
+import json
+import logging
+import math
+import os
+import platform
+import tempfile
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+def use_temp_database(prefix: str = "knowdex-bench-") -> str:
+    """
+    Point DATABASE_URL, the disk cache and the past-research index at a fresh
+    directory; call before importing backend modules
+    """
+    workdir = tempfile.mkdtemp(prefix=prefix)
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["CACHE_DISK_PATH"] = os.path.join(workdir, "cache.db")
+    # The index records a watermark of the database it was built from; the app's own must not see it
+    os.environ["KNOWLEDGE_INDEX_DIR"] = os.path.join(workdir, "knowledge_index")
+    return workdir
+
+
+def quiet_logs():
+    """Per-span JSON logs would dominate the benchmark's own output"""
+    logging.getLogger("knowdex").setLevel(logging.WARNING)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0..100)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(q / 100 * len(ordered))) - 1]
+
+
+def latency_summary(seconds: List[float], prefix: str = "") -> Dict[str, float]:
+    """p50/p90/p99/max in milliseconds"""
+    return {
+        f"{prefix}p50_ms": round(percentile(seconds, 50) * 1000, 3),
+        f"{prefix}p90_ms": round(percentile(seconds, 90) * 1000, 3),
+        f"{prefix}p99_ms": round(percentile(seconds, 99) * 1000, 3),
+        f"{prefix}max_ms": round(max(seconds) * 1000, 3) if seconds else 0.0,
+    }
+
+
+def print_result(name: str, metrics: Dict[str, float]):
+    shown = "  ".join(f"{key}={value}" for key, value in metrics.items())
+    print(f"{name:<42} {shown}")
+
+
+# ==================== RESULT FILES ====================
+
+def write_results(path: str, results: Dict[str, Dict[str, float]], config: Optional[dict] = None):
+    payload = {
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config or {},
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, sort_keys=True)
+
+
+def load_results(path: str) -> Dict[str, Dict[str, float]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["results"]
+
+
+def higher_is_better(metric: str) -> bool:
+    return metric.endswith("_per_s") or metric.startswith("ok")
+
+
+def compare(current: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float = 0.2) -> List[dict]:
+    """
+    Every metric that got worse than the baseline by more than `threshold`
+    (0.2 = 20%). Latencies, errors and memory should go down, throughputs up.
+    Tiny absolute values (under a millisecond, zero errors) are not flagged.
+    """
+    regressions = []
+    for name, metrics in current.items():
+        for metric, value in metrics.items():
+            before = baseline.get(name, {}).get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(before, (int, float)):
+                continue
+            if higher_is_better(metric):
+                worse = before > 0 and value < before * (1 - threshold)
+            elif metric.startswith("errors"):
+                worse = value > before
+            else:
+                worse = value > before * (1 + threshold) and value - before >= 1.0
+            if worse:
+                change = (value - before) / before * 100 if before else float("inf")
+                regressions.append({"benchmark": name, "metric": metric, "baseline": before, "current": value, "change_pct": round(change, 1)})
+    return regressions
+
+
+def report_comparison(current: Dict[str, Dict[str, float]], baseline_path: str, threshold: float) -> bool:
+    """Print regressions against the baseline file; True when there are none"""
+    regressions = compare(current, load_results(baseline_path), threshold)
+    if not regressions:
+        print(f"\nNo regressions against {baseline_path} (threshold {threshold:.0%})")
+        return True
+    print(f"\n{len(regressions)} regression(s) against {baseline_path} (threshold {threshold:.0%}):")
+    for item in regressions:
+        print(f"  {item['benchmark']:<40} {item['metric']:<18} {item['baseline']} -> {item['current']} ({item['change_pct']:+}%)")
+    return False
@@ -0,0 +1,357 @@
+"""
+Local stand-ins for the OpenAI chat completions API and the Brave web search
+API, for load tests that must not hit (or pay for) the real services.
+
+Only the subset KNOWDEX uses is implemented:
+
+    POST /v1/chat/completions   tool calls (brave_search) and plain answers,
+                                streaming (SSE, with include_usage) or not,
+                                with prompt caching reported in usage
+    GET  /res/v1/web/search     Brave web results
+
+Prompt caching is approximated per message: a request whose tools and
+leading messages match an earlier prompt of at least 1024 tokens reports
+those messages' tokens (in 128-token steps) as
+usage.prompt_tokens_details.cached_tokens, like the real API.
+
+Each upstream has its own latency distribution, error rate and rate limit;
+rate-limited requests get a 429 with Retry-After like the real APIs.
+
+Run with:
+    python -m benchmarks.stubs --port 9100 --openai-latency lognormal:800:0.5 --brave-latency normal:300:80
+
+and point KNOWDEX at it:
+    OPENAI_BASE_URL=http://localhost:9100/v1 BRAVE_BASE_URL=http://localhost:9100
+
+Latency specs (milliseconds): "fixed:MS", "uniform:LOW:HIGH",
+"normal:MEAN:STDDEV" or "lognormal:MEDIAN:SIGMA". --model-latency gives a
+model its own distribution, for comparing models per stage
+(benchmarks/bench_models.py).
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class Latency:
+    """A latency distribution in milliseconds, parsed from "kind:a:b" specs"""
+    kind: str = "fixed"
+    a: float = 0.0
+    b: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "Latency":
+        kind, *values = spec.split(":")
+        values = [float(v) for v in values] + [0.0, 0.0]
+        if kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution {kind!r}")
+        return cls(kind, values[0], values[1])
+
+    def sample(self, rng: random.Random) -> float:
+        """One delay in seconds"""
+        if self.kind == "uniform":
+            value = rng.uniform(self.a, self.b)
+        elif self.kind == "normal":
+            value = rng.gauss(self.a, self.b)
+        elif self.kind == "lognormal":
+            value = self.a * math.exp(rng.gauss(0, self.b)) if self.a > 0 else 0.0
+        else:
+            value = self.a
+        return max(0.0, value) / 1000
+
+
+class RateLimiter:
+    """Token bucket; rate <= 0 means unlimited"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+@dataclass
+class UpstreamProfile:
+    latency: Latency = field(default_factory=Latency)
+    error_rate: float = 0.0
+    rate_limit: float = 0.0
+    limiter: RateLimiter = None
+
+    def __post_init__(self):
+        self.limiter = RateLimiter(self.rate_limit)
+
+
+@dataclass
+class StubConfig:
+    openai: UpstreamProfile = field(default_factory=UpstreamProfile)
+    brave: UpstreamProfile = field(default_factory=UpstreamProfile)
+    token_ms: float = 0.0        # delay between streamed tokens
+    answer_words: int = 120
+    results: int = 5
+    syndicated: int = 0          # results after the first that repeat its story (wire copy), for dedup tests
+    prompt_cache: bool = True    # report cached prompt tokens for repeated prefixes
+    model_latency: Dict[str, Latency] = field(default_factory=dict)    # per model, instead of openai.latency
+    seed: Optional[int] = None
+
+
+def _tokens(text: str) -> int:
+    """Rough token count (about four characters per token), enough for accounting tests"""
+    return max(1, len(text) // 4)
+
+
+class PromptCache:
+    """Prefixes (tools, then whole messages) of earlier prompts that were long enough to be cached"""
+
+    MIN_TOKENS = 1024
+    STEP = 128
+
+    def __init__(self):
+        self.prefixes = set()
+        self._lock = threading.Lock()
+
+    def lookup(self, tools, messages: List[dict]) -> int:
+        """Cached tokens of this prompt; remembers its prefixes when it is long enough"""
+        digest = hashlib.sha256(json.dumps(tools, sort_keys=True).encode("utf-8"))
+        prefixes = []
+        tokens = 0
+        for message in messages:
+            digest.update(json.dumps(message, sort_keys=True).encode("utf-8"))
+            tokens += _tokens(str(message.get("content") or ""))
+            prefixes.append((digest.copy().hexdigest(), tokens))
+        with self._lock:
+            cached = max((count for key, count in prefixes if key in self.prefixes), default=0)
+            if tokens >= self.MIN_TOKENS:
+                self.prefixes.update(key for key, _ in prefixes)
+        cached -= cached % self.STEP
+        return cached if cached >= self.MIN_TOKENS else 0
+
+
+def _user_question(messages: List[dict]) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            return str(message.get("content") or "")
+    return ""
+
+
+def _answer_text(question: str, words: int, sources: int) -> str:
+    filler = ("Stub answer about " + question.strip().rstrip("?") + ".").split()
+    body = [filler[i % len(filler)] for i in range(words)]
+    citations = " ".join(f"[{n}]" for n in range(1, sources + 1))
+    return " ".join(body) + (f" {citations}" if citations else "")
+
+
+SNIPPET_WORDS = (
+    "startup funding round investors market growth policy regulators launch expansion revenue users "
+    "government report analysts quarter partnership acquisition valuation lenders payments mobile data "
+    "energy health education agriculture logistics infrastructure talent hiring exports currency inflation"
+).split()
+
+
+def _snippet(q: str, n: int, words: int = 30) -> str:
+    """A distinct, repeatable description per query and result"""
+    pick = random.Random(uuid.uuid5(uuid.NAMESPACE_URL, f"{q}/{n}").int)
+    return f"Result {n} about {q[:120]}: " + " ".join(pick.choice(SNIPPET_WORDS) for _ in range(words)) + "."
+
+
+def parse_model_latency(specs: List[str]) -> Dict[str, Latency]:
+    """["gpt-4.1-nano=fixed:150", ...] -> {model: Latency}"""
+    latencies = {}
+    for spec in specs:
+        model, _, latency = spec.partition("=")
+        latencies[model] = Latency.parse(latency)
+    return latencies
+
+
+def create_app(config: StubConfig) -> FastAPI:
+    rng = random.Random(config.seed)
+    app = FastAPI(title="KNOWDEX upstream stubs")
+    app.state.requests = {"openai": 0, "brave": 0, "errors": 0, "rate_limited": 0}
+    prompt_cache = PromptCache()
+
+    async def gate(name: str, profile: UpstreamProfile, latency: Optional[Latency] = None) -> Optional[JSONResponse]:
+        """Apply latency, rate limit and injected errors; returns an error response or None"""
+        app.state.requests[name] += 1
+        await asyncio.sleep((latency or profile.latency).sample(rng))
+        if not profile.limiter.allow():
+            app.state.requests["rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                status_code=429,
+                headers={"Retry-After": "1"},
+            )
+        if rng.random() < profile.error_rate:
+            app.state.requests["errors"] += 1
+            return JSONResponse({"error": {"message": "Injected upstream error", "type": "server_error"}}, status_code=500)
+        return None
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "gpt-4o-mini")
+        error = await gate("openai", config.openai, config.model_latency.get(model))
+        if error:
+            return error
+        messages = body.get("messages", [])
+        question = _user_question(messages)
+        prompt_tokens = sum(_tokens(str(m.get("content") or "")) for m in messages)
+        tool_results = sum(1 for m in messages if m.get("role") == "tool")
+        cached_tokens = prompt_cache.lookup(body.get("tools"), messages) if config.prompt_cache else 0
+        wants_tool = bool(body.get("tools")) and body.get("tool_choice") != "none" and not tool_results and any(
+            tool.get("function", {}).get("name") == "brave_search" for tool in body["tools"]
+        )
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        if wants_tool:
+            tool_call = {
+                "id": f"call_{uuid.uuid4().hex[:24]}",
+                "type": "function",
+                "function": {"name": "brave_search", "arguments": json.dumps({"query": question[:200]})},
+            }
+            message = {"role": "assistant", "content": None, "tool_calls": [tool_call]}
+            finish_reason = "tool_calls"
+            completion = tool_call["function"]["arguments"]
+        else:
+            message = {"role": "assistant", "content": _answer_text(question, config.answer_words, min(tool_results * 3, 3))}
+            finish_reason = "stop"
+            completion = message["content"]
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": _tokens(completion),
+            "total_tokens": prompt_tokens + _tokens(completion),
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        }
+
+        if not body.get("stream"):
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": usage,
+            }
+
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+        def frame(delta: dict, finish: Optional[str] = None, with_usage: bool = False) -> str:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [] if with_usage else [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+            if with_usage:
+                chunk["usage"] = usage
+            return f"data: {json.dumps(chunk)}\n\n"
+
+        async def stream():
+            yield frame({"role": "assistant", "content": "" if not wants_tool else None})
+            if wants_tool:
+                call = message["tool_calls"][0]
+                yield frame({"tool_calls": [{
+                    "index": 0, "id": call["id"], "type": "function",
+                    "function": {"name": call["function"]["name"], "arguments": ""},
+                }]})
+                yield frame({"tool_calls": [{"index": 0, "function": {"arguments": call["function"]["arguments"]}}]})
+            else:
+                words = message["content"].split(" ")
+                for i, word in enumerate(words):
+                    if config.token_ms:
+                        await asyncio.sleep(config.token_ms / 1000)
+                    yield frame({"content": word if i == 0 else " " + word})
+            yield frame({}, finish_reason)
+            if include_usage:
+                yield frame({}, with_usage=True)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.get("/res/v1/web/search")
+    async def web_search(q: str = "", count: int = 10):
+        error = await gate("brave", config.brave)
+        if error:
+            return error
+        results = [
+            {
+                "title": f"{q[:60]} - result {n}",
+                "url": f"https://example.com/{uuid.uuid5(uuid.NAMESPACE_URL, q).hex[:12]}/{n}",
+                # The first `syndicated` results after the first carry its story, as outlets do with wire copy
+                "description": _snippet(q, 1 if 1 < n <= config.syndicated + 1 else n),
+            }
+            for n in range(1, min(count, config.results) + 1)
+        ]
+        return {"type": "search", "query": {"original": q}, "web": {"type": "search", "results": results}}
+
+    @app.get("/stats")
+    async def stats():
+        return app.state.requests
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--openai-latency", default="lognormal:600:0.4")
+    parser.add_argument("--brave-latency", default="normal:250:60")
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--brave-error-rate", type=float, default=0.0)
+    parser.add_argument("--openai-rate-limit", type=float, default=0.0, help="requests/second, 0 = unlimited")
+    parser.add_argument("--brave-rate-limit", type=float, default=0.0, help="requests/second, 0 = unlimited")
+    parser.add_argument("--token-ms", type=float, default=15.0, help="delay between streamed tokens")
+    parser.add_argument("--answer-words", type=int, default=120)
+    parser.add_argument("--syndicated", type=int, default=0, help="search results repeating the first one's story")
+    parser.add_argument("--no-prompt-cache", action="store_true", help="never report cached prompt tokens")
+    parser.add_argument(
+        "--model-latency", action="append", default=[], metavar="MODEL=SPEC",
+        help="latency of one model instead of --openai-latency, e.g. gpt-4.1-nano=lognormal:250:0.4 (repeatable)",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = StubConfig(
+        openai=UpstreamProfile(Latency.parse(args.openai_latency), args.openai_error_rate, args.openai_rate_limit),
+        brave=UpstreamProfile(Latency.parse(args.brave_latency), args.brave_error_rate, args.brave_rate_limit),
+        token_ms=args.token_ms,
+        answer_words=args.answer_words,
+        syndicated=args.syndicated,
+        prompt_cache=not args.no_prompt_cache,
+        model_latency=parse_model_latency(args.model_latency),
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+The benchmark suite: API load test plus data layer micro-benchmarks, fully
+offline (upstreams are the local stubs), results written to one JSON file.
+
+Run with:
+    python -m benchmarks.suite --output bench_results.json
+    python -m benchmarks.suite --baseline benchmarks/baseline.json --threshold 0.25
+
+With --baseline the run exits with status 1 when any metric regressed by
+more than the threshold (latencies up, throughputs down, new errors).
+"""
+
+import argparse
+import multiprocessing
+import sys
+
+from benchmarks import bench_api, bench_data_layer
+from benchmarks.common import report_comparison, write_results
+
+
+def run_isolated(run, args) -> dict:
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(run, (args,))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", choices=["api", "data_layer"], default=None)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", default=None, help="results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    bench_data_layer.add_arguments(parser)
+    bench_api.add_arguments(parser)
+    args = parser.parse_args()
+
+    results = {}
+    # Each benchmark runs in a fresh process: settings and the database engine are created on first
+    # import and read the environment only then, so the API run must not inherit the data layer's
+    if args.only in (None, "data_layer"):
+        print("== Data layer ==")
+        results.update(run_isolated(bench_data_layer.run, args))
+    if args.only in (None, "api"):
+        print("\n== API ==")
+        results.update(run_isolated(bench_api.run, args))
+
+    write_results(args.output, results, config={key: value for key, value in vars(args).items() if key not in ("output", "baseline")})
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline and not report_comparison(results, args.baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,22 +4,64 @@ This provides a beautiful chat interface with persistent chat history.
 """
 
 import chainlit as cl
+import chainlit.data as cl_data
+from chainlit.server import app as chainlit_server
 from chainlit.types import ThreadDict
-from agent.agent import run_research
-from backend.database import engine
-from backend.models import Research, User
-from sqlmodel import Session, select
-import json
+from contextlib import asynccontextmanager
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from agent.config import settings
+from backend.identity import get_or_create_user
+from backend.profiling import start_loop_monitor
+from backend.refresh_ahead import start_refresh_ahead
+from backend.retention import start_retention_job
+from backend.storage import save_research as store_research
+from backend.warmup import readiness, start_warmup
+from agent.scheduler import set_requester
+from agent.utils.accounting import track_usage
+from agent.utils.telemetry import log_event, record_stage, set_request_id
 from datetime import datetime
 import uuid
 from typing import Optional, Dict, List
 import hashlib
+import time
 
 # Import data layer
 from chainlit_data_layer import cl_data_layer
 
-# Register data layer with Chainlit
-cl.data_layer = cl_data_layer
+# Register data layer with Chainlit: get_data_layer() reads chainlit.data._data_layer
+# (a cl.data_layer attribute is never read, so nothing would be persisted)
+cl_data._data_layer = cl_data_layer
+
+
+# ==================== STARTUP ====================
+
+def start_background_jobs():
+    """Warm-up and background jobs, once per process (each start_* is idempotent)"""
+    start_warmup()
+    start_retention_job()
+    start_loop_monitor()
+    start_refresh_ahead()
+
+
+async def ready():
+    """Readiness for health checks: 200 once the startup warm-up has run, 503 before"""
+    return JSONResponse(readiness.report(), status_code=200 if readiness.ready else 503)
+
+
+# Chainlit has no startup hook: wrap its server lifespan so warm-up starts as soon as the
+# process listens, and put /ready ahead of the catch-all route that serves the frontend
+if not any(getattr(route, "path", None) == "/ready" for route in chainlit_server.router.routes):
+    chainlit_lifespan = chainlit_server.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan_with_warmup(app):
+        start_background_jobs()
+        async with chainlit_lifespan(app) as state:
+            yield state
+
+    chainlit_server.router.lifespan_context = lifespan_with_warmup
+    chainlit_server.router.routes.insert(0, APIRoute("/ready", ready, methods=["GET"]))
 
 
 # ==================== USER MANAGEMENT ====================
@@ -40,19 +82,8 @@ def get_user_from_header(headers: Dict) -> cl.User:
     else:
         user_name = headers.get("X-User-Name", user_email.split("@")[0])
     
-    # Get or create user in database
-    with Session(engine) as session:
-        statement = select(User).where(User.email == user_email)
-        user = session.exec(statement).first()
-        
-        if not user:
-            user = User(
-                email=user_email,
-                name=user_name
-            )
-            session.add(user)
-            session.commit()
-            session.refresh(user)
+    # Get or create user (cached, so repeat visits skip the database)
+    user = get_or_create_user(user_email, user_name)
     
     # Return Chainlit User object
     return cl.User(
@@ -81,6 +112,9 @@ def header_auth_callback(headers: Dict) -> Optional[cl.User]:
 async def on_chat_start():
     """Called when a new chat session starts"""
     
+    # Normally already started with the server; a no-op then
+    start_background_jobs()
+    
     # Get current user
     user = cl.user_session.get("user")
     
@@ -126,6 +160,11 @@ Try asking me about current events, technology trends, or anything you're curiou
 @cl.on_message
 async def on_message(message: cl.Message):
     """Handle incoming messages and stream responses"""
+    # Imported on first use (the warm-up imports them ahead of the first message), not at startup
+    from agent.agent import run_research
+    from agent.knowledge.past_research import set_research_user
+    from agent.utils.streaming import coalesce_stream
+    from backend.conversation import load_conversation, schedule_compaction
     
     user = cl.user_session.get("user")
     user_metadata = user.metadata if user else {}
@@ -138,74 +177,74 @@ async def on_message(message: cl.Message):
     user_id = uuid.UUID(user_id_str)
     user_question = message.content
     
+    # Tag every span of this answer (agent, storage) with the message id
+    set_request_id(message.id)
+    started = time.perf_counter()
+    # Token and cost accounting, grouped by the chat profile ("Research Mode" -> "research")
+    profile = cl.user_session.get("chat_profile") or "Research Mode"
+    usage = track_usage(profile.split()[0].lower())
+    # Upstream calls queue fairly per user and thread (agent/scheduler.py); the profile's mode sets the class
+    set_requester(user.identifier, message.thread_id)
+    # past_research only finds this user's own earlier answers
+    set_research_user(user_id)
+    
+    # Earlier turns of this thread: a rolling summary plus the newest messages, within a token budget
+    history = None
+    if settings.MEMORY_ENABLED and message.thread_id:
+        history = load_conversation(message.thread_id, exclude_step_id=message.id).get_openai_format()
+    
     # Create a message object that we'll stream tokens into
     response_msg = cl.Message(content="")
     
-    # Variables to collect the full response
+    # Only the final answer and its sources are stored, not the progress lines
     full_answer = ""
     sources_list = []
-    in_sources_section = False
-    current_source_title = ""
     
     try:
         # Show thinking indicator
         await response_msg.stream_token("🔍 ")
         
-        # Stream the research response
-        async for chunk in run_research(user_question):
+        # Stream the research response, coalescing tokens into fewer websocket frames
+        first_byte = True
+        async for chunk in coalesce_stream(run_research(user_question, history=history), surface="chainlit"):
             # Stream the chunk to the UI
             await response_msg.stream_token(chunk)
+            if first_byte:
+                record_stage("ttfb", time.perf_counter() - started)
+                first_byte = False
             
             # Collect the answer for database storage
-            full_answer += chunk
-            
-            # Parse sources from the response
-            if "Sources:" in chunk or "sources:" in chunk.lower():
-                in_sources_section = True
-            
-            if in_sources_section:
-                lines = chunk.strip().split('\n')
-                for line in lines:
-                    # Look for source titles (lines starting with [1], [2], etc.)
-                    if line.strip() and line.strip()[0] == '[' and ']' in line:
-                        current_source_title = line.strip()
-                    # Look for URLs
-                    elif line.strip().startswith('http'):
-                        if current_source_title:
-                            sources_list.append({
-                                "title": current_source_title,
-                                "url": line.strip()
-                            })
-                            current_source_title = ""
+            if chunk.kind == "answer":
+                full_answer += chunk
+            elif chunk.kind == "sources":
+                sources_list.extend(chunk.sources)
         
-        # Send the final message
+        # Send the final message; the bare answer goes along for the conversation memory
+        response_msg.metadata = {"answer": full_answer}
         await response_msg.send()
+        record_stage("request", time.perf_counter() - started, answer_chars=len(full_answer))
         
         # Save to database
         await save_research(
             question=user_question,
             answer=full_answer,
             sources=sources_list,
-            user_id=user_id
+            user_id=user_id,
+            usage=usage
         )
         
+        # Fold messages that slid out of the window into the thread summary, in the background
+        schedule_compaction(message.thread_id)
+        
     except Exception as e:
         error_msg = f"\n\n❌ **Error:** {str(e)}\n\nPlease try again or rephrase your question."
         await response_msg.stream_token(error_msg)
         await response_msg.send()
 
 
-async def save_research(question: str, answer: str, sources: list, user_id: uuid.UUID):
-    """Save the research to the database"""
-    with Session(engine) as session:
-        research = Research(
-            user_id=user_id,
-            question=question,
-            answer=answer,
-            sources=json.dumps(sources)
-        )
-        session.add(research)
-        session.commit()
+async def save_research(question: str, answer: str, sources: list, user_id: uuid.UUID, usage=None):
+    """Save the research (and its token/cost usage) to the database"""
+    store_research(user_id=user_id, question=question, answer=answer, sources=sources, usage=usage)
 
 
 # ==================== CHAT HISTORY CALLBACKS ====================
@@ -235,20 +274,21 @@ async def on_chat_resume(thread: ThreadDict):
     if steps:
         await cl.Message(
             content=f"✅ Restored {len(steps)} messages. Continue the conversation below!",
-            author="System"
+            author="System",
+            actions=older_steps_actions(steps[0]["id"]) if thread.get("hasOlderSteps") else []
         ).send()
 
 
 @cl.on_stop
 def on_stop():
     """Called when user stops a running task"""
-    print("User stopped the task")
+    log_event("task_stopped")
 
 
 @cl.on_chat_end
 def on_chat_end():
     """Called when chat session ends"""
-    print("Chat session ended")
+    log_event("chat_ended")
 
 
 # ==================== SETTINGS ====================
@@ -274,9 +314,40 @@ async def chat_profile():
 
 # ==================== ACTIONS ====================
 
+# Older messages of a resumed thread, shown per click (get_thread only returns the newest window)
+OLDER_STEPS_PAGE = 50
+
+
+def older_steps_actions(cursor: str) -> list:
+    return [cl.Action(name="load_older_steps", value=cursor, label="Load older messages")]
+
+
+@cl.action_callback("load_older_steps")
+async def on_action_load_older_steps(action: cl.Action):
+    """Show the page of messages before `action.value` (the oldest step shown so far) of this session's thread"""
+    thread_id = cl.context.session.thread_id
+    page = await cl_data_layer.get_thread_steps(thread_id, before=action.value, limit=OLDER_STEPS_PAGE)
+    lines = []
+    for step in page["steps"]:
+        if step["type"] not in ("user_message", "assistant_message") or not step["output"]:
+            continue
+        speaker = "You" if step["type"] == "user_message" else "KNOWDEX"
+        lines.append(f"**{speaker}** ({step['createdAt'][:16].replace('T', ' ')}):\n{step['output']}")
+    await action.remove()
+    await cl.Message(
+        content="# Earlier in this conversation\n\n" + ("\n\n---\n\n".join(lines) or "_No older messages._"),
+        author="System",
+        actions=older_steps_actions(page["cursor"]) if page["hasMore"] and page["cursor"] else []
+    ).send()
+
+
 @cl.action_callback("view_history")
 async def on_action_view_history(action: cl.Action):
     """Show conversation history for the current user"""
+    from sqlmodel import Session, select
+    from backend.database import engine
+    from backend.models import Research
+    
     user = cl.user_session.get("user")
     
     if not user:
@@ -309,4 +380,4 @@ async def on_action_view_history(action: cl.Action):
 @cl.on_settings_update
 async def setup_agent(settings):
     """Called when user updates settings"""
-    print("Settings updated:", settings)
+    log_event("settings_updated", settings=settings)
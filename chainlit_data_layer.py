@@ -8,118 +8,85 @@ from chainlit.element import Element
 from chainlit.step import StepDict
 from chainlit.types import Pagination, ThreadDict, ThreadFilter
 from typing import Dict, List, Optional
+from sqlalchemy import tuple_
+from sqlalchemy.orm import load_only
 from sqlmodel import Session, select, col
 from backend.database import engine
-from backend.models import User
-import json
-from datetime import datetime
+from backend.fts import search_threads
+from backend.identity import get_or_create_user, get_user_record
+from backend.migrations import run_migrations
+from backend.retention import delete_threads, rehydrate_thread
+from agent.utils.jsoncodec import dumps, loads
+from agent.utils.telemetry import log_event, timed
+# Chat history models live with the other tables; re-exported here for existing imports
+from backend.models import User, Thread, Step, ElementModel
 import uuid
 
 
-# ==================== MODELS FOR CHAT HISTORY ====================
+# Tables and full-text indexes (a single version check once the schema is current)
+run_migrations()
 
-from sqlmodel import SQLModel, Field
-from datetime import datetime
-
-
-class Thread(SQLModel, table=True):
-    """Represents a conversation thread"""
-    __tablename__ = "threads"
-    
-    id: str = Field(primary_key=True)
-    user_id: str = Field(index=True)
-    name: Optional[str] = Field(default=None)
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    thread_metadata: str = Field(default="{}")  # JSON string (renamed from metadata to avoid conflict)
-    tags: Optional[str] = Field(default=None)  # JSON string of tags
-
-
-class Step(SQLModel, table=True):
-    """Represents a message/step in a conversation"""
-    __tablename__ = "steps"
-    
-    id: str = Field(primary_key=True)
-    thread_id: str = Field(foreign_key="threads.id", index=True)
-    parent_id: Optional[str] = Field(default=None)
-    name: Optional[str] = Field(default=None)
-    type: str = Field(default="user_message")
-    input: Optional[str] = Field(default=None)
-    output: Optional[str] = Field(default=None)
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    start_time: Optional[str] = Field(default=None)
-    end_time: Optional[str] = Field(default=None)
-    generation: Optional[str] = Field(default=None)  # JSON string
-    step_metadata: str = Field(default="{}")  # JSON string (renamed from metadata to avoid conflict)
 
+# ==================== DATA LAYER IMPLEMENTATION ====================
 
-class ElementModel(SQLModel, table=True):
-    """Represents file/element attachments"""
-    __tablename__ = "elements"
-    
-    id: str = Field(primary_key=True)
-    thread_id: str = Field(foreign_key="threads.id", index=True)
-    type: str
-    url: Optional[str] = Field(default=None)
-    name: str
-    display: str = Field(default="inline")
-    size: Optional[str] = Field(default=None)
-    language: Optional[str] = Field(default=None)
-    for_id: Optional[str] = Field(default=None)
-    mime: Optional[str] = Field(default=None)
+# Columns needed to render a step; `generation` is never sent back to the UI
+STEP_COLUMNS = (
+    Step.id, Step.thread_id, Step.parent_id, Step.name, Step.type,
+    Step.input, Step.output, Step.created_at, Step.step_metadata,
+)
 
 
-# Create tables
-with engine.begin() as conn:
-    SQLModel.metadata.create_all(bind=conn)
+def _decode_metadata(raw: Optional[str]) -> Dict:
+    """Decode a stored metadata JSON string, skipping the parser for the empty default"""
+    if not raw or raw == "{}":
+        return {}
+    return loads(raw)
 
 
-# ==================== DATA LAYER IMPLEMENTATION ====================
-
 class KnowdexDataLayer(BaseDataLayer):
     """
     Custom data layer for KNOWDEX using SQLite.
     Implements Chainlit's data persistence interface.
     """
     
+    def __init__(self, step_window: int = 200):
+        # How many of the most recent steps get_thread returns; older ones are paged in
+        self.step_window = step_window
+    
     async def get_user(self, identifier: str) -> Optional[Dict]:
-        """Get user by identifier (email)"""
-        with Session(engine) as session:
-            statement = select(User).where(User.email == identifier)
-            user = session.exec(statement).first()
-            
-            if user:
-                return {
-                    "id": str(user.id),
-                    "identifier": user.email,
-                    "metadata": {
-                        "name": user.name,
-                        "email": user.email,
-                        "created_at": user.created_at.isoformat()
-                    }
+        """Get user by identifier (email), served from the identity cache when warm"""
+        user = get_user_record(identifier)
+        
+        if user:
+            return {
+                "id": str(user.id),
+                "identifier": user.email,
+                "metadata": {
+                    "name": user.name,
+                    "email": user.email,
+                    "created_at": user.created_at.isoformat()
                 }
+            }
         return None
     
     async def create_user(self, user: Dict) -> Optional[Dict]:
-        """Create a new user"""
-        with Session(engine) as session:
-            new_user = User(
-                email=user.get("identifier", "unknown@knowdex.local"),
-                name=user.get("metadata", {}).get("name", "Unknown User")
-            )
-            session.add(new_user)
-            session.commit()
-            session.refresh(new_user)
-            
-            return {
-                "id": str(new_user.id),
-                "identifier": new_user.email,
-                "metadata": {
-                    "name": new_user.name,
-                    "email": new_user.email
-                }
+        """Create a new user, or return the existing one for this identifier"""
+        new_user = get_or_create_user(
+            user.get("identifier", "unknown@knowdex.local"),
+            user.get("metadata", {}).get("name", "Unknown User")
+        )
+        
+        return {
+            "id": str(new_user.id),
+            "identifier": new_user.email,
+            "metadata": {
+                "name": new_user.name,
+                "email": new_user.email
             }
+        }
     
     @queue_until_user_message()
+    @timed("db.create_step", upstream="sqlite")
     async def create_step(self, step_dict: StepDict):
         """Create a new step (message) in the conversation"""
         with Session(engine) as session:
@@ -133,14 +100,20 @@ class KnowdexDataLayer(BaseDataLayer):
                 output=step_dict.get("output"),
                 start_time=step_dict.get("start"),
                 end_time=step_dict.get("end"),
-                generation=json.dumps(step_dict.get("generation")) if step_dict.get("generation") else None,
-                step_metadata=json.dumps(step_dict.get("metadata", {}))
+                generation=dumps(step_dict.get("generation")) if step_dict.get("generation") else None,
+                step_metadata=dumps(step_dict.get("metadata", {}))
             )
             session.add(step)
             session.commit()
     
+    @timed("db.get_thread", upstream="sqlite")
     async def get_thread(self, thread_id: str) -> Optional[ThreadDict]:
-        """Get a thread by ID"""
+        """
+        Get a thread by ID with its most recent `step_window` steps.
+        Older steps are fetched on demand with get_thread_steps(), so resuming a
+        long conversation costs the same as resuming a short one. Step metadata is
+        only decoded for the steps that are actually returned.
+        """
         with Session(engine) as session:
             # Get thread
             thread = session.exec(
@@ -150,35 +123,88 @@ class KnowdexDataLayer(BaseDataLayer):
             if not thread:
                 return None
             
-            # Get steps
-            steps = session.exec(
-                select(Step).where(Step.thread_id == thread_id).order_by(Step.created_at)
-            ).all()
+            steps, has_more = self._load_steps(session, thread_id, None, self.step_window)
+            
+            # The oldest part of the history may have been archived by the retention job
+            if not has_more and rehydrate_thread(thread_id):
+                steps, has_more = self._load_steps(session, thread_id, None, self.step_window)
             
             # Format thread
             return {
                 "id": thread.id,
                 "userId": thread.user_id,
+                # Chainlit only resumes a thread whose userIdentifier is the current user's
+                "userIdentifier": self._user_identifier(session, thread.user_id),
                 "name": thread.name,
                 "createdAt": thread.created_at.isoformat(),
-                "metadata": json.loads(thread.thread_metadata) if thread.thread_metadata else {},
-                "steps": [
-                    {
-                        "id": step.id,
-                        "threadId": step.thread_id,
-                        "parentId": step.parent_id,
-                        "name": step.name,
-                        "type": step.type,
-                        "input": step.input,
-                        "output": step.output,
-                        "createdAt": step.created_at.isoformat(),
-                        "metadata": json.loads(step.step_metadata) if step.step_metadata else {}
-                    }
-                    for step in steps
-                ]
+                "metadata": _decode_metadata(thread.thread_metadata),
+                "steps": [self._format_step(step) for step in steps],
+                "hasOlderSteps": has_more
             }
     
+    @timed("db.get_thread_steps", upstream="sqlite")
+    async def get_thread_steps(
+        self,
+        thread_id: str,
+        before: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> Dict:
+        """
+        Page backwards through a thread's history.
+        `before` is the id of the oldest step already loaded (None starts from the
+        newest step). Steps come back oldest first, like get_thread.
+        """
+        with Session(engine) as session:
+            steps, has_more = self._load_steps(session, thread_id, before, limit or self.step_window)
+            
+            return {
+                "steps": [self._format_step(step) for step in steps],
+                "hasMore": has_more,
+                "cursor": steps[0].id if steps else None
+            }
+    
+    def _load_steps(self, session: Session, thread_id: str, before: Optional[str], limit: int):
+        """Keyset-paginated newest-first read on (thread_id, created_at), returned oldest first"""
+        query = (
+            select(Step)
+            .options(load_only(*STEP_COLUMNS))
+            .where(Step.thread_id == thread_id)
+        )
+        
+        if before:
+            anchor = session.exec(
+                select(Step.created_at).where(Step.id == before)
+            ).first()
+            if anchor is None:
+                return [], False
+            query = query.where(tuple_(Step.created_at, Step.id) < tuple_(anchor, before))
+        
+        # Fetch one extra row to know whether an older page exists
+        steps = session.exec(
+            query.order_by(Step.created_at.desc(), Step.id.desc()).limit(limit + 1)
+        ).all()
+        
+        has_more = len(steps) > limit
+        steps = list(steps[:limit])
+        steps.reverse()
+        return steps, has_more
+    
+    def _format_step(self, step: Step) -> Dict:
+        """Format a step row as a Chainlit StepDict"""
+        return {
+            "id": step.id,
+            "threadId": step.thread_id,
+            "parentId": step.parent_id,
+            "name": step.name,
+            "type": step.type,
+            "input": step.input,
+            "output": step.output,
+            "createdAt": step.created_at.isoformat(),
+            "metadata": _decode_metadata(step.step_metadata)
+        }
+    
     @queue_until_user_message()
+    @timed("db.update_step", upstream="sqlite")
     async def update_step(self, step_dict: StepDict):
         """Update an existing step"""
         with Session(engine) as session:
@@ -190,7 +216,7 @@ class KnowdexDataLayer(BaseDataLayer):
                 if step_dict.get("output"):
                     step.output = step_dict.get("output")
                 if step_dict.get("metadata"):
-                    step.step_metadata = json.dumps(step_dict.get("metadata"))
+                    step.step_metadata = dumps(step_dict.get("metadata"))
                 if step_dict.get("end"):
                     step.end_time = step_dict.get("end")
                 
@@ -198,6 +224,7 @@ class KnowdexDataLayer(BaseDataLayer):
                 session.commit()
     
     @queue_until_user_message()
+    @timed("db.delete_step", upstream="sqlite")
     async def delete_step(self, step_id: str):
         """Delete a step"""
         with Session(engine) as session:
@@ -209,12 +236,16 @@ class KnowdexDataLayer(BaseDataLayer):
                 session.delete(step)
                 session.commit()
     
+    @timed("db.list_threads", upstream="sqlite")
     async def list_threads(
         self,
         pagination: Pagination,
         filters: ThreadFilter
     ) -> Dict:
         """List threads for a user with pagination"""
+        if filters.search:
+            return self._search_threads(pagination, filters)
+        
         with Session(engine) as session:
             # Build query
             query = select(Thread)
@@ -222,17 +253,9 @@ class KnowdexDataLayer(BaseDataLayer):
             if filters.userId:
                 query = query.where(Thread.user_id == filters.userId)
             
-            if filters.search:
-                query = query.where(Thread.name.contains(filters.search))
-            
             # Order by created date descending
             query = query.order_by(Thread.created_at.desc())
             
-            # Get total count
-            total_query = select(Thread)
-            if filters.userId:
-                total_query = total_query.where(Thread.user_id == filters.userId)
-            
             # Apply pagination
             offset = (pagination.first or 0)
             limit = 20  # Default limit
@@ -240,23 +263,7 @@ class KnowdexDataLayer(BaseDataLayer):
             threads = session.exec(query.offset(offset).limit(limit)).all()
             
             # Format threads
-            formatted_threads = []
-            for thread in threads:
-                # Get first step for preview
-                first_step = session.exec(
-                    select(Step)
-                    .where(Step.thread_id == thread.id)
-                    .order_by(Step.created_at)
-                    .limit(1)
-                ).first()
-                
-                formatted_threads.append({
-                    "id": thread.id,
-                    "userId": thread.user_id,
-                    "name": thread.name or (first_step.input[:50] + "..." if first_step and first_step.input else "New Conversation"),
-                    "createdAt": thread.created_at.isoformat(),
-                    "metadata": json.loads(thread.thread_metadata) if thread.thread_metadata else {}
-                })
+            formatted_threads = [self._format_thread_summary(session, thread) for thread in threads]
             
             return {
                 "data": formatted_threads,
@@ -267,6 +274,66 @@ class KnowdexDataLayer(BaseDataLayer):
                 }
             }
     
+    def _search_threads(self, pagination: Pagination, filters: ThreadFilter) -> Dict:
+        """
+        Thread filter backed by the steps FTS index: threads are ranked by their
+        best matching message (bm25) and the matching text is returned as a
+        highlighted snippet in the thread metadata.
+        """
+        offset = (pagination.first or 0)
+        limit = 20  # Default limit
+        
+        hits = search_threads(filters.userId, filters.search, limit=limit, offset=offset)
+        
+        with Session(engine) as session:
+            threads = {
+                thread.id: thread
+                for thread in session.exec(
+                    select(Thread).where(col(Thread.id).in_([hit["thread_id"] for hit in hits]))
+                ).all()
+            }
+            
+            formatted_threads = []
+            for hit in hits:
+                thread = threads.get(hit["thread_id"])
+                if not thread:
+                    continue
+                formatted = self._format_thread_summary(session, thread)
+                formatted["metadata"]["search_snippet"] = hit["snippet"]
+                formatted["metadata"]["search_score"] = hit["score"]
+                formatted_threads.append(formatted)
+        
+        return {
+            "data": formatted_threads,
+            "pageInfo": {
+                "hasNextPage": len(hits) == limit,
+                "startCursor": offset,
+                "endCursor": offset + len(hits)
+            }
+        }
+    
+    def _format_thread_summary(self, session: Session, thread: Thread) -> Dict:
+        """Format a thread for the sidebar, falling back to its first message as the name"""
+        name = thread.name
+        if not name:
+            # Get first step for preview
+            first_step = session.exec(
+                select(Step)
+                .where(Step.thread_id == thread.id)
+                .order_by(Step.created_at)
+                .limit(1)
+            ).first()
+            name = first_step.input[:50] + "..." if first_step and first_step.input else "New Conversation"
+        
+        return {
+            "id": thread.id,
+            "userId": thread.user_id,
+            "name": name,
+            "createdAt": thread.created_at.isoformat(),
+            "metadata": _decode_metadata(thread.thread_metadata)
+        }
+    
+    @timed("db.create_thread", upstream="sqlite")
     async def create_thread(
         self,
         thread_id: str,
@@ -281,68 +348,70 @@ class KnowdexDataLayer(BaseDataLayer):
                 id=thread_id,
                 user_id=user_id,
                 name=name,
-                thread_metadata=json.dumps(metadata or {}),
-                tags=json.dumps(tags or [])
+                thread_metadata=dumps(metadata or {}),
+                tags=dumps(tags or [])
             )
             session.add(thread)
             session.commit()
     
+    @timed("db.update_thread", upstream="sqlite")
     async def update_thread(
         self,
         thread_id: str,
         name: Optional[str] = None,
+        user_id: Optional[str] = None,
         metadata: Optional[Dict] = None,
         tags: Optional[List[str]] = None
     ):
-        """Update a thread"""
+        """Update a thread, creating it on first use (Chainlit persists a new thread through this call)"""
         with Session(engine) as session:
             thread = session.exec(
                 select(Thread).where(Thread.id == thread_id)
             ).first()
             
+            if not thread and user_id:
+                thread = Thread(id=thread_id, user_id=user_id)
+            
             if thread:
+                if user_id is not None and not thread.user_id:
+                    thread.user_id = user_id
                 if name is not None:
                     thread.name = name
                 if metadata is not None:
-                    thread.thread_metadata = json.dumps(metadata)
+                    thread.thread_metadata = dumps(metadata)
                 if tags is not None:
-                    thread.tags = json.dumps(tags)
+                    thread.tags = dumps(tags)
                 
                 session.add(thread)
                 session.commit()
     
+    @timed("db.delete_thread", upstream="sqlite")
     async def delete_thread(self, thread_id: str):
-        """Delete a thread and all its steps"""
+        """Delete a thread with its steps, elements and archived history"""
         with Session(engine) as session:
-            # Delete steps
-            steps = session.exec(
-                select(Step).where(Step.thread_id == thread_id)
-            ).all()
-            
-            for step in steps:
-                session.delete(step)
-            
-            # Delete thread
-            thread = session.exec(
-                select(Thread).where(Thread.id == thread_id)
-            ).first()
-            
-            if thread:
-                session.delete(thread)
-            
+            delete_threads(session, [thread_id])
             session.commit()
     
     # ==================== REQUIRED ABSTRACT METHODS ====================
     
     async def get_thread_author(self, thread_id: str) -> Optional[str]:
-        """Get the author (user_id) of a thread"""
+        """Get the author of a thread, as the identifier (email) Chainlit compares with the current user's"""
         with Session(engine) as session:
             thread = session.exec(
                 select(Thread).where(Thread.id == thread_id)
             ).first()
             
             if thread:
-                return thread.user_id
+                return self._user_identifier(session, thread.user_id)
+            return None
+    
+    def _user_identifier(self, session: Session, user_id: Optional[str]) -> Optional[str]:
+        """Email of a thread's user_id (stored as the user's UUID string)"""
+        if not user_id:
+            return None
+        try:
+            return session.exec(select(User.email).where(User.id == uuid.UUID(str(user_id)))).first()
+        except ValueError:
             return None
     
     async def create_element(self, element: "Element"):
@@ -407,12 +476,12 @@ class KnowdexDataLayer(BaseDataLayer):
         For now, we just log it - you can extend this to store in DB.
         """
         feedback_id = feedback.get("id", str(uuid.uuid4()))
-        print(f"Feedback received: {feedback}")
+        log_event("feedback_received", feedback_id=feedback_id, feedback=feedback)
         return feedback_id
     
     async def delete_feedback(self, feedback_id: str) -> bool:
         """Delete feedback by ID"""
-        print(f"Deleting feedback: {feedback_id}")
+        log_event("feedback_deleted", feedback_id=feedback_id)
         return True
     
     def build_debug_url(self) -> str: